@@ -0,0 +1,201 @@
+
+from __future__ import annotations
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from mmsr_alg.io import load_catalog
+from mmsr_alg.genre_index import genre_index_for
+from mmsr_alg.feature_store import DEFAULT_SOURCES, ids_fingerprint, attach_features
+from mmsr_alg.features import l2_normalize_, peak_rss_mb
+from mmsr_alg.retrieval.system import RetrievalSystem
+from mmsr_alg.retrieval.registry import ALGORITHMS, BATCH_ALGORITHMS
+from mmsr_alg.eval.batch_runner import evaluate_algorithms
+
+OUT = Path("outputs/bench")
+
+# lyrics BERT, MFCC bag-of-words, VGG19 fc7: the shapes of the real feature TSVs
+REAL_DIMS = {"X_lyrics": 768, "X_audio": 500, "X_video": 4096}
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _percentiles(seconds) -> dict:
+    p50, p95, p99 = np.percentile(np.asarray(seconds) * 1e3, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+def write_synthetic(data_dir: Path, n: int, dims: dict, n_genres: int, genre_skew: float, seed: int) -> None:
+    """
+    A retrieval data dir with n synthetic tracks: the metadata TSVs plus the
+    feature matrices written straight into the feature store (random unit
+    vectors, generated a block at a time). Genre sets are drawn per track like
+    the real ones: geometric sizes (mean ~6.7, at most 30) over a Zipf(`genre_skew`)
+    genre popularity, so most sets are distinct (~85%) and the genre index
+    costs what it would on real data.
+    """
+    rng = np.random.default_rng(seed)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    ids = [f"t{i:08d}" for i in range(n)]
+
+    pd.DataFrame({
+        "id": ids,
+        "artist": [f"artist {i % max(1, n // 10)}" for i in range(n)],
+        "song": [f"song {i}" for i in range(n)],
+        "album_name": [f"album {i % max(1, n // 4)}" for i in range(n)],
+    }).to_csv(data_dir / "id_information_mmsr.tsv", sep="\t", index=False)
+    pd.DataFrame({"id": ids, "url": [f"https://www.youtube.com/watch?v={i}" for i in ids]}).to_csv(
+        data_dir / "id_url_mmsr.tsv", sep="\t", index=False)
+    weights = 1.0 / np.arange(1, n_genres + 1) ** genre_skew
+    cdf = np.cumsum(weights / weights.sum())
+    sizes = np.minimum(rng.geometric(1 / 6.7, n), 30)
+    codes = np.minimum(np.searchsorted(cdf, rng.random(int(sizes.sum()))), n_genres - 1)
+    # repeated draws within a track collapse, as duplicate genres would
+    genres = [repr([f"genre {g}" for g in sorted(set(c))]) for c in np.split(codes, np.cumsum(sizes)[:-1])]
+    pd.DataFrame({"id": ids, "genre": genres}).to_csv(data_dir / "id_genres_mmsr.tsv", sep="\t", index=False)
+    pd.DataFrame({"id": ids, "popularity": np.round(rng.pareto(1.5, n) * 10, 1)}).to_csv(
+        data_dir / "id_metadata_mmsr.tsv", sep="\t", index=False)
+
+    store = data_dir / "feature_store"
+    store.mkdir(exist_ok=True)
+    manifest = {"ids_sha1": ids_fingerprint(ids), "n": n, "modalities": {}}
+    block = 16384
+    for attr, d in dims.items():
+        X = np.lib.format.open_memmap(store / f"{attr}.npy", mode="w+", dtype=np.float32, shape=(n, d))
+        for start in range(0, n, block):
+            X[start:start + block] = rng.standard_normal((min(block, n - start), d), dtype=np.float32)
+            l2_normalize_(X[start:start + block])
+        X.flush()
+        del X
+        # sources absent on disk are not held against the store
+        manifest["modalities"][attr] = {
+            "file": f"{attr}.npy", "shape": [n, d], "dtype": "float32",
+            "sources": [None] * len(DEFAULT_SOURCES[attr]),
+        }
+    with open(store / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    with open(store / "ids.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(ids))
+
+def bench_size(data_dir: Path, args) -> dict:
+    result = {"n": None, "cold_start": {}, "algorithms": {}}
+
+    t0 = time.perf_counter()
+    cat = load_catalog(data_dir)
+    t_catalog = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    attach_features(cat, data_dir)
+    t_features = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    load_catalog(data_dir)
+    t_warm = time.perf_counter() - t0
+    N = len(cat.ids)
+    result["n"] = N
+    result["cold_start"] = {
+        "load_catalog_s": t_catalog,            # parses the TSVs if no snapshot exists yet (always, for synthetic runs)
+        "load_catalog_warm_s": t_warm,          # from the snapshot
+        "attach_features_s": t_features,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    # share of distinct genre sets: what the genre index precomputation scales with
+    result["genre_sets_distinct"] = len(np.unique(genre_index_for(cat).bits, axis=0)) / max(N, 1)
+    print(f"[n={N}] cold start: catalog {t_catalog:.2f}s (warm {t_warm:.2f}s), features {t_features:.2f}s")
+
+    system = RetrievalSystem(cat, ALGORITHMS, BATCH_ALGORITHMS, block_size=args.block_size)
+    rng = np.random.default_rng(args.seed)
+    single = rng.choice(N, min(args.queries, N), replace=False)
+    batch = rng.choice(N, min(args.batch_queries, N), replace=False)
+    eval_ids = [cat.ids[i] for i in rng.choice(N, min(args.eval_queries, N), replace=False)]
+
+    for algo in args.algos:
+        # warm-up: first-use caches (row norms, genre index) are not query latency
+        system.retrieve(cat.ids[int(single[0])], args.k, algo, seed=args.seed)
+
+        lat = []
+        for q in single:
+            t0 = time.perf_counter()
+            system.retrieve(cat.ids[int(q)], args.k, algo, seed=args.seed)
+            lat.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        system.rank_batch(batch, args.k, algo, seed=args.seed)
+        t_batch = time.perf_counter() - t0
+
+        with tempfile.TemporaryDirectory() as out_dir:
+            t0 = time.perf_counter()
+            evaluate_algorithms(system, [algo], sorted({10, args.k}), eval_ids, Path(out_dir), store_lists=False, seed=args.seed)
+            t_eval = time.perf_counter() - t0
+
+        result["algorithms"][algo] = {
+            "single_query": {"queries": len(lat), **_percentiles(lat)},
+            "batch": {"queries": len(batch), "seconds": t_batch, "queries_per_s": len(batch) / t_batch if t_batch > 0 else None},
+            "eval": {"queries": len(eval_ids), "seconds": t_eval},
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        r = result["algorithms"][algo]
+        print(f"  {algo:<13} p50 {r['single_query']['p50_ms']:8.2f} ms  p99 {r['single_query']['p99_ms']:8.2f} ms  "
+              f"batch {r['batch']['queries_per_s']:9.0f} q/s  eval {t_eval:6.2f}s")
+    return result
+
+def main():
+    ap = argparse.ArgumentParser(description="Latency / throughput / memory benchmark on synthetic catalogs.")
+    ap.add_argument("--n", type=int, nargs="+", default=[10000], help="catalog sizes (up to 1M)")
+    ap.add_argument("--dims", type=int, nargs=3, default=list(REAL_DIMS.values()),
+                    metavar=("LYRICS", "AUDIO", "VIDEO"), help="feature dimensionality per modality")
+    ap.add_argument("--data", type=Path, default=None, help="benchmark a real retrieval data dir instead")
+    ap.add_argument("--algos", nargs="+", default=list(ALGORITHMS))
+    ap.add_argument("--k", type=int, default=100)
+    ap.add_argument("--queries", type=int, default=200, help="single-query latency samples")
+    ap.add_argument("--batch_queries", type=int, default=2048)
+    ap.add_argument("--eval_queries", type=int, default=1000)
+    ap.add_argument("--block_size", type=int, default=256)
+    ap.add_argument("--genres", type=int, default=1000, help="synthetic genre vocabulary size")
+    ap.add_argument("--genre_skew", type=float, default=1.0, help="Zipf exponent of synthetic genre popularity")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", type=Path, default=None, help="JSON output (default outputs/bench/<commit>.json)")
+    args = ap.parse_args()
+
+    commit = _git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpus": os.cpu_count(),
+            "dims": dict(zip(REAL_DIMS, args.dims)),
+            "k": args.k,
+            "block_size": args.block_size,
+            "genres": args.genres,
+            "genre_skew": args.genre_skew,
+        },
+        "runs": [],
+    }
+
+    if args.data is not None:
+        report["runs"].append({"source": str(args.data), **bench_size(args.data, args)})
+    else:
+        for n in args.n:
+            with tempfile.TemporaryDirectory() as tmp:
+                t0 = time.perf_counter()
+                write_synthetic(Path(tmp), n, dict(zip(REAL_DIMS, args.dims)), args.genres, args.genre_skew, args.seed)
+                print(f"[n={n}] synthetic catalog written in {time.perf_counter() - t0:.1f}s")
+                report["runs"].append({"source": "synthetic", **bench_size(Path(tmp), args)})
+
+    out = args.out or OUT / f"{commit}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print("\nSaved:", out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+
+from __future__ import annotations
+from pathlib import Path
+import argparse
+
+from mmsr_alg.io import load_catalog
+from mmsr_alg.feature_store import attach_features
+from mmsr_alg.retrieval.system import RetrievalSystem
+from mmsr_alg.retrieval.registry import ALGORITHMS
+from mmsr_alg.retrieval.ann import ANN_MATRICES
+
+DATA = Path("data/retrieval")
+
+def main():
+    ap = argparse.ArgumentParser(description="Build IVF indexes for approximate retrieval.")
+    ap.add_argument("--algos", nargs="+", default=list(ANN_MATRICES))
+    ap.add_argument("--nlist", type=int, default=0, help="0 = ~4*sqrt(N) buckets")
+    ap.add_argument("--nprobe", type=int, default=8, help="default buckets visited per query")
+    ap.add_argument("--k", type=int, default=10, help="k for the recall@k report")
+    ap.add_argument("--out", type=Path, default=DATA / "ann")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    cat = load_catalog(DATA)
+    attach_features(cat, DATA)
+    system = RetrievalSystem(cat, ALGORITHMS)
+
+    for algo in args.algos:
+        index = system.build_index(algo, nlist=args.nlist or None, nprobe=args.nprobe, seed=args.seed)
+        print(f"[{algo}] nlist={index.nlist}")
+        for nprobe in sorted({1, args.nprobe // 2 or 1, args.nprobe, 2 * args.nprobe}):
+            rec = system.index_recall(algo, k=args.k, nprobe=nprobe)
+            print(f"  nprobe={nprobe:<4d} recall@{args.k}={rec:.3f}")
+
+    system.save_indexes(args.out)
+    print("\nSaved:", args.out)
+
+if __name__ == "__main__":
+    main()
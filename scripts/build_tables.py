@@ -0,0 +1,43 @@
+
+from __future__ import annotations
+from contextlib import nullcontext
+from pathlib import Path
+import argparse
+import time
+
+from mmsr_alg.io import load_catalog
+from mmsr_alg.feature_store import attach_features
+from mmsr_alg.retrieval.system import RetrievalSystem
+from mmsr_alg.retrieval.registry import ALGORITHMS, BATCH_ALGORITHMS
+from mmsr_alg.retrieval.tables import UNTABLED, build_table
+from mmsr_alg.eval.parallel import SharedCatalogPool
+
+DATA = Path("data/retrieval")
+
+def main():
+    ap = argparse.ArgumentParser(description="Precompute top-K neighbour tables for every track.")
+    ap.add_argument("--algos", nargs="+", default=[a for a in ALGORITHMS if a not in UNTABLED])
+    ap.add_argument("--k", type=int, default=100, help="neighbours stored per track; retrieve() serves any k <= K")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--block_size", type=int, default=256)
+    ap.add_argument("--out", type=Path, default=DATA / "neighbours")
+    args = ap.parse_args()
+
+    cat = load_catalog(DATA)
+    attach_features(cat, DATA)
+    system = RetrievalSystem(cat, ALGORITHMS, BATCH_ALGORITHMS, block_size=args.block_size)
+
+    pool_ctx = SharedCatalogPool(system, args.workers) if args.workers > 1 else nullcontext()
+    with pool_ctx as pool:
+        for algo in args.algos:
+            if algo in UNTABLED:
+                print(f"[{algo}] skipped (depends on the seed)")
+                continue
+            t0 = time.perf_counter()
+            build_table(system, algo, args.k, args.out, pool=pool)
+            print(f"[{algo}] {len(cat.ids)} x {args.k} in {time.perf_counter() - t0:.1f}s")
+
+    print("\nSaved:", args.out)
+
+if __name__ == "__main__":
+    main()
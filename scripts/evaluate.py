@@ -2,24 +2,44 @@
 from __future__ import annotations
 from pathlib import Path
 import argparse
+import logging
 import numpy as np
 
 from mmsr_alg.io import load_catalog
-from mmsr_alg.features import load_feature_matrix, l2_normalize
+from mmsr_alg.feature_store import attach_features
+from mmsr_alg.instrumentation import Instrumentation
 from mmsr_alg.retrieval.system import RetrievalSystem
-from mmsr_alg.retrieval.registry import ALGORITHMS
-from mmsr_alg.retrieval.fusion_early import build_early_fusion_matrix
+from mmsr_alg.retrieval.registry import ALGORITHMS, BATCH_ALGORITHMS
+from mmsr_alg.retrieval.quantized import compress_catalog, quantization_report
 from mmsr_alg.eval.batch_runner import evaluate_algorithms
+from mmsr_alg.eval.sweep import random_weights, sweep_fusion_weights, weight_grid
 
 DATA = Path("data/retrieval")
 OUT  = Path("outputs/results")
+CACHE = Path("outputs/cache")
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--max_queries", type=int, default=0,
                     help="0 = all queries, else evaluate first N queries (useful for quick tests).")
     ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--block_size", type=int, default=256,
+                    help="Queries scored per matrix-matrix product (bounds memory).")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Processes sharing the feature matrices via shared memory (1 = serial).")
+    ap.add_argument("--no_cache", action="store_true",
+                    help="Do not reuse / write per-chunk checkpoints under outputs/cache.")
+    ap.add_argument("--quantize", choices=["none", "float16", "int8"], default="none",
+                    help="Score over compressed feature matrices, re-ranking candidates at full precision.")
+    ap.add_argument("--instrument", action="store_true",
+                    help="Time every retrieval / evaluation stage; writes outputs/results/instrumentation.json.")
+    ap.add_argument("--sweep_step", type=float, default=0.0,
+                    help="Instead of evaluating, sweep late/early fusion weights over a simplex grid with this step.")
+    ap.add_argument("--sweep_random", type=int, default=0,
+                    help="Instead of evaluating, sweep this many random fusion weight triples.")
     args = ap.parse_args()
+    # feature loading reports (row counts, duplicate ids) go through logging
+    logging.basicConfig(level=logging.INFO, format="[%(name)s] %(message)s")
 
     cat = load_catalog(DATA)
     print("Columns in tracks:", list(cat.tracks.columns))
@@ -29,15 +49,16 @@ def main():
         print("pop non-NaN count:", int(np.sum(~np.isnan(cat.popularity))))
         print("pop sample:", cat.popularity[:10])
 
-    # Load + normalize feature matrices
-    cat.X_lyrics = l2_normalize(load_feature_matrix(DATA / "id_lyrics_bert_mmsr.tsv", cat.id_to_idx))
-    cat.X_audio  = l2_normalize(load_feature_matrix(DATA / "id_mfcc_bow_mmsr.tsv", cat.id_to_idx))
-    cat.X_video  = l2_normalize(load_feature_matrix(DATA / "id_vgg19_mmsr.tsv", cat.id_to_idx))
+    # Memory-map pre-normalized feature matrices (built from the TSVs on first run)
+    attach_features(cat, DATA)
 
-    # Precompute early fusion
-    cat.X_early = build_early_fusion_matrix(cat.X_lyrics, cat.X_audio, cat.X_video, (1/3, 1/3, 1/3))
+    if args.quantize != "none":
+        compress_catalog(cat, args.quantize)
+        for attr, rep in quantization_report(cat).items():
+            print(f"{attr}:", ", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in rep.items()))
 
-    system = RetrievalSystem(cat, ALGORITHMS)
+    system = RetrievalSystem(cat, ALGORITHMS, BATCH_ALGORITHMS, block_size=args.block_size,
+                             instrumentation=Instrumentation() if args.instrument else None)
 
     # Query set
     query_ids = cat.ids
@@ -47,13 +68,25 @@ def main():
     algos = ["random", "lyrics", "audio", "video", "late_fusion", "early_fusion"]
     k_values = [5, 10, 20, 50, 100, 200]
 
+    if args.sweep_step or args.sweep_random:
+        weights = weight_grid(args.sweep_step) if args.sweep_step else random_weights(args.sweep_random, args.seed)
+        print(f"Sweeping {len(weights)} weight triples")
+        df = sweep_fusion_weights(system, weights, k_values, query_ids, out_dir=OUT)
+        print("\nSaved:", (OUT / "weight_sweep.csv"))
+        best = df[df["k"] == 10].sort_values("ndcg", ascending=False).groupby("algo").head(3)
+        print(best.to_string(index=False))
+        return
+
     df = evaluate_algorithms(
         system=system,
         algos=algos,
         k_values=k_values,
         query_ids=query_ids,
         out_dir=OUT,
-        store_lists=True
+        store_lists=True,
+        seed=args.seed,
+        workers=args.workers,
+        cache_dir=None if args.no_cache else CACHE,
     )
 
     # Print a compact view
@@ -2,25 +2,19 @@
 from pathlib import Path
 
 from mmsr_alg.io import load_catalog
-from mmsr_alg.features import load_feature_matrix, l2_normalize
+from mmsr_alg.feature_store import attach_features
 from mmsr_alg.retrieval.system import RetrievalSystem
 from mmsr_alg.retrieval.registry import ALGORITHMS
 from mmsr_alg.utils import decorate_result
 from mmsr_alg.eval.runner import evaluate_one_query
-from mmsr_alg.retrieval.fusion_early import build_early_fusion_matrix
 
 DATA = Path("data/retrieval")
 
 def main():
     cat = load_catalog(DATA)
 
-    # Load + normalize feature matrices
-    cat.X_lyrics = l2_normalize(load_feature_matrix(DATA / "id_lyrics_bert_mmsr.tsv", cat.id_to_idx))
-    cat.X_audio  = l2_normalize(load_feature_matrix(DATA / "id_mfcc_bow_mmsr.tsv", cat.id_to_idx))
-    cat.X_video  = l2_normalize(load_feature_matrix(DATA / "id_vgg19_mmsr.tsv", cat.id_to_idx))
-
-    # Precompute early-fusion matrix once (equal weights)
-    cat.X_early = build_early_fusion_matrix(cat.X_lyrics, cat.X_audio, cat.X_video, (1/3, 1/3, 1/3))
+    # Memory-map pre-normalized feature matrices (built from the TSVs on first run)
+    attach_features(cat, DATA)
 
     sys = RetrievalSystem(cat, ALGORITHMS)
 
@@ -0,0 +1,56 @@
+
+from __future__ import annotations
+from pathlib import Path
+import argparse
+import asyncio
+
+from mmsr_alg.io import load_catalog
+from mmsr_alg.feature_store import attach_features
+from mmsr_alg.instrumentation import Instrumentation
+from mmsr_alg.retrieval.system import RetrievalSystem
+from mmsr_alg.retrieval.registry import ALGORITHMS, BATCH_ALGORITHMS
+from mmsr_alg.retrieval.result_cache import ResultCache
+from mmsr_alg.retrieval.sharded import ShardedCatalog
+from mmsr_alg.service import RetrievalService
+
+DATA = Path("data/retrieval")
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve retrieval over HTTP (JSON).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--window_ms", type=float, default=2.0, help="how long a single query waits for others to batch with")
+    ap.add_argument("--max_batch", type=int, default=64)
+    ap.add_argument("--threads", type=int, default=2, help="threads scoring batches")
+    ap.add_argument("--tables", type=Path, default=DATA / "neighbours", help="precomputed neighbour tables, if present")
+    ap.add_argument("--shards", type=int, default=0, help="split the feature matrices across this many worker processes")
+    ap.add_argument("--instrument", action="store_true", help="per-stage timers and counters, exported at /metrics")
+    ap.add_argument("--profile_slow_ms", type=float, default=None,
+                    help="with --instrument: dump cProfile stats of sampled queries slower than this to outputs/profiles")
+    ap.add_argument("--profile_sample", type=float, default=0.01, help="fraction of queries run under the profiler")
+    args = ap.parse_args()
+
+    cat = load_catalog(DATA)
+    # memory-mapped; with --shards only the shard workers read the rows
+    attach_features(cat, DATA)
+    inst = Instrumentation(profile_slow_ms=args.profile_slow_ms, profile_sample=args.profile_sample) if args.instrument else None
+    shards = None
+    if args.shards > 0:
+        shards = ShardedCatalog(cat, args.shards, store_dir=DATA / "feature_store").__enter__()
+        system = shards.system(result_cache=ResultCache(), instrumentation=inst)
+    else:
+        system = RetrievalSystem(cat, ALGORITHMS, BATCH_ALGORITHMS, result_cache=ResultCache(), instrumentation=inst)
+    # tables are built (and fingerprinted) by the unsharded system
+    loaded = system.load_tables(args.tables, reference=RetrievalSystem(cat, ALGORITHMS, BATCH_ALGORITHMS))
+    if loaded:
+        print("neighbour tables:", loaded)
+
+    service = RetrievalService(system, window_ms=args.window_ms, max_batch=args.max_batch, threads=args.threads)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    finally:
+        if shards is not None:
+            shards.close()
+
+if __name__ == "__main__":
+    main()
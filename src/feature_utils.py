@@ -1,6 +1,9 @@
 from pathlib import Path
+import logging
 import numpy as np
-from mmsr_alg.features import load_feature_matrix, l2_normalize
+from mmsr_alg.features import load_feature_parts
+
+logger = logging.getLogger(__name__)
 
 def load_and_normalize_split(parts, id_to_idx):
     """
@@ -8,14 +11,12 @@ def load_and_normalize_split(parts, id_to_idx):
     
     parts: lista di Path o stringhe dei file part1, part2, ...
     id_to_idx: dizionario id -> indice nel catalogo
-    """
-    X_full = None
 
-    for part_file in parts:
-        X_part = load_feature_matrix(Path(part_file), id_to_idx)
-        if X_full is None:
-            X_full = X_part
-        else:
-            X_full += X_part  # somma le feature per non duplicare righe
-
-    return l2_normalize(X_full)
\ No newline at end of file
+    Le parti vengono lette in parallelo direttamente nella matrice finale;
+    gli id duplicati tra le parti vengono segnalati (vale la prima parte).
+    """
+    X, report = load_feature_parts([Path(p) for p in parts], id_to_idx)
+    logger.info("%s", report.summary())
+    if report.duplicate_ids:
+        logger.warning("id duplicati: %s", report.duplicate_ids[:5])
+    return X
\ No newline at end of file
@@ -1,29 +1,21 @@
-import pandas as pd
-import ast
 import streamlit as st
 from pathlib import Path
+from mmsr_alg.io import load_snapshot
 
 HERE = Path(__file__).parent  
 
 @st.cache_data
 def load_data():
     DATA = HERE / "data"               
-    df_info = pd.read_csv(DATA / "id_information_mmsr.tsv", sep="\t")
-    df_urls = pd.read_csv(DATA / "id_url_mmsr.tsv", sep="\t")
-    df_genres = pd.read_csv(DATA / "id_genres_mmsr.tsv", sep="\t")
-    df_merged = df_info.merge(df_urls, on="id", how="left").merge(df_genres, on="id", how="left")
-    return df_merged
+    # merged info + urls + genres, read from the columnar catalog snapshot
+    # (built from the TSVs on first use); same columns as the TSV merge,
+    # with "genre" as the genre list's text form
+    df = load_snapshot(DATA).frame()
+    df["genre"] = df["genre_list"].map(lambda g: str(g) if isinstance(g, list) else g)
+    return df.drop(columns=["genre_list", "popularity"], errors="ignore")
 
 @st.cache_data
 def load_genres():
     DATA = HERE / "data" 
-    df_gen = pd.read_csv(DATA / "id_genres_mmsr.tsv", sep="\t")
-    genre_col = next((c for c in df_gen.columns if c.lower() in ["genre", "genres", "genre_list"]), None)
-    if genre_col is None:
-        st.error("❌ Could not find genre column")
-        return {}
-    def safe_parse(x):
-        try: return ast.literal_eval(x) if isinstance(x, str) else []
-        except: return []
-    df_gen[genre_col] = df_gen[genre_col].apply(safe_parse)
-    return dict(zip(df_gen["id"].astype(str), df_gen[genre_col]))
\ No newline at end of file
+    snap = load_snapshot(DATA)
+    return dict(zip(snap.columns["id"].tolist(), snap.genre_lists()))
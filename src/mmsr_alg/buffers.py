@@ -0,0 +1,23 @@
+
+from __future__ import annotations
+from typing import Dict
+import numpy as np
+
+# capacity of a buffer when it has to grow, relative to the current rows
+GROWTH = 1.5
+
+def grow_rows(buffers: Dict[str, np.ndarray], key: str, X: np.ndarray, n: int) -> np.ndarray:
+    """
+    Writable view of the first `n` rows of the over-allocated buffer
+    buffers[key] holding X's rows; rows past X.shape[0] are left for the
+    caller to fill. X is copied only when it is not already such a view (e.g.
+    a read-only memmap or a fresh array) or the buffer is full, so appends
+    cost amortized O(new rows).
+    """
+    buf = buffers.get(key)
+    if buf is None or X.base is not buf or buf.shape[0] < n:
+        cap = n if n == X.shape[0] else max(n, int(X.shape[0] * GROWTH), 16)
+        buf = np.empty((cap,) + X.shape[1:], dtype=X.dtype)
+        buf[:X.shape[0]] = X
+        buffers[key] = buf
+    return buf[:n]
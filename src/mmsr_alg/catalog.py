@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 import numpy as np
 import pandas as pd
 
@@ -16,3 +16,20 @@ class Catalog:
 
     genres: Optional[List[set]] = None
     popularity: Optional[np.ndarray] = None
+    # genre vocabulary, multi-hot bitsets and total-relevant counts (genre_index.py)
+    genre_index: Optional[Any] = None
+    # metadata as contiguous arrays for decorate_result (track_columns.py)
+    columns: Optional[Any] = None
+
+    # derived: squared row norms per feature matrix attribute (see fusion_early)
+    row_sqnorms: Optional[Dict[str, np.ndarray]] = None
+    # optional float16 / int8 copies of the feature matrices (retrieval.quantized)
+    compressed: Optional[Dict[str, Any]] = None
+    # feature store provenance of memory-mapped matrices (feature_store.attach_features)
+    feature_sources: Optional[Dict[str, Dict[str, Any]]] = None
+
+    # incremental updates (updates.py): bumped on every change, True for
+    # removed tracks, and the over-allocated buffers the matrices are views of
+    version: int = 0
+    tombstones: Optional[np.ndarray] = None
+    buffers: Optional[Dict[str, np.ndarray]] = None
@@ -1,53 +1,52 @@
 
 from __future__ import annotations
-from typing import Dict, List, Tuple, Optional
-import json
+from typing import Iterable, List, Optional
+from contextlib import nullcontext
 from pathlib import Path
 import numpy as np
 import pandas as pd
 
-from ..catalog import Catalog
+from ..genre_index import genre_index_for
+from ..instrumentation import activate, count, stage
 from ..retrieval.system import RetrievalSystem
-from .metrics_accuracy import precision_at_k, recall_at_k, mrr_at_k, ndcg_at_k
-from .metrics_beyond import coverage_at_k, pop_at_k
-
-def _build_genre_inverted_index(catalog: Catalog) -> Dict[str, List[int]]:
-    """
-    genre -> list of track indices having that genre
-    """
-    inv: Dict[str, List[int]] = {}
-    if catalog.genres is None:
-        return inv
-    for i, gset in enumerate(catalog.genres):
-        for g in gset:
-            inv.setdefault(g, []).append(i)
-    return inv
-
-def _total_relevant_for_query(inv: Dict[str, List[int]], q_genres: set, qidx: int) -> int:
-    """
-    Total relevant tracks in whole catalog under genre-overlap definition
-    (excluding query itself).
-    """
-    if not q_genres:
-        return 0
-    union = set()
-    for g in q_genres:
-        union.update(inv.get(g, []))
-    if qidx in union:
-        union.remove(qidx)
-    return len(union)
-
-def _binary_rels_for_retrieved(catalog: Catalog, qidx: int, ranked_ids: List[str], k: int) -> List[int]:
+from .metrics_accuracy import accuracy_metrics_matrix
+from .metrics_beyond import beyond_metrics_matrix
+from .lists_store import RankingWriter, load_rankings, write_id_manifest
+from .parallel import SharedCatalogPool
+from .checkpoint import ChunkCache, algo_fingerprint, catalog_fingerprint
+
+def _rank_serial(system: RetrievalSystem, algo: str, chunks: List[np.ndarray], maxK: int, seed: Optional[int]):
+    done, total = 0, sum(len(c) for c in chunks)
+    for chunk in chunks:
+        idx, scores = system.rank_batch(chunk, maxK, algo, seed)
+
+        # lightweight progress
+        done += len(chunk)
+        print(f"[{algo}] processed {done}/{total} queries")
+        yield idx, scores
+
+def _collect(blocks: Iterable, algo: str, qidxs: np.ndarray, maxK: int, lists_dir: Optional[Path]) -> np.ndarray:
     """
-    For top-k retrieved ids, compute binary relevance by genre overlap.
+    (Q, maxK) ranked indices from the per-block results. With `lists_dir`,
+    blocks are streamed to disk as they arrive and the result is memory-mapped
+    back from there instead of being held in memory; lists shorter than maxK
+    (catalogs of maxK tracks or fewer) come back without the file's -1 padding.
     """
-    gq = catalog.genres[qidx] if catalog.genres is not None else set()
-    rels = []
-    for tid in ranked_ids[:k]:
-        tidx = catalog.id_to_idx[tid]
-        gt = catalog.genres[tidx] if catalog.genres is not None else set()
-        rels.append(1 if (gq and gt and len(gq.intersection(gt)) > 0) else 0)
-    return rels
+    if lists_dir is None:
+        parts = [idx for idx, _ in blocks]
+        return np.concatenate(parts) if parts else np.empty((0, maxK), dtype=np.int64)
+
+    writer = None
+    width = maxK
+    for idx, scores in blocks:
+        if writer is None:
+            writer = RankingWriter(lists_dir, algo, qidxs, maxK, with_scores=scores is not None)
+        writer.write(idx, scores)
+        width = min(width, idx.shape[1])
+    if writer is None:
+        return np.empty((0, maxK), dtype=np.int64)
+    writer.close()
+    return load_rankings(lists_dir, algo, maxK).idx[:, :width]
 
 def evaluate_algorithms(
     system: RetrievalSystem,
@@ -56,71 +55,94 @@ def evaluate_algorithms(
     query_ids: List[str],
     out_dir: Path,
     store_lists: bool = True,
+    seed: Optional[int] = None,
+    workers: int = 1,
+    cache_dir: Optional[Path] = None,
+    diversity_max_k: Optional[int] = 20,
 ) -> pd.DataFrame:
     """
     Runs evaluation for multiple algorithms and k values.
 
+    With workers > 1, query blocks are sharded across a process pool that
+    reads the feature matrices from shared memory; results are identical to
+    the serial run for the same seed.
+
+    With `cache_dir`, ranked lists are checkpointed per (algorithm, query
+    block), keyed by a content hash of the catalog, the algorithm and the
+    seed; a rerun only computes blocks that are missing or whose inputs changed.
+
+    Beyond accuracy, every (algo, k) gets coverage, Gini exposure, popularity,
+    novelty and, for k <= diversity_max_k, intra-list diversity per modality
+    (see metrics_beyond.beyond_metrics_matrix).
+
+    With system.instrumentation set, the ranking / relevance / metric stages
+    of every algorithm are timed as well and the snapshot is written next to
+    the metrics.
+
     Writes:
     - outputs/results/metrics.csv
-    - outputs/retrieval_lists/<algo>_top<maxK>.json (optional)
+    - outputs/results/instrumentation.json (optional)
+    - outputs/retrieval_lists/<algo>_top<maxK>.{queries,idx,scores}.npy + ids.txt
+      (optional, see lists_store.load_rankings)
     """
     out_dir.mkdir(parents=True, exist_ok=True)
-    (out_dir / "retrieval_lists").mkdir(parents=True, exist_ok=True)
+    lists_dir = out_dir / "retrieval_lists" if store_lists else None
+    if lists_dir is not None:
+        write_id_manifest(lists_dir, system.catalog.ids)
 
     catalog = system.catalog
-    inv = _build_genre_inverted_index(catalog)
+    gi = genre_index_for(catalog)
 
     maxK = max(k_values)
     rows = []
 
-    for algo in algos:
-        # 1) retrieve top maxK for each query once
-        retrieval_lists: Dict[str, List[str]] = {}
-        for qi, qid in enumerate(query_ids, start=1):
-            res = system.retrieve(qid, k=maxK, algo=algo)
-            retrieval_lists[qid] = res.ranked_ids
-
-            # lightweight progress
-            if qi % 500 == 0:
-                print(f"[{algo}] processed {qi}/{len(query_ids)} queries")
-
-        if store_lists:
-            path = out_dir / "retrieval_lists" / f"{algo}_top{maxK}.json"
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(retrieval_lists, f)
-
-        # 2) compute metrics for each k
-        N = len(catalog.ids)
-        for k in k_values:
-            p_list, r_list, mrr_list, ndcg_list = [], [], [], []
-
-            for qid in query_ids:
-                qidx = catalog.id_to_idx[qid]
-                gq = catalog.genres[qidx] if catalog.genres is not None else set()
-                total_rel = _total_relevant_for_query(inv, gq, qidx)
-
-                rels = _binary_rels_for_retrieved(catalog, qidx, retrieval_lists[qid], k)
-
-                p_list.append(precision_at_k(rels, k))
-                r_list.append(recall_at_k(rels, total_rel, k))
-                mrr_list.append(mrr_at_k(rels, k))
-                ndcg_list.append(ndcg_at_k(rels, total_rel, k))
-
-            cov = coverage_at_k(retrieval_lists, k=k, N=N)
-            pop = pop_at_k(catalog, retrieval_lists, k=k)
-
-            rows.append({
-                "algo": algo,
-                "k": k,
-                "precision": float(np.mean(p_list)) if p_list else 0.0,
-                "recall": float(np.mean(r_list)) if r_list else 0.0,
-                "mrr": float(np.mean(mrr_list)) if mrr_list else 0.0,
-                "ndcg": float(np.mean(ndcg_list)) if ndcg_list else 0.0,
-                "coverage": float(cov),
-                "pop": (None if pop is None else float(pop)),
-                "num_queries": len(query_ids),
-            })
+    qidxs = np.array([catalog.id_to_idx[qid] for qid in query_ids], dtype=np.int64)
+    bs = system.block_size
+    chunks = [qidxs[s:s + bs] for s in range(0, len(qidxs), bs)]
+    cache = ChunkCache(cache_dir) if cache_dir is not None else None
+    catalog_key = catalog_fingerprint(catalog) if cache is not None else None
+
+    pool_ctx = SharedCatalogPool(system, workers) if workers > 1 else nullcontext()
+    with pool_ctx as pool:
+        for algo in algos:
+            with activate(system.instrumentation, algo):
+                count("eval_queries", len(qidxs))
+                # 1) retrieve top maxK for each query once, a block of queries at a time
+                if pool is not None:
+                    print(f"[{algo}] {len(query_ids)} queries on {workers} workers")
+                    rank = lambda todo, algo=algo: pool.rank_shards(algo, todo, maxK, seed)
+                else:
+                    rank = lambda todo, algo=algo: _rank_serial(system, algo, todo, maxK, seed)
+                if cache is not None:
+                    key = f"{algo}-{catalog_key[:16]}-{algo_fingerprint(system, algo, maxK, seed)[:16]}"
+                    blocks = cache.blocks(key, chunks, rank)
+                else:
+                    blocks = rank(chunks)
+                with stage("eval_rank"):
+                    idx = _collect(blocks, algo, qidxs, maxK, lists_dir)
+
+                # 2) relevance of the top maxK once, then every metric for every k in one pass
+                with stage("eval_relevance"):
+                    rels = gi.relevance_matrix(qidxs, idx)
+                with stage("eval_accuracy"):
+                    acc = accuracy_metrics_matrix(rels, gi.total_relevant[qidxs], k_values)
+                with stage("eval_beyond"):
+                    beyond = beyond_metrics_matrix(catalog, idx, k_values, diversity_max_k)
+
+                for k in k_values:
+                    rows.append({
+                        "algo": algo,
+                        "k": k,
+                        "precision": float(np.mean(acc[k]["precision"])) if len(query_ids) else 0.0,
+                        "recall": float(np.mean(acc[k]["recall"])) if len(query_ids) else 0.0,
+                        "mrr": float(np.mean(acc[k]["mrr"])) if len(query_ids) else 0.0,
+                        "ndcg": float(np.mean(acc[k]["ndcg"])) if len(query_ids) else 0.0,
+                        **beyond[k],
+                        "num_queries": len(query_ids),
+                    })
 
     df = pd.DataFrame(rows)
     df.to_csv(out_dir / "metrics.csv", index=False)
+    if system.instrumentation is not None:
+        system.instrumentation.to_json(out_dir / "instrumentation.json")
     return df
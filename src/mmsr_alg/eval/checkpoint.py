@@ -0,0 +1,160 @@
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import hashlib
+import inspect
+import json
+import os
+import sys
+import numpy as np
+
+from ..catalog import Catalog
+from ..feature_store import store_file
+from ..retrieval.system import RetrievalSystem
+
+# bump when a change to retrieval code alters results for identical inputs
+CACHE_VERSION = 1
+
+_HASHED_MATRICES = ("X_lyrics", "X_audio", "X_video", "X_early")
+
+Block = Tuple[np.ndarray, Optional[np.ndarray]]
+
+def _hash_array(h, X: np.ndarray, rows_per_step: int = 4096) -> None:
+    h.update(f"{X.shape}{X.dtype.str}".encode())
+    for start in range(0, X.shape[0], rows_per_step):
+        h.update(np.ascontiguousarray(X[start:start + rows_per_step]).tobytes())
+
+def catalog_fingerprint(catalog: Catalog) -> str:
+    """
+    Content hash of the catalog id order, feature matrices, tombstones and
+    compression settings that ranked lists depend on. Genres are not
+    included: metrics are always recomputed from the lists.
+
+    Matrices still memory-mapped from the feature store are identified by
+    their manifest entry (source TSV sizes / mtimes and the id order hash)
+    instead of being read in full.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update("\n".join(catalog.ids).encode("utf-8"))
+    for attr in _HASHED_MATRICES:
+        X = getattr(catalog, attr)
+        h.update(attr.encode())
+        if X is None:
+            continue
+        if store_file(catalog, attr) is not None:
+            h.update(json.dumps(catalog.feature_sources[attr], sort_keys=True).encode())
+        else:
+            _hash_array(h, X)
+    if catalog.tombstones is not None and catalog.tombstones.any():
+        h.update(b"tombstones")
+        h.update(np.packbits(catalog.tombstones).tobytes())
+    for attr, Xq in sorted((catalog.compressed or {}).items()):
+        h.update(f"{attr}:{Xq.kind}:{Xq.oversample}".encode())
+    return h.hexdigest()
+
+def _module_source(fn) -> Optional[str]:
+    # hash of the source of the module defining fn, so edits to it invalidate checkpoints
+    module = sys.modules.get(getattr(fn, "__module__", None) or "")
+    try:
+        source = inspect.getsource(module) if module is not None else None
+    except (OSError, TypeError):
+        return None
+    return hashlib.blake2b(source.encode("utf-8"), digest_size=20).hexdigest() if source is not None else None
+
+def _fn_params(fn) -> dict:
+    if fn is None:
+        return {}
+    # a functools.partial: its bound arguments, then the wrapped function
+    bound = {"args": repr(getattr(fn, "args", ())), "keywords": repr(sorted((getattr(fn, "keywords", None) or {}).items()))}
+    fn = getattr(fn, "func", fn)
+    try:
+        params = {
+            name: repr(p.default)
+            for name, p in inspect.signature(fn).parameters.items()
+            if p.default is not inspect.Parameter.empty
+        }
+    except (TypeError, ValueError):
+        params = {}
+    return {
+        "fn": f"{getattr(fn, '__module__', '')}.{getattr(fn, '__qualname__', repr(fn))}",
+        "defaults": params,
+        "bound": bound,
+        "source": _module_source(fn),
+    }
+
+def algo_fingerprint(system: RetrievalSystem, algo: str, k: int, seed: Optional[int]) -> str:
+    """
+    Hash of everything besides the catalog that determines an algorithm's
+    ranked lists: its implementation (name and module source) and default
+    parameters, k and seed. Changes to shared helpers in other modules still
+    need a CACHE_VERSION bump.
+    """
+    spec = {
+        "version": CACHE_VERSION,
+        "algo": algo,
+        "single": _fn_params(system.algorithms.get(algo)),
+        "batch": _fn_params(system.batch_algorithms.get(algo)),
+        "k": k,
+        "seed": seed,
+    }
+    return hashlib.blake2b(json.dumps(spec, sort_keys=True).encode(), digest_size=20).hexdigest()
+
+class ChunkCache:
+    """
+    Content-addressed checkpoints of ranked lists per (algorithm, query chunk):
+
+        <root>/<run key>/<chunk hash>.npz    idx (int32), scores (float32, optional)
+
+    The run key combines the catalog and algorithm fingerprints; the chunk hash
+    is over the chunk's query indices. An interrupted or extended run reuses
+    every chunk that was already finished.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, key: str, qidxs: np.ndarray) -> Path:
+        chunk = hashlib.blake2b(np.asarray(qidxs, dtype=np.int64).tobytes(), digest_size=16).hexdigest()
+        return self.root / key / f"{chunk}.npz"
+
+    def load(self, key: str, qidxs: np.ndarray) -> Optional[Block]:
+        path = self._path(key, qidxs)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as z:
+                return z["idx"], (z["scores"] if "scores" in z.files else None)
+        except (OSError, ValueError, KeyError):
+            return None      # truncated / corrupt checkpoint: recompute
+
+    def save(self, key: str, qidxs: np.ndarray, idx: np.ndarray, scores: Optional[np.ndarray]) -> None:
+        path = self._path(key, qidxs)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {"idx": np.asarray(idx, dtype=np.int32)}
+        if scores is not None:
+            arrays["scores"] = np.asarray(scores, dtype=np.float32)
+        tmp = path.with_name(f".{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    def blocks(
+        self,
+        key: str,
+        chunks: List[np.ndarray],
+        compute: Callable[[List[np.ndarray]], Iterable[Block]],
+    ) -> Iterator[Block]:
+        """
+        Yields one (idx, scores) block per chunk, in order. Chunks without a
+        checkpoint are passed to `compute` (in order) and saved as they arrive.
+        """
+        cached = [self.load(key, c) for c in chunks]
+        missing = [c for c, hit in zip(chunks, cached) if hit is None]
+        if chunks:
+            print(f"  checkpoints: {len(chunks) - len(missing)}/{len(chunks)} chunks cached")
+        computed = iter(compute(missing)) if missing else iter(())
+        for chunk, hit in zip(chunks, cached):
+            if hit is None:
+                hit = next(computed)
+                self.save(key, chunk, *hit)
+            yield hit
@@ -0,0 +1,120 @@
+
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+
+from ..feature_store import ids_fingerprint
+
+IDS_FILE = "ids.txt"
+
+def _paths(lists_dir: Path, algo: str, k: int):
+    stem = lists_dir / f"{algo}_top{k}"
+    return (
+        stem.with_name(stem.name + ".queries.npy"),
+        stem.with_name(stem.name + ".idx.npy"),
+        stem.with_name(stem.name + ".scores.npy"),
+    )
+
+def write_id_manifest(lists_dir: Path, ids: List[str]) -> None:
+    """
+    Catalog ids in index order, shared by every ranking file in `lists_dir`.
+    """
+    lists_dir.mkdir(parents=True, exist_ok=True)
+    path = lists_dir / IDS_FILE
+    if path.exists() and ids_fingerprint(read_id_manifest(lists_dir)) == ids_fingerprint(ids):
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(ids))
+
+def read_id_manifest(lists_dir: Path) -> List[str]:
+    with open(lists_dir / IDS_FILE, "r", encoding="utf-8") as f:
+        text = f.read()
+    return text.split("\n") if text else []
+
+class RankingWriter:
+    """
+    Streams the top-k lists of one algorithm to fixed-shape .npy files:
+
+    - <algo>_top<k>.queries.npy  (Q,)    int32 query catalog indices
+    - <algo>_top<k>.idx.npy      (Q, k)  int32 ranked catalog indices
+    - <algo>_top<k>.scores.npy   (Q, k)  float32 scores (if the algorithm has them)
+
+    Files are preallocated and filled block by block while retrieval runs.
+    Lists shorter than k (e.g. a catalog of k tracks or fewer) are padded
+    with index -1 and score NaN, as are rows never written.
+    """
+
+    def __init__(self, lists_dir: Path, algo: str, qidxs: np.ndarray, k: int, with_scores: bool = True):
+        lists_dir.mkdir(parents=True, exist_ok=True)
+        q_path, idx_path, score_path = _paths(lists_dir, algo, k)
+        np.save(q_path, np.asarray(qidxs, dtype=np.int32))
+        shape = (len(qidxs), k)
+        self.idx = np.lib.format.open_memmap(idx_path, mode="w+", dtype=np.int32, shape=shape)
+        self.scores = None
+        if with_scores:
+            self.scores = np.lib.format.open_memmap(score_path, mode="w+", dtype=np.float32, shape=shape)
+        elif score_path.exists():
+            score_path.unlink()      # stale scores from an earlier run
+        self.pos = 0
+
+    def write(self, idx: np.ndarray, scores: Optional[np.ndarray] = None) -> None:
+        n, k = idx.shape
+        if k > self.idx.shape[1]:
+            raise ValueError(f"lists of length {k} do not fit top-{self.idx.shape[1]} files")
+        rows = slice(self.pos, self.pos + n)
+        self.idx[rows, :k] = idx
+        self.idx[rows, k:] = -1
+        if self.scores is not None:
+            if scores is not None:
+                self.scores[rows, :k] = scores
+                self.scores[rows, k:] = np.nan
+            else:
+                self.scores[rows] = np.nan
+        self.pos += n
+
+    def close(self) -> None:
+        if self.idx is not None:
+            self.idx[self.pos:] = -1
+        if self.scores is not None:
+            self.scores[self.pos:] = np.nan
+        for arr in (self.idx, self.scores):
+            if arr is not None:
+                arr.flush()
+        self.idx = self.scores = None
+
+    def __enter__(self) -> "RankingWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+@dataclass
+class Rankings:
+    """
+    Memory-mapped view of one algorithm's stored top-k lists.
+    """
+    query_idx: np.ndarray
+    idx: np.ndarray
+    scores: Optional[np.ndarray]
+    ids: List[str]
+
+    def ranked_ids(self, row: int, k: Optional[int] = None) -> List[str]:
+        return [self.ids[i] for i in self.idx[row, :k] if i >= 0]
+
+def load_rankings(lists_dir: Path, algo: str, k: int, ids: Optional[List[str]] = None) -> Rankings:
+    """
+    Open the lists written by RankingWriter without loading them into memory.
+    If `ids` is given, the stored id manifest must match it.
+    """
+    q_path, idx_path, score_path = _paths(lists_dir, algo, k)
+    stored_ids = read_id_manifest(lists_dir)
+    if ids is not None and ids_fingerprint(ids) != ids_fingerprint(stored_ids):
+        raise ValueError(f"{lists_dir} was written for a different catalog id order")
+    return Rankings(
+        query_idx=np.load(q_path, mmap_mode="r"),
+        idx=np.load(idx_path, mmap_mode="r"),
+        scores=np.load(score_path, mmap_mode="r") if score_path.exists() else None,
+        ids=stored_ids,
+    )
@@ -1,7 +1,8 @@
 
 from __future__ import annotations
-from typing import List
+from typing import Dict, List, Sequence
 import math
+import numpy as np
 
 def precision_at_k(rels: List[int], k: int) -> float:
     if k <= 0:
@@ -43,3 +44,52 @@ def ndcg_at_k(rels: List[int], total_relevant: int, k: int) -> float:
     idcg_val = sum(1.0 / math.log2(i + 1) for i in range(1, ideal_ones + 1))
     return dcg_val / idcg_val
 
+def _discounts(n: int) -> np.ndarray:
+    # 1 / log2(rank + 1) for ranks 1..n, computed like ndcg_at_k does
+    return np.array([1.0 / math.log2(i + 1) for i in range(1, n + 1)], dtype=np.float64)
+
+def accuracy_metrics_matrix(
+    rels: np.ndarray,
+    total_relevant: np.ndarray,
+    k_values: Sequence[int],
+) -> Dict[int, Dict[str, np.ndarray]]:
+    """
+    Vectorized precision / recall / MRR / nDCG for all queries and all k.
+
+    rels:            (Q, maxK) binary relevance of each query's ranked list
+    total_relevant:  (Q,) relevant tracks in the catalog per query
+
+    Returns {k: {"precision", "recall", "mrr", "ndcg"}} with one value per
+    query, equal to the scalar *_at_k functions on each row.
+    """
+    rels = np.asarray(rels).astype(np.int64, copy=False)
+    total = np.asarray(total_relevant, dtype=np.int64)
+    Q, maxK = rels.shape
+    K = max(max(k_values, default=0), maxK)
+
+    hits = np.cumsum(rels, axis=1)                       # (Q, maxK)
+    disc = _discounts(K)
+    dcg = np.cumsum(rels * disc[:maxK], axis=1)          # (Q, maxK)
+    idcg = np.concatenate([[0.0], np.cumsum(disc)])      # idcg[n] = ideal DCG with n relevant
+
+    has_rel = rels.any(axis=1)
+    first = np.where(has_rel, np.argmax(rels, axis=1) + 1, 0)   # 1-based rank of first hit
+    rr = np.where(has_rel, 1.0 / np.maximum(first, 1), 0.0)
+
+    out: Dict[int, Dict[str, np.ndarray]] = {}
+    for k in k_values:
+        if k <= 0 or maxK == 0:
+            zeros = np.zeros(Q)
+            out[k] = {"precision": zeros, "recall": zeros, "mrr": zeros, "ndcg": zeros}
+            continue
+        col = min(k, maxK) - 1
+        hk = hits[:, col]
+        ideal = np.minimum(total, k)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[k] = {
+                "precision": hk / k,
+                "recall": np.where(total > 0, hk / np.maximum(total, 1), 0.0),
+                "mrr": np.where(first <= k, rr, 0.0),
+                "ndcg": np.where(ideal > 0, dcg[:, col] / idcg[np.maximum(ideal, 0)], 0.0),
+            }
+    return out
@@ -1,17 +1,23 @@
 
 from __future__ import annotations
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Sequence
 import numpy as np
 from ..catalog import Catalog
 
+# catalog attribute -> suffix of the intra-list diversity metric
+DIVERSITY_MODALITIES = {"X_lyrics": "lyrics", "X_audio": "audio", "X_video": "video"}
+
+# gathered feature rows per step of intra_list_diversity (~64 MB)
+_BLOCK_BYTES = 1 << 26
+
 def coverage_at_k(all_ranked_ids: Dict[str, List[str]], k: int, N: int) -> float:
     """
     Coverage@k = (# unique retrieved tracks across all queries) / N
     """
-    seen: Set[str] = set()
-    for rids in all_ranked_ids.values():
-        seen.update(rids[:k])
-    return len(seen) / max(N, 1)
+    parts = [np.asarray(rids[:k], dtype=object) for rids in all_ranked_ids.values()]
+    if not parts:
+        return 0.0
+    return len(np.unique(np.concatenate(parts))) / max(N, 1)
 
 def pop_at_k(catalog: Catalog, all_ranked_ids: Dict[str, List[str]], k: int) -> Optional[float]:
     """
@@ -19,18 +25,152 @@ def pop_at_k(catalog: Catalog, all_ranked_ids: Dict[str, List[str]], k: int) ->
     Uses nanmean so missing popularity doesn't blank out results.
     Returns None if popularity isn't loaded.
     """
-    if catalog.popularity is None:
+    if catalog.popularity is None or not all_ranked_ids:
         return None
+    lists = [rids[:k] for rids in all_ranked_ids.values()]
+    lengths = np.array([len(r) for r in lists])
+    idx = np.fromiter((catalog.id_to_idx[t] for r in lists for t in r), dtype=np.int64, count=int(lengths.sum()))
+    rows = np.repeat(np.arange(len(lists)), lengths)
+
+    vals = catalog.popularity[idx]
+    valid = ~np.isnan(vals)
+    n_valid = np.bincount(rows[valid], minlength=len(lists))
+    sums = np.bincount(rows[valid], weights=vals[valid], minlength=len(lists))
+    if not (n_valid > 0).any():
+        return None
+    return float(np.mean(sums[n_valid > 0] / n_valid[n_valid > 0]))
+
+def exposure_counts(idx: np.ndarray, k: int, N: int) -> np.ndarray:
+    """
+    (N,) number of lists whose top-k contains each track; padding entries
+    (index -1) count for none.
+    """
+    top = np.asarray(idx[:, :k]).ravel()
+    return np.bincount(top[top >= 0], minlength=N)
+
+def gini(counts: np.ndarray) -> float:
+    """
+    Gini coefficient of exposure counts over the catalog: 0 when every track
+    is retrieved equally often, -> 1 when a few tracks take all exposure.
+    """
+    x = np.sort(np.asarray(counts, dtype=np.float64))
+    n, total = len(x), x.sum()
+    if n == 0 or total == 0:
+        return 0.0
+    ranks = np.arange(1, n + 1)
+    return float(((2 * ranks - n - 1) * x).sum() / (n * total))
+
+def per_query_means(vals: np.ndarray, k_values: Sequence[int]) -> Dict[int, np.ndarray]:
+    """
+    Per k: (Q,) mean of each top-k's non-NaN values, NaN where none is known,
+    from one cumulative sum over the (Q, maxK) values for all k.
+    """
+    valid = ~np.isnan(vals)
+    sums = np.cumsum(np.where(valid, vals, 0.0), axis=1)
+    n_valid = np.cumsum(valid, axis=1)
+    out: Dict[int, np.ndarray] = {}
+    for k in k_values:
+        if k <= 0 or vals.shape[1] == 0:
+            out[k] = np.full(vals.shape[0], np.nan)
+            continue
+        col = min(k, vals.shape[1]) - 1
+        n = n_valid[:, col]
+        out[k] = np.where(n > 0, sums[:, col] / np.maximum(n, 1), np.nan)
+    return out
 
-    per_query_means = []
-    for rids in all_ranked_ids.values():
-        idxs = [catalog.id_to_idx[tid] for tid in rids[:k]]
-        vals = catalog.popularity[idxs]
-        m = float(np.nanmean(vals))
-        if not np.isnan(m):
-            per_query_means.append(m)
+def _macro_means(vals: np.ndarray, k_values: Sequence[int]) -> Dict[int, Optional[float]]:
+    # per k: mean over queries of per_query_means (queries without any skipped)
+    out: Dict[int, Optional[float]] = {}
+    for k, per_query in per_query_means(vals, k_values).items():
+        known = per_query[~np.isnan(per_query)]
+        out[k] = float(known.mean()) if known.size else None
+    return out
 
-    if not per_query_means:
+def self_information(catalog: Catalog) -> Optional[np.ndarray]:
+    """
+    -log2 of each track's share of the catalog's popularity (+1 smoothed,
+    so unpopular tracks stay finite); NaN where popularity is missing.
+    """
+    if catalog.popularity is None:
         return None
-    return float(np.mean(per_query_means))
+    p = catalog.popularity.astype(np.float64) + 1.0
+    return -np.log2(p / np.nansum(p))
+
+def intra_list_diversity(X: np.ndarray, idx: np.ndarray, k_values: Sequence[int]) -> Dict[int, np.ndarray]:
+    """
+    (Q,) intra-list diversity of every top-k: mean pairwise cosine distance
+    1 - <x_i, x_j> over the k(k-1) ordered pairs of the list, for rows of an
+    L2-normalized X (zero rows count as distance 1).
+
+    Uses sum_{i != j} <x_i, x_j> = |sum_i x_i|^2 - sum_i |x_i|^2, so all k
+    come from running sums of the gathered rows, O(Q k d) instead of the
+    O(Q k^2 d) Gram matrices.
+    """
+    ks = sorted(k for k in set(k_values) if 2 <= k <= idx.shape[1])
+    Q = idx.shape[0]
+    out = {k: np.empty(Q) for k in ks}
+    if not ks or Q == 0:
+        return out
+    d = X.shape[1]
+    rows = max(1, _BLOCK_BYTES // (ks[-1] * d * 4))
+    for start in range(0, Q, rows):
+        block = np.asarray(idx[start:start + rows, :ks[-1]])
+        V = X[block]                                          # (b, K, d)
+        sq = np.cumsum(np.einsum("bkd,bkd->bk", V, V, dtype=np.float64), axis=1)
+        S = np.zeros((len(block), d), dtype=np.float64)
+        prev = 0
+        for k in ks:
+            S += V[:, prev:k].sum(axis=1, dtype=np.float64)
+            prev = k
+            pair_sims = np.einsum("bd,bd->b", S, S) - sq[:, k - 1]
+            out[k][start:start + rows] = 1.0 - pair_sims / (k * (k - 1))
+    return out
+
+def beyond_metrics_matrix(
+    catalog: Catalog,
+    idx: np.ndarray,
+    k_values: Sequence[int],
+    diversity_max_k: Optional[int] = 20,
+) -> Dict[int, Dict[str, Optional[float]]]:
+    """
+    Beyond-accuracy metrics of a (Q, maxK) ranked index matrix for all k:
+
+    - coverage:  share of the catalog retrieved by at least one list
+    - gini:      Gini coefficient of how often each track is retrieved
+    - pop:       macro-averaged popularity (per_query_means of each top-k)
+    - novelty:   macro-averaged self_information
+    - ild_<modality>: mean intra-list diversity per loaded feature matrix,
+                 for k <= diversity_max_k (None = every k) and None above
+
+    Popularity-based values are None without catalog.popularity.
+    """
+    idx = np.asarray(idx)
+    N = len(catalog.ids)
+    Q = idx.shape[0]
+
+    pop: Dict[int, Optional[float]] = {k: None for k in k_values}
+    novelty: Dict[int, Optional[float]] = {k: None for k in k_values}
+    if catalog.popularity is not None and Q:
+        pop = _macro_means(catalog.popularity[idx], k_values)
+        novelty = _macro_means(self_information(catalog)[idx], k_values)
+
+    div_ks = [k for k in k_values if diversity_max_k is None or k <= diversity_max_k]
+    ild = {}
+    for attr, name in DIVERSITY_MODALITIES.items():
+        X = getattr(catalog, attr)
+        if X is not None:
+            ild[name] = intra_list_diversity(X, idx, div_ks)
 
+    out: Dict[int, Dict[str, Optional[float]]] = {}
+    for k in k_values:
+        counts = exposure_counts(idx, k, N)
+        row = {
+            "coverage": int(np.count_nonzero(counts)) / max(N, 1),
+            "gini": gini(counts),
+            "pop": pop[k],
+            "novelty": novelty[k],
+        }
+        for name, per_k in ild.items():
+            row[f"ild_{name}"] = float(per_k[k].mean()) if k in per_k and Q else None
+        out[k] = row
+    return out
@@ -0,0 +1,165 @@
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+from ..catalog import Catalog
+from ..feature_store import store_file
+from ..retrieval.system import RetrievalSystem
+
+# catalog attributes handed to workers by file or shared memory
+SHARED_MATRICES = ("X_lyrics", "X_audio", "X_video", "X_early")
+
+# attr -> ("npy", path) or ("shm", block name, shape, dtype), as sharded.ShardSource
+ShmSpec = Dict[str, Tuple]
+
+def _to_shm(X: np.ndarray, blocks: List[shared_memory.SharedMemory]) -> Tuple:
+    shm = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+    blocks.append(shm)
+    np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[...] = X
+    return "shm", shm.name, X.shape, X.dtype.str
+
+def _attach(entry: Tuple, blocks: List[shared_memory.SharedMemory]) -> np.ndarray:
+    if entry[0] == "npy":
+        # the feature store file: its pages are already shared through the page cache
+        return np.load(entry[1], mmap_mode="r")
+    _, name, shape, dtype = entry
+    # pool workers share the parent's resource tracker, and the parent
+    # unlinks every block on exit
+    shm = shared_memory.SharedMemory(name=name)
+    blocks.append(shm)
+    X = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    X.flags.writeable = False
+    return X
+
+# ---- worker side ----
+
+_WORKER: Dict[str, object] = {}
+
+def _init_worker(spec: ShmSpec, compressed_spec: Dict, catalog: Catalog, block_size: int, algos: List[str], batch_algos: List[str]) -> None:
+    from ..retrieval.registry import ALGORITHMS, BATCH_ALGORITHMS
+
+    blocks: List[shared_memory.SharedMemory] = []
+    for attr, entry in spec.items():
+        setattr(catalog, attr, _attach(entry, blocks))
+    if compressed_spec:
+        catalog.compressed = {
+            attr: replace(meta, data=_attach(entry, blocks))
+            for attr, (meta, entry) in compressed_spec.items()
+        }
+    _WORKER["blocks"] = blocks
+    _WORKER["system"] = RetrievalSystem(
+        catalog,
+        {name: ALGORITHMS[name] for name in algos},
+        {name: BATCH_ALGORITHMS[name] for name in batch_algos},
+        block_size=block_size,
+    )
+
+def _rank_shard(algo: str, qidxs: np.ndarray, k: int, seed: Optional[int]):
+    system: RetrievalSystem = _WORKER["system"]
+    idx, scores = system.rank_batch(qidxs, k, algo, seed)
+    return idx.astype(np.int32), (None if scores is None else scores.astype(np.float32))
+
+# ---- parent side ----
+
+class SharedCatalogPool:
+    """
+    Process pool whose workers see the catalog's feature matrices without
+    pickled copies: matrices still memory-mapped from the feature store are
+    reopened from their .npy (sharing the page cache), others (in memory or
+    updated) go through multiprocessing.shared_memory.
+
+    Workers run the parent system's algorithms by name from the registry
+    (retrieval.registry); a system with an algorithm that is not the
+    registry's function (custom, functools.partial) raises ValueError.
+
+        with SharedCatalogPool(system, workers=4) as pool:
+            idx = pool.rank("late_fusion", qidxs, k=200, seed=42)
+    """
+
+    def __init__(self, system: RetrievalSystem, workers: int, shard_size: Optional[int] = None):
+        self.system = system
+        self.workers = workers
+        self.shard_size = shard_size or system.block_size
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _algo_names(self) -> Tuple[List[str], List[str]]:
+        from ..retrieval.registry import ALGORITHMS, BATCH_ALGORITHMS
+        names = []
+        for registry, algos in ((ALGORITHMS, self.system.algorithms), (BATCH_ALGORITHMS, self.system.batch_algorithms)):
+            custom = sorted(name for name, fn in algos.items() if registry.get(name) is not fn)
+            if custom:
+                raise ValueError(f"SharedCatalogPool workers run registry algorithms only; not in the registry: {custom}")
+            names.append(list(algos))
+        return names[0], names[1]
+
+    def __enter__(self) -> "SharedCatalogPool":
+        cat = self.system.catalog
+        algos, batch_algos = self._algo_names()
+        spec: ShmSpec = {}
+        for attr in SHARED_MATRICES:
+            X = getattr(cat, attr)
+            if X is None:
+                continue
+            path = store_file(cat, attr)
+            spec[attr] = ("npy", str(path)) if path is not None else _to_shm(np.ascontiguousarray(X), self._blocks)
+
+        compressed_spec = {}
+        for attr, Xq in (cat.compressed or {}).items():
+            compressed_spec[attr] = (replace(Xq, data=None), _to_shm(Xq.data, self._blocks))
+
+        # everything except the big matrices is pickled once per worker
+        light = replace(
+            cat,
+            tracks=cat.tracks.iloc[:0],
+            X_lyrics=None, X_audio=None, X_video=None, X_early=None,
+            compressed=None,
+            columns=None,
+            buffers=None,
+        )
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(spec, compressed_spec, light, self.system.block_size, algos, batch_algos),
+        )
+        return self
+
+    def rank_iter(self, algo: str, qidxs, k: int, seed: Optional[int] = None) -> Iterator[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """
+        Yields (idx, scores) per shard of query indices, in query order,
+        while the remaining shards are still being scored by the pool.
+        """
+        qidxs = np.asarray(qidxs, dtype=np.int64)
+        shards = [qidxs[s:s + self.shard_size] for s in range(0, len(qidxs), self.shard_size)]
+        yield from self.rank_shards(algo, shards, k, seed)
+
+    def rank_shards(self, algo: str, shards: List[np.ndarray], k: int, seed: Optional[int] = None) -> Iterator[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """
+        Like rank_iter, for caller-defined shards of query indices.
+        """
+        futures = [self._pool.submit(_rank_shard, algo, shard, k, seed) for shard in shards]
+        for f in futures:
+            yield f.result()
+
+    def rank(self, algo: str, qidxs, k: int, seed: Optional[int] = None) -> np.ndarray:
+        """
+        (Q, k) int32 top-k indices for all query indices, sharded across the
+        pool and reassembled in query order.
+        """
+        parts = [idx for idx, _ in self.rank_iter(algo, qidxs, k, seed)]
+        if not parts:
+            return np.empty((0, k), dtype=np.int32)
+        return np.concatenate(parts)
+
+    def __exit__(self, *exc) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for shm in self._blocks:
+            shm.close()
+            shm.unlink()
+        self._blocks = []
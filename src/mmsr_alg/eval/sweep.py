@@ -0,0 +1,230 @@
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+from ..genre_index import genre_index_for
+from ..instrumentation import activate, stage
+from ..retrieval.system import RetrievalSystem
+from ..retrieval.cosine import cosine_scores_batch
+from ..retrieval.fusion_early import MODALITIES, row_sqnorms
+from ..retrieval.fusion_late import _minmax_norm_rows
+from ..retrieval.topk import topk
+from .metrics_accuracy import accuracy_metrics_matrix
+from .metrics_beyond import DIVERSITY_MODALITIES, exposure_counts, gini, intra_list_diversity, per_query_means, self_information
+
+Weights = Tuple[float, float, float]
+FUSIONS = ("late_fusion", "early_fusion")
+
+def weight_grid(step: float = 0.125) -> List[Weights]:
+    """
+    Every (wL, wA, wV) on the simplex with coordinates in multiples of
+    `step` (0.125 -> 45 triples, 0.1 -> 66).
+    """
+    n = int(round(1 / step))
+    return [(i / n, j / n, (n - i - j) / n) for i in range(n + 1) for j in range(n + 1 - i)]
+
+def random_weights(n: int, seed: Optional[int] = None) -> List[Weights]:
+    """
+    `n` triples drawn uniformly from the simplex.
+    """
+    W = np.random.default_rng(seed).dirichlet((1.0, 1.0, 1.0), size=n)
+    return [tuple(float(x) for x in w) for w in W]
+
+class _Totals:
+    # running sums over query blocks for one (fusion, weights)
+    def __init__(self, k_values: Sequence[int], N: int, ild_names: Sequence[str]):
+        self.acc = {k: {m: 0.0 for m in ("precision", "recall", "mrr", "ndcg")} for k in k_values}
+        # [sum, count] of the per-query means of known values
+        self.pop = {k: [0.0, 0] for k in k_values}
+        self.novelty = {k: [0.0, 0] for k in k_values}
+        self.ild = {k: {name: 0.0 for name in ild_names} for k in k_values}
+        # number of lists whose top-k holds each track: coverage and gini
+        self.exposure = {k: np.zeros(N, dtype=np.int32) for k in k_values}
+        # longest list seen (shorter than max(k_values) on tiny catalogs)
+        self.width = 0
+        self.num_queries = 0
+
+def _fuse_late(norm: List[np.ndarray], w: Weights, out: np.ndarray, tmp: np.ndarray) -> np.ndarray:
+    # same arithmetic as late_fusion_batch_algo on already normalized blocks
+    np.multiply(norm[0], w[0], out=out)
+    for S, wm in zip(norm[1:], w[1:]):
+        np.multiply(S, wm, out=tmp)
+        out += tmp
+    return out
+
+def _fuse_early(catalog, raw: List[np.ndarray], qidxs: np.ndarray, w: Weights, out: np.ndarray, tmp: np.ndarray, eps: float = 1e-12) -> np.ndarray:
+    # same arithmetic as fusion_early.early_fusion_scores on the raw blocks
+    norms = np.sqrt(sum(wm * row_sqnorms(catalog, attr) for wm, attr in zip(w, MODALITIES))) + eps
+    np.multiply(raw[0], w[0], out=out)
+    for S, wm in zip(raw[1:], w[1:]):
+        np.multiply(S, wm, out=tmp)
+        out += tmp
+    out /= norms
+    out /= norms[qidxs][:, None]
+    return out
+
+def sweep_fusion_weights(
+    system: RetrievalSystem,
+    weights: Sequence[Weights],
+    k_values: List[int],
+    query_ids: List[str],
+    fusions: Sequence[str] = FUSIONS,
+    out_dir: Optional[Path] = None,
+    diversity_max_k: Optional[int] = 20,
+    exposure_bytes: int = 1 << 28,
+) -> pd.DataFrame:
+    """
+    Evaluates late / early fusion for every weight triple in one pass over
+    the queries (or a few, see below): each block's three per-modality score blocks are computed
+    (and min-max normalized) once, then fused, ranked and scored per triple.
+    Lists equal late_fusion / early_fusion called with those weights, so the
+    metrics match evaluate_algorithms; tombstoned tracks are skipped as in
+    RetrievalSystem.rank_batch. Scores use the full-precision matrices.
+
+    Peak memory is about eight (block_size, N) float32 blocks, plus the
+    per-track exposure counters behind coverage and Gini: len(k_values) * N
+    int32 per (fusion, weights). When those exceed `exposure_bytes`, the
+    triples are split into groups that fit and each group is one pass over
+    the queries, reduced to its metrics before the next one starts.
+
+    Returns (and with `out_dir`, writes to weight_sweep.csv) one row per
+    (fusion, weights, k) with the metrics of evaluate_algorithms, the
+    beyond-accuracy ones accumulated block by block (diversity_max_k as there).
+    """
+    for f in fusions:
+        if f not in FUSIONS:
+            raise ValueError(f"fusions must be among {FUSIONS}, got {f!r}")
+    catalog = system.catalog
+    N = len(catalog.ids)
+    combos = [(f, i) for f in fusions for i in range(len(weights))]
+    per_combo = len(k_values) * N * 4
+    size = max(1, exposure_bytes // max(per_combo, 1))
+    groups = [combos[s:s + size] for s in range(0, len(combos), size)]
+
+    rows = []
+    with activate(system.instrumentation, "weight_sweep"):
+        for g, group in enumerate(groups):
+            if len(groups) > 1:
+                print(f"[weight sweep] pass {g + 1}/{len(groups)}: {len(group)} (fusion, weights)")
+            totals = _sweep_pass(system, weights, k_values, query_ids, group, diversity_max_k)
+            rows.extend(_metric_rows(totals, weights, k_values, N, diversity_max_k))
+
+    df = pd.DataFrame(rows)
+    if out_dir is not None:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        df.to_csv(out_dir / "weight_sweep.csv", index=False)
+    return df
+
+def _sweep_pass(
+    system: RetrievalSystem,
+    weights: Sequence[Weights],
+    k_values: List[int],
+    query_ids: List[str],
+    combos: List[Tuple[str, int]],
+    diversity_max_k: Optional[int],
+) -> Dict[Tuple[str, int], _Totals]:
+    # one pass over the queries, scoring the (fusion, weights index) pairs in `combos`
+    catalog = system.catalog
+    gi = genre_index_for(catalog)
+    N = len(catalog.ids)
+    maxK = max(k_values)
+    tomb = catalog.tombstones
+    n_dead = 0 if tomb is None else int(np.count_nonzero(tomb))
+    fusions = {f for f, _ in combos}
+
+    qidxs = np.array([catalog.id_to_idx[q] for q in query_ids], dtype=np.int64)
+    bs = system.block_size
+    ild_names = [name for attr, name in DIVERSITY_MODALITIES.items() if getattr(catalog, attr) is not None]
+    info = self_information(catalog)
+    totals = {c: _Totals(k_values, N, ild_names) for c in combos}
+
+    for start in range(0, len(qidxs), bs):
+        chunk = qidxs[start:start + bs]
+        with stage("sweep_score"):
+            raw = [cosine_scores_batch(chunk, getattr(catalog, attr)) for attr in MODALITIES]
+        norm = []
+        if "late_fusion" in fusions:
+            with stage("sweep_normalize"):
+                # early fusion still needs the raw blocks
+                norm = [_minmax_norm_rows(S.copy() if "early_fusion" in fusions else S, chunk) for S in raw]
+        out, tmp = np.empty_like(raw[0]), np.empty_like(raw[0])
+
+        for f, i in combos:
+            w = weights[i]
+            with stage("sweep_fuse"):
+                if f == "late_fusion":
+                    F = _fuse_late(norm, w, out, tmp)
+                else:
+                    F = _fuse_early(catalog, raw, chunk, w, out, tmp)
+            with stage("sweep_topk"):
+                idx, _ = topk(F, maxK + n_dead, exclude=chunk)
+                if n_dead:
+                    keep = np.argsort(tomb[idx], axis=1, kind="stable")[:, :maxK]
+                    idx = np.take_along_axis(idx, keep, axis=1)
+            with stage("sweep_metrics"):
+                _accumulate(totals[(f, i)], catalog, gi, info, chunk, idx, k_values, diversity_max_k)
+
+        print(f"[weight sweep] processed {min(start + bs, len(qidxs))}/{len(qidxs)} queries")
+    for t in totals.values():
+        t.num_queries = len(qidxs)
+    return totals
+
+def _metric_rows(
+    totals: Dict[Tuple[str, int], _Totals],
+    weights: Sequence[Weights],
+    k_values: List[int],
+    N: int,
+    diversity_max_k: Optional[int],
+) -> List[dict]:
+    rows = []
+    for (f, i), t in totals.items():
+        Q = t.num_queries
+        wL, wA, wV = weights[i]
+        for k in k_values:
+            pop_sum, pop_n = t.pop[k]
+            nov_sum, nov_n = t.novelty[k]
+            ild_ok = Q and 2 <= k <= t.width and (diversity_max_k is None or k <= diversity_max_k)
+            rows.append({
+                "algo": f,
+                "w_lyrics": wL,
+                "w_audio": wA,
+                "w_video": wV,
+                "k": k,
+                **{m: (v / Q if Q else 0.0) for m, v in t.acc[k].items()},
+                "coverage": int(np.count_nonzero(t.exposure[k])) / max(N, 1),
+                "gini": gini(t.exposure[k]),
+                "pop": (pop_sum / pop_n if pop_n else None),
+                "novelty": (nov_sum / nov_n if nov_n else None),
+                **{f"ild_{name}": (v / Q if ild_ok else None) for name, v in t.ild[k].items()},
+                "num_queries": Q,
+            })
+    return rows
+
+def _add_means(sums: Dict[int, list], vals: np.ndarray, k_values: List[int]) -> None:
+    for k, per_query in per_query_means(vals, k_values).items():
+        known = per_query[~np.isnan(per_query)]
+        sums[k][0] += float(known.sum())
+        sums[k][1] += len(known)
+
+def _accumulate(
+    t: _Totals, catalog, gi, info: Optional[np.ndarray], chunk: np.ndarray, idx: np.ndarray,
+    k_values: List[int], diversity_max_k: Optional[int],
+) -> None:
+    t.width = max(t.width, idx.shape[1])
+    rels = gi.relevance_matrix(chunk, idx)
+    acc = accuracy_metrics_matrix(rels, gi.total_relevant[chunk], k_values)
+    for k in k_values:
+        for m, v in acc[k].items():
+            t.acc[k][m] += float(v.sum())
+        t.exposure[k] += exposure_counts(idx, k, len(t.exposure[k])).astype(np.int32)
+    if catalog.popularity is not None:
+        _add_means(t.pop, catalog.popularity[idx], k_values)
+        _add_means(t.novelty, info[idx], k_values)
+    div_ks = [k for k in k_values if diversity_max_k is None or k <= diversity_max_k]
+    for attr, name in DIVERSITY_MODALITIES.items():
+        if name in t.ild[k_values[0]]:
+            for k, per_query in intra_list_diversity(getattr(catalog, attr), idx, div_ks).items():
+                t.ild[k][name] += float(per_query.sum())
@@ -0,0 +1,195 @@
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+
+from .catalog import Catalog
+from .features import load_feature_parts
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+IDS_FILE = "ids.txt"
+
+# catalog attribute -> source TSV(s) relative to the retrieval data dir, as
+# shipped: the large matrices are split by rows across part files. The UI and
+# the scripts share one store, so they must use the same lists.
+DEFAULT_SOURCES: Dict[str, List[str]] = {
+    "X_lyrics": ["id_lyrics_bert_mmsr_part1.tsv", "id_lyrics_bert_mmsr_part2.tsv"],
+    "X_audio": ["id_mfcc_bow_mmsr.tsv"],
+    "X_video": [f"id_vgg19_mmsr_part{i}.tsv" for i in range(1, 6)],
+}
+
+def ids_fingerprint(ids: List[str]) -> str:
+    h = hashlib.sha1()
+    for tid in ids:
+        h.update(tid.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+def source_fingerprint(path: Path) -> Optional[Dict]:
+    """
+    Name, size and mtime of a source file (None if it is absent), recorded by
+    derived files (feature store, catalog snapshot) to detect stale copies.
+    """
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return {"path": str(path.name), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def _read_manifest(store_dir: Path) -> Dict:
+    path = store_dir / MANIFEST
+    if not path.exists():
+        return {"ids_sha1": None, "modalities": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_atomic(path: Path, write_fn) -> None:
+    """
+    write_fn(tmp) to a temporary file next to `path`, then rename it over
+    `path`, so readers never see a partial file.
+    """
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    write_fn(tmp)
+    os.replace(tmp, path)
+
+def _write_manifest(store_dir: Path, manifest: Dict) -> None:
+    def write(tmp: Path):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    write_atomic(store_dir / MANIFEST, write)
+
+def _write_ids(store_dir: Path, ids: List[str]) -> None:
+    def write(tmp: Path):
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(ids))
+    write_atomic(store_dir / IDS_FILE, write)
+
+def _is_fresh(entry: Optional[Dict], ids_sha1: str, manifest: Dict, sources: Sequence[Path]) -> bool:
+    """
+    A stored matrix is reusable if it was built for the same catalog id order
+    and none of its source TSVs changed. Sources that are absent on this host
+    (store shipped without the TSVs) are not held against the store.
+    """
+    if entry is None or manifest.get("ids_sha1") != ids_sha1:
+        return False
+    stored = entry.get("sources", [])
+    if len(stored) != len(sources):
+        return False
+    for old, path in zip(stored, sources):
+        new = source_fingerprint(path)
+        if new is not None and new != old:
+            return False
+    return True
+
+def store_file(catalog: Catalog, attr: str) -> Optional[Path]:
+    """
+    The feature store .npy that catalog.<attr> is still the read-only memmap
+    of (see attach_features), or None once it was replaced or updated.
+    """
+    X = getattr(catalog, attr)
+    source = (catalog.feature_sources or {}).get(attr)
+    if (
+        source is None
+        or not isinstance(X, np.memmap)
+        or X.flags.writeable
+        or not X.flags.c_contiguous
+        or list(X.shape) != source["shape"]
+        or Path(X.filename).resolve() != Path(source["file"])
+    ):
+        return None
+    return Path(source["file"])
+
+def _load_normalized(name: str, sources: Sequence[Path], id_to_idx: Dict[str, int]) -> np.ndarray:
+    X, report = load_feature_parts(sources, id_to_idx)
+    logger.info("%s: %s", name, report.summary())
+    if report.duplicate_ids:
+        logger.warning("%s: duplicate ids kept from the first part, e.g. %s", name, report.duplicate_ids[:5])
+    return X
+
+def build_feature(store_dir: Path, name: str, sources: Sequence[Path], ids: List[str], id_to_idx: Dict[str, int]) -> None:
+    """
+    Parse the source TSV(s) once, L2-normalize and write <name>.npy (float32,
+    rows aligned with `ids`). Updates the manifest entry for `name`.
+    """
+    store_dir.mkdir(parents=True, exist_ok=True)
+    missing = [str(p) for p in sources if not p.exists()]
+    if missing:
+        raise FileNotFoundError(f"cannot build feature '{name}', missing sources: {missing}")
+
+    X = _load_normalized(name, sources, id_to_idx)
+    def write(tmp: Path):
+        with open(tmp, "wb") as f:
+            np.save(f, X)
+    write_atomic(store_dir / f"{name}.npy", write)
+
+    ids_sha1 = ids_fingerprint(ids)
+    manifest = _read_manifest(store_dir)
+    if manifest.get("ids_sha1") != ids_sha1:
+        # id order changed: every other stored matrix is misaligned now
+        manifest = {"ids_sha1": ids_sha1, "modalities": {}}
+        _write_ids(store_dir, ids)
+    manifest["n"] = len(ids)
+    manifest["modalities"][name] = {
+        "file": f"{name}.npy",
+        "shape": list(X.shape),
+        "dtype": "float32",
+        "sources": [source_fingerprint(p) for p in sources],
+    }
+    _write_manifest(store_dir, manifest)
+
+def open_feature(store_dir: Path, name: str, sources: Sequence[Path], ids: List[str], id_to_idx: Dict[str, int]) -> np.ndarray:
+    """
+    Returns the L2-normalized float32 matrix for `name` as a read-only memmap,
+    (re)building it first if it is missing or stale.
+    """
+    ids_sha1 = ids_fingerprint(ids)
+    manifest = _read_manifest(store_dir)
+    entry = manifest["modalities"].get(name)
+    if not _is_fresh(entry, ids_sha1, manifest, sources):
+        build_feature(store_dir, name, sources, ids, id_to_idx)
+        manifest = _read_manifest(store_dir)
+        entry = manifest["modalities"][name]
+
+    X = np.load(store_dir / entry["file"], mmap_mode="r")
+    if X.shape[0] != len(ids):
+        raise ValueError(f"feature store '{name}' has {X.shape[0]} rows, catalog has {len(ids)}")
+    return X
+
+def attach_features(
+    catalog: Catalog,
+    data_dir: Path,
+    store_dir: Optional[Path] = None,
+    sources: Optional[Dict[str, Sequence[str]]] = None,
+) -> Catalog:
+    """
+    Sets catalog.X_lyrics / X_audio / X_video from the feature store under
+    `store_dir` (default: <data_dir>/feature_store). Matrices are memory-mapped,
+    so processes on the same host share their pages. Their manifest entries
+    are recorded in catalog.feature_sources.
+    """
+    store_dir = store_dir if store_dir is not None else data_dir / "feature_store"
+    sources = sources if sources is not None else DEFAULT_SOURCES
+    for attr, files in sources.items():
+        paths = [data_dir / f for f in files]
+        setattr(catalog, attr, open_feature(store_dir, attr, paths, catalog.ids, catalog.id_to_idx))
+
+    # what each matrix was built from, so checkpoint.catalog_fingerprint need not hash it
+    manifest = _read_manifest(store_dir)
+    if catalog.feature_sources is None:
+        catalog.feature_sources = {}
+    for attr in sources:
+        entry = manifest["modalities"][attr]
+        catalog.feature_sources[attr] = {
+            "file": str((store_dir / entry["file"]).resolve()),
+            "shape": entry["shape"],
+            "ids_sha1": manifest["ids_sha1"],
+            "sources": entry["sources"],
+        }
+    return catalog
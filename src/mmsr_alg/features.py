@@ -1,21 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import sys
+import threading
+import time
 import numpy as np
 import pandas as pd
 
+try:
+    import resource
+except ImportError:          # not available on Windows
+    resource = None
+
 def l2_normalize(X: np.ndarray, eps: float = 1e-12) -> np.ndarray:
     norms = np.linalg.norm(X, axis=1, keepdims=True)
     return X / (norms + eps)
 
-def load_feature_matrix(path: Path, id_to_idx: dict) -> np.ndarray:
-    df = pd.read_csv(path, sep="\t")
-    if "id" not in df.columns:
-        raise ValueError(f"{path.name} must contain an 'id' column")
+def l2_normalize_(X: np.ndarray, eps: float = 1e-12, block: int = 65536) -> np.ndarray:
+    """
+    In-place l2_normalize, a block of rows at a time (no full-size temporaries).
+    """
+    for start in range(0, X.shape[0], block):
+        rows = X[start:start + block]
+        rows /= np.linalg.norm(rows, axis=1, keepdims=True) + eps
+    return X
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+@dataclass
+class LoadReport:
+    """
+    What load_feature_parts read. `duplicate_ids` appeared more than once
+    (the first occurrence, in part order, is kept); `missing_ids` are catalog
+    ids found in no part (zero rows); `unknown_rows` are rows whose id is not
+    in the catalog. peak_rss_mb is the process-wide peak resident set size.
+    """
+    rows_read: int = 0
+    unknown_rows: int = 0
+    duplicate_ids: List[str] = field(default_factory=list)
+    missing_ids: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+    peak_rss_mb: Optional[float] = None
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows_read / self.seconds if self.seconds > 0 else 0.0
 
-    feats = df.drop(columns=["id"]).to_numpy(dtype=np.float32)
-    X = np.zeros((len(id_to_idx), feats.shape[1]), dtype=np.float32)
+    def summary(self) -> str:
+        rss = "n/a" if self.peak_rss_mb is None else f"{self.peak_rss_mb:.0f} MB"
+        return (
+            f"{self.rows_read} rows in {self.seconds:.2f}s ({self.rows_per_s:,.0f} rows/s), "
+            f"peak RSS {rss}, {len(self.duplicate_ids)} duplicate ids, "
+            f"{len(self.missing_ids)} missing ids, {self.unknown_rows} unknown rows"
+        )
 
-    for i, tid in enumerate(df["id"].astype(str)):
-        if tid in id_to_idx:
-            X[id_to_idx[tid]] = feats[i]
+def _header(path: Path) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.readline().rstrip("\r\n").split("\t")
 
+def load_feature_parts(
+    paths: Sequence[Path],
+    id_to_idx: Dict[str, int],
+    normalize: bool = True,
+    workers: Optional[int] = None,
+    chunksize: int = 8192,
+) -> Tuple[np.ndarray, LoadReport]:
+    """
+    Load a feature matrix split by rows across TSV parts (id column + D value
+    columns each) into one preallocated (N, D) float32 matrix aligned with
+    `id_to_idx`. Parts are parsed concurrently, `chunksize` rows at a time, and
+    each chunk is scattered straight into the output, so peak memory is the
+    output plus a few chunks. Rows are L2-normalized in place if `normalize`.
+    """
+    t0 = time.perf_counter()
+    paths = [Path(p) for p in paths]
+    headers = [_header(p) for p in paths]
+    for p, h in zip(paths, headers):
+        if "id" not in h:
+            raise ValueError(f"{p.name} must contain an 'id' column")
+        if len(h) != len(headers[0]):
+            raise ValueError(f"{p.name} has {len(h) - 1} feature columns, {paths[0].name} has {len(headers[0]) - 1}")
+
+    ids = [""] * len(id_to_idx)
+    for tid, i in id_to_idx.items():
+        ids[i] = tid
+    catalog_ids = pd.Index(ids, dtype=object)
+    X = np.zeros((len(ids), len(headers[0]) - 1), dtype=np.float32)
+    # part that supplied each row (-1: none yet); the first part in `paths` wins
+    owner = np.full(len(ids), -1, dtype=np.int32)
+    duplicates: List[int] = []
+    report = LoadReport()
+    lock = threading.Lock()
+
+    def load_part(part: int) -> None:
+        reader = pd.read_csv(paths[part], sep="\t", dtype={"id": str}, chunksize=chunksize)
+        for chunk in reader:
+            pos = catalog_ids.get_indexer(chunk["id"])
+            values = chunk.drop(columns=["id"]).to_numpy(dtype=np.float32)
+            known = pos >= 0
+            pos, values = pos[known], values[known]
+            # first occurrence within the chunk
+            _, first = np.unique(pos, return_index=True)
+            dup_in_chunk = np.setdiff1d(np.arange(len(pos)), first)
+            with lock:
+                report.rows_read += len(chunk)
+                report.unknown_rows += int((~known).sum())
+                duplicates.extend(pos[dup_in_chunk].tolist())
+                pos, values = pos[first], values[first]
+                prev = owner[pos]
+                duplicates.extend(pos[prev >= 0].tolist())
+                take = (prev < 0) | (part < prev)
+                owner[pos[take]] = part
+                X[pos[take]] = values[take]
+
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for f in [pool.submit(load_part, i) for i in range(len(paths))]:
+            f.result()
+
+    if normalize:
+        l2_normalize_(X)
+    report.duplicate_ids = [ids[i] for i in sorted(set(duplicates))]
+    report.missing_ids = [ids[i] for i in np.flatnonzero(owner < 0)]
+    report.seconds = time.perf_counter() - t0
+    report.peak_rss_mb = peak_rss_mb()
+    return X, report
+
+def load_feature_matrix(path: Path, id_to_idx: dict) -> np.ndarray:
+    X, _ = load_feature_parts([path], id_to_idx, normalize=False)
     return X
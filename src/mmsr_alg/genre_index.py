@@ -0,0 +1,248 @@
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+
+from .buffers import grow_rows
+from .catalog import Catalog
+
+@dataclass
+class GenreIndex:
+    """
+    Compact genre representation of a catalog.
+
+    - vocab:    sorted genre names; a genre's code is its position
+    - indptr / codes: CSR multi-hot matrix, genres of track i are
+                codes[indptr[i]:indptr[i+1]]
+    - bits:     the same matrix as packed bitsets, (N, W) uint64
+    - total_relevant: per track, how many *other* tracks share a genre with it
+
+    Relevance (genre overlap) of any pair is one AND over W words.
+    """
+    vocab: List[str]
+    indptr: np.ndarray
+    codes: np.ndarray
+    bits: np.ndarray
+    total_relevant: np.ndarray
+    # over-allocated buffers for appends (buffers.grow_rows)
+    _buffers: Dict[str, np.ndarray] = field(default_factory=dict, repr=False)
+
+    def genres_of(self, i: int) -> List[str]:
+        return [self.vocab[c] for c in self.codes[self.indptr[i]:self.indptr[i + 1]]]
+
+    def relevance(self, qidx: int, idx: np.ndarray) -> np.ndarray:
+        """
+        Binary relevance (int8) of tracks `idx` for query `qidx`.
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        return (self.bits[idx] & self.bits[qidx]).any(axis=-1).astype(np.int8)
+
+    def relevance_matrix(self, qidxs: np.ndarray, idx: np.ndarray, block: int = 256) -> np.ndarray:
+        """
+        (Q, K) binary relevance of ranked lists idx (Q, K) for queries qidxs (Q,).
+        Padding entries (index -1, see lists_store) are not relevant.
+        """
+        qidxs = np.asarray(qidxs, dtype=np.int64)
+        idx = np.asarray(idx, dtype=np.int64)
+        out = np.empty(idx.shape, dtype=np.int8)
+        for start in range(0, len(qidxs), block):
+            q = self.bits[qidxs[start:start + block]][:, None, :]
+            rows = idx[start:start + block]
+            out[start:start + block] = (self.bits[rows] & q).any(axis=-1) & (rows >= 0)
+        return out
+
+    def _grow(self, name: str, X: np.ndarray, n: int) -> np.ndarray:
+        return grow_rows(self._buffers, name, X, n)
+
+    def set_rows(
+        self,
+        rows: Sequence[int],
+        genre_lists: Sequence[Optional[Iterable[str]]],
+        block: int = 64,
+        max_cells: int = 1 << 23,
+    ) -> None:
+        """
+        Replace the genres of tracks `rows` (indices >= the current size append
+        new tracks) and update total_relevant from the changed overlaps only,
+        O(len(rows) * N * W) instead of a rebuild. Tombstoned tracks are set to
+        no genres, so they stop counting as relevant for anyone.
+
+        Appends grow bits / total_relevant / the CSR through over-allocated
+        buffers; overlaps are counted in (rows, tracks) tiles of at most
+        `max_cells` bitset words.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        genre_lists = [sorted(set(g)) if g else [] for g in genre_lists]
+        N_old = len(self.indptr) - 1
+        N = max(N_old, int(rows.max()) + 1 if len(rows) else 0)
+
+        new_names = {g for gl in genre_lists for g in gl} - set(self.vocab)
+        if new_names:
+            # keep the vocabulary sorted: recode existing tracks, repack their bitsets
+            vocab = sorted(set(self.vocab) | new_names)
+            self.codes = np.searchsorted(vocab, self.vocab).astype(np.int32)[self.codes]
+            self.vocab = vocab
+            self.bits = _pack(self.indptr, self.codes, len(vocab))
+        if N > N_old:
+            self.bits = self._grow("bits", self.bits, N)
+            self.bits[N_old:] = 0
+            self.total_relevant = self._grow("total_relevant", self.total_relevant, N)
+            self.total_relevant[N_old:] = 0
+
+        code_of = {g: i for i, g in enumerate(self.vocab)}
+        lengths = np.array([len(gl) for gl in genre_lists], dtype=np.int64)
+        new_codes = np.fromiter((code_of[g] for gl in genre_lists for g in gl), dtype=np.int32, count=int(lengths.sum()))
+        sub_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        sub_indptr[1:] = np.cumsum(lengths)
+        self._set_csr(rows, lengths, new_codes, sub_indptr, N_old, N)
+
+        old_bits = self.bits[rows].copy()
+        new_bits = _pack(sub_indptr, new_codes, len(self.vocab))
+        self.bits[rows] = new_bits
+
+        # other tracks gain the overlaps with the new sets and lose those with the old ones
+        delta = np.zeros(N, dtype=np.int64)
+        totals = np.zeros(len(rows), dtype=np.int64)
+        W = self.bits.shape[1]
+        tile = max(1, max_cells // (block * W))
+        for start in range(0, len(rows), block):
+            nb, ob = new_bits[start:start + block, None, :], old_bits[start:start + block, None, :]
+            for lo in range(0, N, tile):
+                B = self.bits[None, lo:lo + tile, :]
+                gained = (B & nb).any(axis=-1)
+                lost = (B & ob).any(axis=-1)
+                delta[lo:lo + tile] += gained.sum(axis=0) - lost.sum(axis=0)
+                totals[start:start + block] += gained.sum(axis=1)
+        self.total_relevant += delta
+        self.total_relevant[rows] = totals - new_bits.any(axis=1)
+
+    def _set_csr(self, rows: np.ndarray, lengths: np.ndarray, new_codes: np.ndarray, sub_indptr: np.ndarray, N_old: int, N: int) -> None:
+        nnz = int(self.indptr[-1])
+        if N > N_old and np.array_equal(rows, np.arange(N_old, N)):
+            # plain append: new codes and offsets go after the existing ones
+            self.codes = self._grow("codes", self.codes, nnz + len(new_codes))
+            self.codes[nnz:] = new_codes
+            self.indptr = self._grow("indptr", self.indptr, N + 1)
+            self.indptr[N_old + 1:] = nnz + sub_indptr[1:]
+            return
+        # general case: rebuild the CSR without sorting, kept rows' codes
+        # copied to their shifted offsets and `rows`' new codes written in
+        old_len = np.zeros(N, dtype=np.int64)
+        old_len[:N_old] = np.diff(self.indptr)
+        new_len = old_len.copy()
+        new_len[rows] = lengths
+        indptr = np.zeros(N + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(new_len)
+        codes = np.empty(int(indptr[-1]), dtype=np.int32)
+
+        kept = np.ones(N_old, dtype=bool)
+        kept[rows[rows < N_old]] = False
+        keep_entry = np.repeat(kept, old_len[:N_old])
+        shift = np.repeat((indptr[:N_old] - self.indptr[:N_old])[kept], old_len[:N_old][kept])
+        codes[np.flatnonzero(keep_entry) + shift] = self.codes[:nnz][keep_entry]
+        codes[np.repeat(indptr[rows] - sub_indptr[:-1], lengths) + np.arange(len(new_codes))] = new_codes
+        self.codes, self.indptr = codes, indptr
+
+def _pack(indptr: np.ndarray, codes: np.ndarray, n_genres: int) -> np.ndarray:
+    N = len(indptr) - 1
+    W = max(1, (n_genres + 63) // 64)
+    bits = np.zeros((N, W), dtype=np.uint64)
+    rows = np.repeat(np.arange(N), np.diff(indptr))
+    np.bitwise_or.at(bits, (rows, codes // 64), np.left_shift(np.uint64(1), (codes % 64).astype(np.uint64)))
+    return bits
+
+def _total_relevant(bits: np.ndarray, indptr: np.ndarray, codes: np.ndarray, max_pairs: int = 1 << 24, max_cells: int = 1 << 24) -> np.ndarray:
+    """
+    For every track, the number of other tracks sharing at least one genre:
+    the row counts of the boolean product M M^T of the multi-hot matrix,
+    computed over the distinct genre sets (weighted by their multiplicity)
+    from per-genre posting lists, in blocks of about `max_pairs` candidate
+    pairs and at most `max_cells` (sets x distinct sets) marker cells, of
+    which only the touched ones are read. The work follows the posting-list
+    pairs instead of all U^2 set pairs times W.
+    """
+    uniq, first, inverse, counts = np.unique(bits, axis=0, return_index=True, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    U = len(uniq)
+
+    # CSR of the distinct sets (via a representative track each) ...
+    set_len = (indptr[first + 1] - indptr[first]).astype(np.int64)
+    set_indptr = np.zeros(U + 1, dtype=np.int64)
+    set_indptr[1:] = np.cumsum(set_len)
+    set_codes = codes[np.repeat(indptr[first] - set_indptr[:-1], set_len) + np.arange(set_indptr[-1])]
+    # ... and its transpose: posting list of distinct sets per genre
+    set_of = np.repeat(np.arange(U), set_len)
+    order = np.argsort(set_codes, kind="stable")
+    postings = set_of[order]
+    n_genres = int(set_codes.max()) + 1 if len(set_codes) else 0
+    post_len = np.bincount(set_codes, minlength=n_genres).astype(np.int64)
+    post_start = np.concatenate([[0], np.cumsum(post_len)[:-1]]).astype(np.int64)
+
+    # candidate pairs per set = summed posting lengths of its genres
+    entry_pairs = post_len[set_codes] if len(set_codes) else np.zeros(0, dtype=np.int64)
+    set_pairs = np.bincount(set_of, weights=entry_pairs, minlength=U).astype(np.int64)
+    cum = np.cumsum(set_pairs)
+
+    total_u = np.zeros(U, dtype=np.int64)
+    lo = 0
+    while lo < U:
+        # at least one set per block
+        base = cum[lo - 1] if lo else 0
+        hi = int(np.searchsorted(cum, base + max_pairs, side="right"))
+        hi = max(lo + 1, min(hi, lo + max(1, max_cells // U)))
+        e0, e1 = set_indptr[lo], set_indptr[hi]
+        lens = entry_pairs[e0:e1]
+        ends = np.cumsum(lens)
+        pos = np.arange(int(ends[-1]) if len(ends) else 0) - np.repeat(ends - lens - post_start[set_codes[e0:e1]], lens)
+        local = np.repeat(set_of[e0:e1] - lo, lens)
+        other = postings[pos]
+        # keep one entry per distinct (set, other set) pair: the last writer of
+        # its marker cell; other sets are weighted by their multiplicity
+        marker = np.empty((hi - lo, U), dtype=np.int32)
+        marker[local, other] = np.arange(len(pos), dtype=np.int32)
+        once = marker[local, other] == np.arange(len(pos))
+        total_u[lo:hi] = np.bincount(local[once], weights=counts[other[once]], minlength=hi - lo).astype(np.int64)
+        lo = hi
+
+    has_genre = bits.any(axis=1)
+    # a track with genres overlaps itself; it is not relevant to itself
+    return total_u[inverse] - has_genre.astype(np.int64)
+
+def build_genre_index(genre_lists: Iterable[Optional[Iterable[str]]]) -> GenreIndex:
+    genre_lists = [sorted(set(g)) if g else [] for g in genre_lists]
+    vocab = sorted({g for gl in genre_lists for g in gl})
+    code_of = {g: i for i, g in enumerate(vocab)}
+
+    indptr = np.zeros(len(genre_lists) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(gl) for gl in genre_lists])
+    codes = np.fromiter((code_of[g] for gl in genre_lists for g in gl), dtype=np.int32, count=int(indptr[-1]))
+    return genre_index_from_csr(vocab, indptr, codes)
+
+def genre_index_from_csr(
+    vocab: List[str],
+    indptr: np.ndarray,
+    codes: np.ndarray,
+    total_relevant: Optional[np.ndarray] = None,
+) -> GenreIndex:
+    """
+    GenreIndex from its CSR form (codes sorted and unique per track, into the
+    sorted `vocab`), e.g. as stored in a catalog snapshot. total_relevant is
+    computed unless given.
+    """
+    bits = _pack(indptr, codes, len(vocab))
+    return GenreIndex(
+        vocab=list(vocab),
+        indptr=indptr,
+        codes=codes,
+        bits=bits,
+        total_relevant=_total_relevant(bits, indptr, codes) if total_relevant is None else total_relevant,
+    )
+
+def genre_index_for(catalog: Catalog) -> GenreIndex:
+    """
+    catalog.genre_index, built from catalog.genres on first use if needed.
+    """
+    if catalog.genre_index is None:
+        catalog.genre_index = build_genre_index(catalog.genres if catalog.genres is not None else [set()] * len(catalog.ids))
+    return catalog.genre_index
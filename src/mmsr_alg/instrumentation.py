@@ -0,0 +1,240 @@
+
+from __future__ import annotations
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+import cProfile
+import json
+import random
+import threading
+import time
+
+# latency histogram bucket upper bounds, seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# (instrumentation, algo) the stage() / count() / alloc() hooks record into;
+# per thread / task, unset unless a RetrievalSystem with instrumentation is running
+_CURRENT: ContextVar[Optional[Tuple["Instrumentation", str]]] = ContextVar("mmsr_instrumentation", default=None)
+
+class _Noop:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _Noop()
+
+class _Timer:
+    __slots__ = ("inst", "algo", "name", "t0")
+
+    def __init__(self, inst: "Instrumentation", algo: str, name: str):
+        self.inst, self.algo, self.name = inst, algo, name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.inst.observe(self.algo, self.name, time.perf_counter() - self.t0)
+        return False
+
+class _Active:
+    __slots__ = ("value", "token")
+
+    def __init__(self, value: Tuple["Instrumentation", str]):
+        self.value = value
+
+    def __enter__(self):
+        self.token = _CURRENT.set(self.value)
+        return self.value[0]
+
+    def __exit__(self, *exc):
+        _CURRENT.reset(self.token)
+        return False
+
+# ---- hooks for the hot path: no-ops unless instrumentation is active ----
+
+def stage(name: str):
+    """
+    Context manager timing a stage of the current algorithm's query.
+    """
+    cur = _CURRENT.get()
+    return _NOOP if cur is None else _Timer(cur[0], cur[1], name)
+
+def count(name: str, n: int = 1) -> None:
+    cur = _CURRENT.get()
+    if cur is not None:
+        cur[0].add(cur[1], name, n)
+
+def alloc(name: str, nbytes: int) -> None:
+    """
+    Records a buffer of `nbytes` allocated by stage `name` (e.g. a score block).
+    """
+    cur = _CURRENT.get()
+    if cur is not None:
+        cur[0].add_alloc(cur[1], name, nbytes)
+
+def activate(inst: Optional["Instrumentation"], algo: str):
+    """
+    Route the hooks above to `inst`, labelled with `algo`, inside a with block.
+    """
+    return _NOOP if inst is None else _Active((inst, algo))
+
+class Instrumentation:
+    """
+    Per-algorithm stage timers (latency histograms), counters and allocation
+    sizes, filled by the stage() / count() / alloc() hooks along the query path.
+
+    Export with snapshot() (JSON-ready dict) or prometheus() (text exposition
+    format). With `profile_slow_ms`, a `profile_sample` fraction of queries
+    runs under cProfile and the stats of those slower than the threshold are
+    dumped to `profile_dir` (at most `max_profiles` files).
+
+    A RetrievalSystem without instrumentation never activates the hooks, so
+    they cost one context-variable lookup each.
+    """
+
+    def __init__(
+        self,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+        profile_slow_ms: Optional[float] = None,
+        profile_sample: float = 0.01,
+        profile_dir: Path = Path("outputs/profiles"),
+        max_profiles: int = 50,
+    ):
+        self.buckets = tuple(buckets)
+        self.profile_slow_ms = profile_slow_ms
+        self.profile_sample = profile_sample
+        self.profile_dir = Path(profile_dir)
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            # (algo, stage) -> [count, sum_s, max_s, bucket counts...]
+            self.timers: Dict[Tuple[str, str], list] = {}
+            self.counters: Dict[Tuple[str, str], int] = {}
+            # (algo, stage) -> [allocations, total bytes, max bytes]
+            self.allocs: Dict[Tuple[str, str], list] = {}
+            self.profiles_written = 0
+
+    # ---- recording ----
+
+    def observe(self, algo: str, name: str, seconds: float) -> None:
+        with self._lock:
+            t = self.timers.get((algo, name))
+            if t is None:
+                t = self.timers[(algo, name)] = [0, 0.0, 0.0] + [0] * (len(self.buckets) + 1)
+            t[0] += 1
+            t[1] += seconds
+            if seconds > t[2]:
+                t[2] = seconds
+            t[3 + bisect_left(self.buckets, seconds)] += 1
+
+    def add(self, algo: str, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[(algo, name)] = self.counters.get((algo, name), 0) + n
+
+    def add_alloc(self, algo: str, name: str, nbytes: int) -> None:
+        with self._lock:
+            a = self.allocs.get((algo, name))
+            if a is None:
+                a = self.allocs[(algo, name)] = [0, 0, 0]
+            a[0] += 1
+            a[1] += nbytes
+            if nbytes > a[2]:
+                a[2] = nbytes
+
+    def run(self, algo: str, name: str, fn: Callable, *args) -> Any:
+        """
+        fn(*args) with the hooks active, timed as stage `name` and counted;
+        sampled for the slow-query profiler if enabled.
+        """
+        with _Active((self, algo)):
+            self.add(algo, name)
+            if self.profile_slow_ms is None or random.random() >= self.profile_sample:
+                with _Timer(self, algo, name):
+                    return fn(*args)
+            prof = cProfile.Profile()
+            t0 = time.perf_counter()
+            try:
+                return prof.runcall(fn, *args)
+            finally:
+                elapsed = time.perf_counter() - t0
+                self.observe(algo, name, elapsed)
+                if elapsed * 1e3 >= self.profile_slow_ms:
+                    self._dump(prof, algo, name, elapsed)
+
+    def _dump(self, prof: cProfile.Profile, algo: str, name: str, elapsed: float) -> None:
+        with self._lock:
+            if self.profiles_written >= self.max_profiles:
+                return
+            self.profiles_written += 1
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        prof.dump_stats(self.profile_dir / f"{algo}-{name}-{stamp}-{elapsed * 1e3:.0f}ms-{threading.get_ident()}.prof")
+        self.add(algo, "slow_profiles")
+
+    # ---- export ----
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        {algo: {"stages": {stage: {count, total_s, mean_ms, max_ms}},
+                "counters": {name: n},
+                "alloc": {stage: {count, total_bytes, max_bytes}}}}
+        """
+        out: Dict[str, Any] = {}
+        with self._lock:
+            for (algo, name), t in self.timers.items():
+                out.setdefault(algo, {}).setdefault("stages", {})[name] = {
+                    "count": t[0],
+                    "total_s": t[1],
+                    "mean_ms": t[1] / t[0] * 1e3 if t[0] else 0.0,
+                    "max_ms": t[2] * 1e3,
+                }
+            for (algo, name), n in self.counters.items():
+                out.setdefault(algo, {}).setdefault("counters", {})[name] = n
+            for (algo, name), a in self.allocs.items():
+                out.setdefault(algo, {}).setdefault("alloc", {})[name] = {
+                    "count": a[0], "total_bytes": a[1], "max_bytes": a[2],
+                }
+        return out
+
+    def to_json(self, path: Optional[Path] = None) -> str:
+        text = json.dumps(self.snapshot(), indent=2, sort_keys=True)
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            Path(path).write_text(text, encoding="utf-8")
+        return text
+
+    def prometheus(self, prefix: str = "mmsr") -> str:
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent per query stage.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        with self._lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+            allocs = sorted(self.allocs.items())
+        for (algo, name), t in timers:
+            labels = f'algo="{algo}",stage="{name}"'
+            cum = 0
+            for le, n in zip(self.buckets + (float("inf"),), t[3:]):
+                cum += n
+                lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{"+Inf" if le == float("inf") else le}"}} {cum}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {t[1]}")
+            lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {t[0]}")
+
+        lines += [f"# HELP {prefix}_events_total Counted events per algorithm.", f"# TYPE {prefix}_events_total counter"]
+        for (algo, name), n in counters:
+            lines.append(f'{prefix}_events_total{{algo="{algo}",event="{name}"}} {n}')
+
+        lines += [f"# HELP {prefix}_alloc_bytes_total Bytes of score buffers allocated per stage.", f"# TYPE {prefix}_alloc_bytes_total counter"]
+        for (algo, name), a in allocs:
+            lines.append(f'{prefix}_alloc_bytes_total{{algo="{algo}",stage="{name}"}} {a[1]}')
+        return "\n".join(lines) + "\n"
@@ -1,16 +1,33 @@
 
 from pathlib import Path
+from typing import List
 import ast
+import re
 import pandas as pd
 import numpy as np
 from .catalog import Catalog
+from .snapshot import SNAPSHOT_FILE, CatalogSnapshot, read_snapshot, snapshot_from_frame, write_snapshot
+
+SOURCE_FILES = ("id_information_mmsr.tsv", "id_genres_mmsr.tsv", "id_url_mmsr.tsv", "id_metadata_mmsr.tsv")
 
 def _read_tsv_str(path: Path) -> pd.DataFrame:
     return pd.read_csv(path, sep="\t", dtype=str)
 
-def _parse_genre(cell: str):
-    if cell is None or cell == "" or str(cell).lower() == "nan":
+# a quoted string without escapes: 'a b' or "a'b"
+_QUOTED = r"'([^'\\]*)'" + r'|"([^"\\]*)"'
+_QUOTED_RE = re.compile(_QUOTED)
+_LIST_RE = re.compile(rf"\[\s*(?:(?:{_QUOTED})\s*(?:,\s*(?:{_QUOTED})\s*)*,?\s*)?\]")
+
+def parse_genre_list(cell) -> List[str]:
+    """
+    Parses a genre cell written as a Python list of strings ("['rock', "children's music"]").
+    Cells with escapes or non-string items go through ast.literal_eval;
+    anything that is not a list gives [].
+    """
+    if not isinstance(cell, str):
         return []
+    if _LIST_RE.fullmatch(cell.strip()):
+        return [(a or b).strip() for a, b in _QUOTED_RE.findall(cell)]
     try:
         val = ast.literal_eval(cell)
         if isinstance(val, list):
@@ -19,12 +36,12 @@ def _parse_genre(cell: str):
         pass
     return []
 
-def load_catalog(retrieval_dir: Path) -> Catalog:
+def _merge_tracks(retrieval_dir: Path) -> pd.DataFrame:
     info = _read_tsv_str(retrieval_dir / "id_information_mmsr.tsv")
     genres = _read_tsv_str(retrieval_dir / "id_genres_mmsr.tsv")
     urls = _read_tsv_str(retrieval_dir / "id_url_mmsr.tsv")
 
-    genres["genre_list"] = genres["genre"].apply(_parse_genre)
+    genres["genre_list"] = [parse_genre_list(c) for c in genres["genre"]]
 
     tracks = (
         info
@@ -43,20 +60,37 @@ def load_catalog(retrieval_dir: Path) -> Catalog:
             meta["popularity"] = pd.to_numeric(meta["popularity"], errors="coerce")
             tracks = tracks.merge(meta, on="id", how="left")
 
-    tracks = tracks.drop_duplicates(subset=["id"]).reset_index(drop=True)
+    return tracks.drop_duplicates(subset=["id"]).reset_index(drop=True)
+
+def load_snapshot(retrieval_dir: Path, rebuild: bool = False) -> CatalogSnapshot:
+    """
+    Columnar snapshot of the merged track table (<retrieval_dir>/catalog_snapshot.npz),
+    re-parsed from the TSVs and rewritten when missing or older than them.
+    """
+    path = retrieval_dir / SNAPSHOT_FILE
+    sources = [retrieval_dir / f for f in SOURCE_FILES]
+    snap = None if rebuild else read_snapshot(path, sources)
+    if snap is None:
+        snap = snapshot_from_frame(_merge_tracks(retrieval_dir))
+        try:
+            write_snapshot(path, snap, sources)
+        except OSError:
+            pass     # read-only data dir: parse again next time
+    return snap
+
+def load_catalog(retrieval_dir: Path) -> Catalog:
+    snap = load_snapshot(retrieval_dir)
+    genre_lists = snap.genre_lists()
+    tracks = snap.frame(genre_lists)
 
     ids = tracks["id"].astype(str).tolist()
     id_to_idx = {tid: i for i, tid in enumerate(ids)}
-    genre_sets = [set(g) if isinstance(g, list) else set() for g in tracks["genre_list"]]
-
-    popularity = None
-    if "popularity" in tracks.columns:
-        popularity = tracks["popularity"].to_numpy(dtype=float)
 
     return Catalog(
         tracks=tracks,
         ids=ids,
         id_to_idx=id_to_idx,
-        genres=genre_sets,
-        popularity=popularity
+        genres=[set(g) for g in genre_lists],
+        popularity=None if snap.popularity is None else snap.popularity.copy(),
+        genre_index=snap.genre_index(),
         )
@@ -0,0 +1,90 @@
+
+from __future__ import annotations
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+
+# (artist or None, album or None) -> track ids
+Key = Tuple[Optional[str], Optional[str]]
+
+@dataclass
+class MetadataIndex:
+    """
+    Artist -> album -> track hierarchy for cascading selectors, built once.
+
+    - artists / albums: sorted unique names
+    - albums_by_artist: sorted albums of each artist
+    - tracks: track ids for every (artist, album) selection, None meaning
+              "any"; ids are sorted by label
+    - labels: display label per track id, unique across the catalog
+    """
+    artists: List[str]
+    albums: List[str]
+    albums_by_artist: Dict[str, List[str]]
+    tracks: Dict[Key, List[str]]
+    labels: Dict[str, str]
+
+    def albums_for(self, artist: Optional[str] = None) -> List[str]:
+        return self.albums if artist is None else self.albums_by_artist.get(artist, [])
+
+    def tracks_for(self, artist: Optional[str] = None, album: Optional[str] = None) -> List[str]:
+        return self.tracks.get((artist, album), [])
+
+    def label(self, track_id: str) -> str:
+        return self.labels[track_id]
+
+def _text(value) -> Optional[str]:
+    return value if isinstance(value, str) else None
+
+def _label_levels(tid: str, song: str, artist: Optional[str], album: Optional[str]) -> Tuple[str, ...]:
+    by = f"{song} — {artist}" if artist else song
+    on = f"{by} ({album})" if album else by
+    return song, by, on, f"{on} [{tid}]"
+
+def _labels(rows: List[Tuple[str, str, Optional[str], Optional[str]]]) -> Dict[str, str]:
+    # the song title, widened with artist, album, then id until it is unique
+    levels = {row[0]: _label_levels(*row) for row in rows}
+    labels: Dict[str, str] = {}
+    used = set()
+    pending = list(levels)
+    for lvl in range(4):
+        counts = Counter(levels[tid][lvl] for tid in pending)
+        still = []
+        for tid in pending:
+            text = levels[tid][lvl]
+            if lvl == 3 or (counts[text] == 1 and text not in used):
+                labels[tid] = text
+                used.add(text)
+            else:
+                still.append(tid)
+        pending = still
+    return labels
+
+def build_metadata_index(tracks: pd.DataFrame) -> MetadataIndex:
+    """
+    Index over a track table with id / artist / album_name / song columns
+    (e.g. catalog.tracks). Tracks without a song title are left out.
+    """
+    rows = [
+        (str(tid), song, _text(artist), _text(album))
+        for tid, artist, album, song in zip(tracks["id"], tracks["artist"], tracks["album_name"], tracks["song"])
+        if isinstance(song, str)
+    ]
+    labels = _labels(rows)
+
+    groups: Dict[Key, List[str]] = defaultdict(list)
+    albums_by_artist: Dict[str, set] = defaultdict(set)
+    for tid, _, artist, album in rows:
+        for key in {(None, None), (artist, None), (None, album), (artist, album)}:
+            groups[key].append(tid)
+        if artist is not None and album is not None:
+            albums_by_artist[artist].add(album)
+
+    return MetadataIndex(
+        artists=sorted(a for a in {artist for _, _, artist, _ in rows} if a is not None),
+        albums=sorted(a for a in {album for _, _, _, album in rows} if a is not None),
+        albums_by_artist={a: sorted(albums) for a, albums in albums_by_artist.items()},
+        tracks={key: sorted(ids, key=labels.__getitem__) for key, ids in groups.items()},
+        labels=labels,
+    )
@@ -0,0 +1,167 @@
+
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+import numpy as np
+
+from ..features import l2_normalize
+from .cosine import topk_cosine
+from .topk import topk
+
+# algorithm name -> catalog matrix an ANN index for it is built over
+ANN_MATRICES = {
+    "lyrics": "X_lyrics",
+    "audio": "X_audio",
+    "video": "X_video",
+    "early_fusion": "X_early",
+}
+
+@dataclass
+class IVFIndex:
+    """
+    Inverted-file index for cosine similarity over an L2-normalized matrix.
+
+    Rows are bucketed by their nearest coarse centroid (spherical k-means).
+    A query scores the centroids, visits the `nprobe` best buckets and ranks
+    only the rows stored there exactly. Only row indices are kept; vectors
+    are read from the catalog matrix the index was built over.
+    """
+    centroids: np.ndarray   # (nlist, D) float32, L2-normalized
+    order: np.ndarray       # (N,) row indices grouped by bucket
+    offsets: np.ndarray     # (nlist + 1,) bucket b is order[offsets[b]:offsets[b+1]]
+    nprobe: int = 8
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def candidates(self, q: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        lists, _ = topk(self.centroids @ q, nprobe)
+        cand = np.concatenate([self.order[self.offsets[b]:self.offsets[b + 1]] for b in lists])
+        # catalog order, so score ties break by index like exact search
+        return np.sort(cand)
+
+    def search(
+        self,
+        X: np.ndarray,
+        qidx: int,
+        k: int,
+        nprobe: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k cosine neighbours of row `qidx` of X (query excluded).
+        """
+        q = X[qidx]
+        cand = self.candidates(q, nprobe)
+        scores = X[cand] @ q
+        pos, vals = topk(scores, k, exclude=np.flatnonzero(cand == qidx))
+        return cand[pos], vals
+
+    def reassign(self, X: np.ndarray, rows: np.ndarray) -> None:
+        """
+        Re-bucket rows of X that were appended or changed, keeping the trained
+        centroids. Cheap next to a rebuild, but recall drifts as the catalog
+        moves away from the data the centroids were trained on.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        labels = np.full(X.shape[0], -1, dtype=np.int64)
+        labels[self.order] = np.repeat(np.arange(self.nlist), np.diff(self.offsets))
+        labels[rows] = _assign(np.asarray(X[rows], dtype=np.float32), self.centroids)
+        self.order = np.argsort(labels, kind="stable")
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(np.bincount(labels, minlength=self.nlist))
+
+def _assign(X: np.ndarray, C: np.ndarray, block: int = 4096) -> np.ndarray:
+    out = np.empty(X.shape[0], dtype=np.int64)
+    for start in range(0, X.shape[0], block):
+        out[start:start + block] = np.argmax(X[start:start + block] @ C.T, axis=1)
+    return out
+
+def _spherical_kmeans(X: np.ndarray, nlist: int, n_iter: int, rng: np.random.Generator) -> np.ndarray:
+    C = X[rng.choice(X.shape[0], nlist, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(X, C)
+        order = np.argsort(assign, kind="stable")
+        buckets, starts = np.unique(assign[order], return_index=True)
+        sums = np.add.reduceat(X[order], starts, axis=0)
+
+        C_new = X[rng.choice(X.shape[0], nlist, replace=False)].copy()   # re-seeds empty buckets
+        C_new[buckets] = sums
+        C = l2_normalize(C_new).astype(np.float32, copy=False)
+    return C
+
+def build_ivf(
+    X: np.ndarray,
+    nlist: Optional[int] = None,
+    n_iter: int = 10,
+    sample_size: Optional[int] = None,
+    nprobe: int = 8,
+    seed: int = 0,
+) -> IVFIndex:
+    """
+    Train the coarse quantizer on a sample of X (rows L2-normalized) and
+    bucket every row. nlist defaults to ~4*sqrt(N).
+    """
+    N = X.shape[0]
+    nlist = min(nlist or max(1, int(4 * np.sqrt(N))), N)
+    sample_size = min(sample_size or 256 * nlist, N)
+
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(X[np.sort(rng.choice(N, sample_size, replace=False))], dtype=np.float32)
+    C = _spherical_kmeans(sample, nlist, n_iter, rng)
+
+    assign = _assign(X, C)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+    return IVFIndex(centroids=C, order=order, offsets=offsets, nprobe=nprobe)
+
+def save_ivf(index: IVFIndex, path: Path, ids_sha1: Optional[str] = None) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(
+        path,
+        centroids=index.centroids,
+        order=index.order,
+        offsets=index.offsets,
+        nprobe=np.int64(index.nprobe),
+        ids_sha1=np.str_(ids_sha1 or ""),
+    )
+
+def load_ivf(path: Path, ids_sha1: Optional[str] = None) -> IVFIndex:
+    """
+    Load an index saved by save_ivf. If `ids_sha1` is given, refuse an index
+    built for a different catalog id order.
+    """
+    with np.load(path) as z:
+        stored = str(z["ids_sha1"])
+        if ids_sha1 is not None and stored and stored != ids_sha1:
+            raise ValueError(f"{path.name} was built for a different catalog id order")
+        return IVFIndex(
+            centroids=z["centroids"],
+            order=z["order"],
+            offsets=z["offsets"],
+            nprobe=int(z["nprobe"]),
+        )
+
+def recall_at_k(
+    index: IVFIndex,
+    X: np.ndarray,
+    k: int = 10,
+    nprobe: Optional[int] = None,
+    n_queries: int = 200,
+    seed: int = 0,
+) -> float:
+    """
+    Mean fraction of the exact top-k that the approximate search returns,
+    over a random sample of catalog rows used as queries.
+    """
+    rng = np.random.default_rng(seed)
+    qidxs = rng.choice(X.shape[0], min(n_queries, X.shape[0]), replace=False)
+    hits = []
+    for q in qidxs:
+        exact, _ = topk_cosine(int(q), X, k)
+        approx, _ = index.search(X, int(q), k, nprobe)
+        hits.append(len(np.intersect1d(exact, approx)) / max(len(exact), 1))
+    return float(np.mean(hits)) if hits else 0.0
@@ -1,7 +1,25 @@
 import numpy as np
+from .topk import topk
+from ..instrumentation import alloc, stage
 
 def topk_cosine(qidx: int, X: np.ndarray, k: int):
-    sims = X @ X[qidx]
-    sims[qidx] = -np.inf
-    idx = np.argsort(sims)[::-1][:k]
-    return idx, sims[idx]
+    with stage("score"):
+        sims = X @ X[qidx]
+    alloc("score", sims.nbytes)
+    with stage("topk"):
+        return topk(sims, k, exclude=qidx)
+
+def cosine_scores_batch(qidxs: np.ndarray, X: np.ndarray) -> np.ndarray:
+    """
+    (B, N) cosine scores for a block of queries with one matrix-matrix product.
+    X must already be L2-normalized row-wise. Query self-matches are left in;
+    pass the query indices as `exclude` to topk.
+    """
+    return X[qidxs] @ X.T
+
+def topk_cosine_batch(qidxs: np.ndarray, X: np.ndarray, k: int):
+    with stage("score"):
+        S = cosine_scores_batch(qidxs, X)
+    alloc("score", S.nbytes)
+    with stage("topk"):
+        return topk(S, k, exclude=qidxs)
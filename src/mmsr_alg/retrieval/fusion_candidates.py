@@ -0,0 +1,272 @@
+
+from __future__ import annotations
+from typing import Callable, List, Optional, Tuple
+import numpy as np
+
+from .system import RetrievalResult
+from .cosine import cosine_scores_batch
+from .topk import _select_rows, topk
+from ..catalog import Catalog
+from ..instrumentation import alloc, count, stage
+
+MODALITIES = ("X_lyrics", "X_audio", "X_video")
+METHODS = ("combsum", "combmnz", "rrf")
+
+def _check_loaded(catalog: Catalog) -> None:
+    if catalog.X_lyrics is None or catalog.X_audio is None or catalog.X_video is None:
+        raise ValueError("late fusion requires X_lyrics, X_audio, X_video to be loaded.")
+
+def _minmax_stats(S: np.ndarray, qidxs: np.ndarray):
+    """
+    Per-row min and range of a (B, N) score block ignoring each row's query
+    column, as in fusion_late._minmax_norm_rows (whose query-column overwrite
+    is reused here). Returns (mn, rng, flat), the first two (B, 1).
+    """
+    rows = np.arange(S.shape[0])
+    if S.shape[1] > 1:
+        S[rows, qidxs] = S[rows, np.where(qidxs > 0, qidxs - 1, 1)]
+    mn = S.min(axis=1, keepdims=True)
+    rng = S.max(axis=1, keepdims=True) - mn
+    return mn, np.where(rng < 1e-12, 1.0, rng), (rng < 1e-12)[:, 0]
+
+def _normalize(V: np.ndarray, mn: np.ndarray, rng: np.ndarray, flat: np.ndarray, w: float) -> np.ndarray:
+    # same operations, in the same order, as the full-length late fusion, so
+    # gathered candidates get bit-identical fused scores
+    V -= mn
+    V /= rng
+    V[flat] = 0.0
+    V *= w
+    return V
+
+def _runs(Cs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # first occurrence of each id in the row-sorted candidate block, and a
+    # run number per entry (runs never cross rows)
+    first = np.ones(Cs.shape, dtype=bool)
+    first[:, 1:] = Cs[:, 1:] != Cs[:, :-1]
+    return first, np.cumsum(first.ravel()) - 1
+
+def _fuse(
+    blocks: List[np.ndarray],
+    stats: list,
+    qidxs: np.ndarray,
+    rows: np.ndarray,
+    k: int,
+    depth: int,
+    weights: Tuple[float, float, float],
+    method: str,
+    rrf_k: float,
+):
+    """
+    One pass over the selected block rows: top-`depth` candidates per
+    modality, fused over their union (fuse_lists).
+    """
+    q = qidxs[rows]
+    full = len(rows) == len(qidxs)
+    with stage("candidates"):
+        tops, tvals = [], []
+        for S in blocks:
+            if method == "rrf":
+                # ranks are needed: sorted lists
+                t, v = topk(S if full else S[rows], depth, exclude=q)
+            else:
+                # the set and its lowest score are enough; query columns hold -inf
+                t = _select_rows(S if full else S[rows], depth)
+                v = np.take_along_axis(S if full else S[rows], t, axis=1).min(axis=1, keepdims=True)
+            tops.append(t)
+            tvals.append(v)
+
+    def values(Cs: np.ndarray) -> List[np.ndarray]:
+        return [np.take_along_axis(S if full else S[rows], Cs, axis=1) for S in blocks]
+
+    row_stats = [None if st is None else tuple(a[rows] for a in st) for st in stats]
+    return fuse_lists(tops, tvals, values, row_stats, k, weights, method, rrf_k)
+
+def fuse_lists(
+    tops: List[np.ndarray],
+    tvals: List[np.ndarray],
+    values: Callable[[np.ndarray], List[np.ndarray]],
+    stats: list,
+    k: int,
+    weights: Tuple[float, float, float],
+    method: str,
+    rrf_k: float = 60.0,
+):
+    """
+    Fuses per-modality candidate lists over their union.
+
+    tops: (B, depth) candidate indices per modality (by rank for rrf), with
+    tvals their lowest (B, 1) raw score; values(Cs) returns every modality's
+    raw scores of the (B, C) candidates Cs; stats are the per-modality
+    (mn, rng, flat) of _minmax_stats (unused for rrf). Returns the top-k
+    indices and scores, and for combsum the score bound for ids outside the
+    union.
+    """
+    depth = tops[0].shape[1]
+    with stage("candidates"):
+        C = np.concatenate(tops, axis=1)
+        order = np.argsort(C, axis=1, kind="stable")
+        # sorted by catalog index, so ties in the final top-k resolve like topk does
+        Cs = np.take_along_axis(C, order, axis=1)
+        first, run = _runs(Cs)
+    count("fusion_candidates", int(np.count_nonzero(first)))
+
+    with stage("fuse"):
+        if method == "rrf":
+            rank = np.arange(1, depth + 1, dtype=np.float64)
+            contrib = np.concatenate([np.broadcast_to(w / (rrf_k + rank), t.shape) for w, t in zip(weights, tops)], axis=1)
+            contrib = np.take_along_axis(contrib, order, axis=1)
+            F = np.bincount(run, weights=contrib.ravel())[run].reshape(Cs.shape)
+        else:
+            F = None
+            for w, V, (mn, rng, flat) in zip(weights, values(Cs), stats):
+                V = _normalize(V, mn, rng, flat, w)
+                if F is None:
+                    F = V
+                else:
+                    F += V
+            if method == "combmnz":
+                F *= np.bincount(run)[run].reshape(Cs.shape)
+        F[~first] = -np.inf
+
+    bound = None
+    if method == "combsum":
+        # an id in none of the lists scores at most the depth-th score of
+        # every modality; normalization and weighting are monotone
+        for w, v, (mn, rng, flat) in zip(weights, tvals, stats):
+            u = _normalize(v, mn, rng, flat, w)
+            bound = u if bound is None else bound + u
+
+    with stage("topk"):
+        pos, scores = topk(F, k)
+    return np.take_along_axis(Cs, pos, axis=1), scores, bound
+
+def _fuse_full(blocks: List[np.ndarray], stats: list, qidxs: np.ndarray, rows: np.ndarray, k: int, weights: Tuple[float, float, float]):
+    # full-length CombSUM for the given rows (fusion_late.late_fusion_batch_algo)
+    F = None
+    for w, S, (mn, rng, flat) in zip(weights, blocks, stats):
+        V = _normalize(S[rows], mn[rows], rng[rows], flat[rows], w)
+        if F is None:
+            F = V
+        else:
+            F += V
+    return topk(F, k, exclude=qidxs[rows])
+
+def candidate_depth(k: int, depth: Optional[int], N: int) -> Tuple[int, int]:
+    """
+    (k, depth) clamped to a catalog of N tracks; depth defaults to max(2k, 100).
+    """
+    k = max(0, min(k, N - 1))
+    depth = max(k, depth or max(2 * k, 100))
+    return k, min(depth, N - 1)
+
+def fuse_candidates(
+    blocks: List[np.ndarray],
+    qidxs: np.ndarray,
+    k: int,
+    weights: Tuple[float, float, float] = (1/3, 1/3, 1/3),
+    method: str = "combsum",
+    depth: Optional[int] = None,
+    exact: bool = False,
+    rrf_k: float = 60.0,
+):
+    """
+    Late fusion over the union of each modality's top-`depth` candidates.
+
+    blocks: raw (B, N) cosine scores per modality (overwritten in the query
+    columns). `method`:
+    - combsum: weighted sum of min-max normalized scores (min / max over the
+      whole catalog, as in fusion_late)
+    - combmnz: combsum times the number of lists the candidate appears in
+    - rrf:     reciprocal rank fusion, sum of w / (rrf_k + rank) over the lists
+
+    combmnz and rrf are defined over the depth-limited lists. With
+    exact=True (combsum only), a row is final only if its k-th fused score
+    beats the best score any id outside the union could reach
+    (threshold-algorithm stopping rule); the other rows are fused over the
+    whole catalog, so results equal fusion_late.late_fusion_batch_algo.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    if exact and method != "combsum":
+        raise ValueError("exact=True is only defined for method='combsum'")
+    B, N = blocks[0].shape
+    k, depth = candidate_depth(k, depth, N)
+    stats = [None] * len(blocks)
+    if method != "rrf":
+        stats = [_minmax_stats(S, qidxs) for S in blocks]
+        rows = np.arange(B)
+        for S in blocks:
+            S[rows, qidxs] = -np.inf
+    if exact and depth >= N - 1:
+        with stage("fuse"):
+            return _fuse_full(blocks, stats, qidxs, np.arange(B), k, weights)
+
+    idx, scores, bound = _fuse(blocks, stats, qidxs, np.arange(B), k, depth, weights, method, rrf_k)
+    if exact and k > 0:
+        redo = np.flatnonzero(~(scores[:, -1] > bound[:, 0]))
+        if redo.size:
+            count("fusion_full_rows", int(redo.size))
+            with stage("fuse"):
+                idx[redo], scores[redo] = _fuse_full(blocks, stats, qidxs, redo, k, weights)
+    return idx, scores
+
+def _score_blocks(catalog: Catalog, qidxs: np.ndarray, single: bool) -> List[np.ndarray]:
+    blocks = []
+    with stage("score"):
+        for attr in MODALITIES:
+            X = getattr(catalog, attr)
+            # one query: matrix-vector product, like late_fusion_algo
+            blocks.append((X @ X[qidxs[0]])[None, :] if single else cosine_scores_batch(qidxs, X))
+    alloc("score", sum(S.nbytes for S in blocks))
+    return blocks
+
+def _candidate_algo(name: str, method: str, exact: bool):
+    def fn(
+        catalog: Catalog,
+        qidx: int,
+        k: int,
+        seed: Optional[int] = None,
+        weights: Tuple[float, float, float] = (1/3, 1/3, 1/3),
+        depth: Optional[int] = None,
+    ) -> RetrievalResult:
+        _check_loaded(catalog)
+        qidxs = np.array([qidx])
+        idx, scores = fuse_candidates(_score_blocks(catalog, qidxs, single=True), qidxs, k, weights, method, depth, exact)
+        with stage("ids"):
+            return RetrievalResult(
+                query_id=catalog.ids[qidx],
+                algo=name,
+                k=k,
+                ranked_ids=[catalog.ids[i] for i in idx[0]],
+                scores=scores[0].tolist(),
+            )
+    return fn
+
+def _candidate_batch_algo(method: str, exact: bool):
+    def fn(
+        catalog: Catalog,
+        qidxs: np.ndarray,
+        k: int,
+        seed: Optional[int] = None,
+        weights: Tuple[float, float, float] = (1/3, 1/3, 1/3),
+        depth: Optional[int] = None,
+    ):
+        _check_loaded(catalog)
+        qidxs = np.asarray(qidxs)
+        return fuse_candidates(_score_blocks(catalog, qidxs, single=False), qidxs, k, weights, method, depth, exact)
+    return fn
+
+# name -> (method, exact); exact CombSUM gives the same lists and scores as fusion_late
+CANDIDATE_ALGOS = {
+    "late_fusion_pruned": ("combsum", True),
+    "late_fusion_mnz": ("combmnz", False),
+    "late_fusion_rrf": ("rrf", False),
+}
+
+late_fusion_pruned_algo = _candidate_algo("late_fusion_pruned", *CANDIDATE_ALGOS["late_fusion_pruned"])
+late_fusion_mnz_algo = _candidate_algo("late_fusion_mnz", *CANDIDATE_ALGOS["late_fusion_mnz"])
+late_fusion_rrf_algo = _candidate_algo("late_fusion_rrf", *CANDIDATE_ALGOS["late_fusion_rrf"])
+
+late_fusion_pruned_batch_algo = _candidate_batch_algo(*CANDIDATE_ALGOS["late_fusion_pruned"])
+late_fusion_mnz_batch_algo = _candidate_batch_algo(*CANDIDATE_ALGOS["late_fusion_mnz"])
+late_fusion_rrf_batch_algo = _candidate_batch_algo(*CANDIDATE_ALGOS["late_fusion_rrf"])
@@ -1,12 +1,17 @@
 
 from __future__ import annotations
 from typing import Optional, Tuple
+import inspect
 import numpy as np
 
 from .system import RetrievalResult
-from .cosine import topk_cosine
+from .topk import topk
+from .quantized import compressed, pool_size
 from ..catalog import Catalog
-from ..features import l2_normalize
+from ..features import l2_normalize_
+from ..instrumentation import alloc, stage
+
+MODALITIES = ("X_lyrics", "X_audio", "X_video")
 
 def build_early_fusion_matrix(
     X_lyrics: np.ndarray,
@@ -19,13 +24,137 @@ def build_early_fusion_matrix(
     - assumes X_* are already L2-normalized row-wise
     - scales each block by sqrt(weight)
     - concatenates and L2-normalizes again
+
+    early_fusion_algo no longer needs this matrix; it is kept for inspecting
+    the fused space (FusedRows gives the ANN index the same rows on demand).
     """
     wL, wA, wV = weights
-    XL = X_lyrics * np.sqrt(wL)
-    XA = X_audio  * np.sqrt(wA)
-    XV = X_video  * np.sqrt(wV)
-    X = np.concatenate([XL, XA, XV], axis=1)
-    return l2_normalize(X)
+    # float32 scale factors: a float64 scalar would promote the whole matrix
+    XL = X_lyrics * np.float32(np.sqrt(wL))
+    XA = X_audio  * np.float32(np.sqrt(wA))
+    XV = X_video  * np.float32(np.sqrt(wV))
+    X = np.concatenate([XL, XA, XV], axis=1).astype(np.float32, copy=False)
+    return l2_normalize_(X)
+
+class FusedRows:
+    """
+    Read-only row access to the early-fusion space of a catalog for given
+    weights, without materializing it: X[rows] is
+    build_early_fusion_matrix of just those rows. Enough of the ndarray
+    interface (shape, indexing, X @ q) for the ANN index to search, build
+    and measure recall over.
+    """
+
+    def __init__(self, catalog: Catalog, weights: Tuple[float, float, float], block: int = 4096):
+        self.blocks = [getattr(catalog, attr) for attr in MODALITIES]
+        self.weights = weights
+        self.block = block
+        self.shape = (self.blocks[0].shape[0], sum(X.shape[1] for X in self.blocks))
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, rows) -> np.ndarray:
+        if np.ndim(rows) == 0 and not isinstance(rows, slice):
+            return self[np.atleast_1d(rows)][0]
+        return build_early_fusion_matrix(*(X[rows] for X in self.blocks), self.weights)
+
+    def __matmul__(self, q: np.ndarray) -> np.ndarray:
+        return np.concatenate([self[start:start + self.block] @ q for start in range(0, self.shape[0], self.block)])
+
+def fusion_weights(fn, default: Tuple[float, float, float] = (1/3, 1/3, 1/3)) -> Tuple[float, float, float]:
+    """
+    The `weights` an early_fusion callable runs with: a functools.partial's
+    keyword, else the function's default.
+    """
+    keywords = getattr(fn, "keywords", None) or {}
+    if "weights" in keywords:
+        return tuple(keywords["weights"])
+    try:
+        param = inspect.signature(fn).parameters.get("weights")
+    except (TypeError, ValueError):
+        param = None
+    if param is None or param.default is inspect.Parameter.empty:
+        return default
+    return tuple(param.default)
+
+def row_sqnorms(catalog: Catalog, attr: str) -> np.ndarray:
+    """
+    Squared L2 norm of every row of catalog.<attr>, computed once per catalog.
+    Rows are unit length except for tracks without features (zero rows).
+    """
+    if catalog.row_sqnorms is None:
+        catalog.row_sqnorms = {}
+    if attr not in catalog.row_sqnorms:
+        X = getattr(catalog, attr)
+        catalog.row_sqnorms[attr] = np.einsum("ij,ij->i", X, X).astype(np.float32)
+    return catalog.row_sqnorms[attr]
+
+def _fused_norms(catalog: Catalog, weights: Tuple[float, float, float], eps: float = 1e-12) -> np.ndarray:
+    # row norm of the weighted concatenation, without building it
+    sq = sum(w * row_sqnorms(catalog, attr) for w, attr in zip(weights, MODALITIES))
+    return np.sqrt(sq) + eps
+
+def early_fusion_scores(
+    catalog: Catalog,
+    qidx,
+    weights: Tuple[float, float, float],
+    use_compressed: bool = False,
+    norms: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Cosine scores in the weighted-concatenation space of
+    build_early_fusion_matrix, for one query index (N,) or a block (B, N):
+
+        sum_m w_m <x_m,q, x_m,i> / (|z_q| |z_i|),   |z_i|^2 = sum_m w_m |x_m,i|^2
+
+    Any weights work per call; the only cached state is the per-block row norms.
+    With use_compressed, the products run over catalog.compressed (approximate).
+    `norms` (from _fused_norms with the same weights) skips recomputing them.
+    """
+    if norms is None:
+        norms = _fused_norms(catalog, weights)
+    S = None
+    for w, attr in zip(weights, MODALITIES):
+        X = getattr(catalog, attr)
+        part = compressed(catalog, attr).scores(X[qidx]) if use_compressed else X[qidx] @ X.T
+        part *= w
+        if S is None:
+            S = part
+        else:
+            S += part
+    S /= norms
+    S /= norms[qidx] if np.ndim(qidx) == 0 else norms[qidx][:, None]
+    return S
+
+def _rerank_pool(catalog: Catalog, qidx: int, pool: np.ndarray, weights: Tuple[float, float, float], norms: np.ndarray) -> np.ndarray:
+    # exact early-fusion scores of the candidate rows only; norms from _fused_norms
+    s = None
+    for w, attr in zip(weights, MODALITIES):
+        X = getattr(catalog, attr)
+        part = w * (X[pool] @ X[qidx])
+        s = part if s is None else s + part
+    return s / norms[pool] / norms[qidx]
+
+def _topk_compressed(catalog: Catalog, qidxs: np.ndarray, k: int, weights: Tuple[float, float, float]):
+    """
+    Candidate pool from compressed scores, re-ranked at full precision.
+    """
+    n_pool = pool_size(compressed(catalog, MODALITIES[0]), k)
+    norms = _fused_norms(catalog, weights)
+    pools, _ = topk(early_fusion_scores(catalog, qidxs, weights, use_compressed=True, norms=norms), n_pool, exclude=qidxs)
+    pools = np.sort(pools, axis=1)
+    exact = np.stack([_rerank_pool(catalog, int(q), pool, weights, norms) for q, pool in zip(qidxs, pools)])
+    pos, vals = topk(exact, k)
+    return np.take_along_axis(pools, pos, axis=1), vals
+
+def _all_compressed(catalog: Catalog) -> bool:
+    return all(compressed(catalog, attr) is not None for attr in MODALITIES)
+
+def _check_loaded(catalog: Catalog) -> None:
+    if catalog.X_lyrics is None or catalog.X_audio is None or catalog.X_video is None:
+        raise ValueError("early_fusion requires X_lyrics, X_audio, X_video to be loaded.")
 
 def early_fusion_algo(
     catalog: Catalog,
@@ -34,19 +163,37 @@ def early_fusion_algo(
     seed: Optional[int] = None,
     weights: Tuple[float, float, float] = (1/3, 1/3, 1/3),
 ) -> RetrievalResult:
-    if catalog.X_lyrics is None or catalog.X_audio is None or catalog.X_video is None:
-        raise ValueError("early_fusion requires X_lyrics, X_audio, X_video to be loaded.")
-
-    # If precomputed exists, trust it (assumes it matches the intended weights)
-    if catalog.X_early is None:
-        catalog.X_early = build_early_fusion_matrix(catalog.X_lyrics, catalog.X_audio, catalog.X_video, weights)
-
-    idx, scores = topk_cosine(qidx, catalog.X_early, k)
-    return RetrievalResult(
-        query_id=catalog.ids[qidx],
-        algo="early_fusion",
-        k=k,
-        ranked_ids=[catalog.ids[i] for i in idx],
-        scores=scores.tolist(),
-    )
+    _check_loaded(catalog)
+    if _all_compressed(catalog):
+        idx, scores = _topk_compressed(catalog, np.array([qidx]), k, weights)
+        idx, scores = idx[0], scores[0]
+    else:
+        with stage("score"):
+            S = early_fusion_scores(catalog, qidx, weights)
+        alloc("score", S.nbytes)
+        with stage("topk"):
+            idx, scores = topk(S, k, exclude=qidx)
+    with stage("ids"):
+        return RetrievalResult(
+            query_id=catalog.ids[qidx],
+            algo="early_fusion",
+            k=k,
+            ranked_ids=[catalog.ids[i] for i in idx],
+            scores=scores.tolist(),
+        )
 
+def early_fusion_batch_algo(
+    catalog: Catalog,
+    qidxs: np.ndarray,
+    k: int,
+    seed: Optional[int] = None,
+    weights: Tuple[float, float, float] = (1/3, 1/3, 1/3),
+):
+    _check_loaded(catalog)
+    if _all_compressed(catalog):
+        return _topk_compressed(catalog, qidxs, k, weights)
+    with stage("score"):
+        S = early_fusion_scores(catalog, qidxs, weights)
+    alloc("score", S.nbytes)
+    with stage("topk"):
+        return topk(S, k, exclude=qidxs)
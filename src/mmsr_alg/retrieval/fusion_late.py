@@ -4,34 +4,34 @@ from typing import Optional, Tuple
 import numpy as np
 
 from .system import RetrievalResult
+from .cosine import cosine_scores_batch
+from .topk import topk
 from ..catalog import Catalog
+from ..instrumentation import alloc, stage
 
 def _cosine_scores(qidx: int, X: np.ndarray) -> np.ndarray:
     # X must already be L2-normalized row-wise
-    s = X @ X[qidx]         # (N,)
-    s[qidx] = -np.inf
-    return s
+    return X @ X[qidx]         # (N,)
 
-def _minmax_norm(scores: np.ndarray) -> np.ndarray:
+def _minmax_norm_rows(S: np.ndarray, qidxs: np.ndarray) -> np.ndarray:
     """
-    Per-query min-max normalize to [0,1], ignoring -inf entries.
-    If all finite scores equal -> returns zeros for finite entries.
+    Per-query min-max normalize a (B, N) score block to [0,1], in place,
+    ignoring each row's query column (whose normalized value is meaningless).
+    Rows whose remaining scores are all equal become zeros.
     """
-    out = scores.copy()
-    finite = np.isfinite(out)
-    if not np.any(finite):
-        return np.zeros_like(out)
-
-    mn = out[finite].min()
-    mx = out[finite].max()
-    if mx - mn < 1e-12:
-        out[finite] = 0.0
-        out[~finite] = -np.inf
-        return out
-
-    out[finite] = (out[finite] - mn) / (mx - mn)
-    out[~finite] = -np.inf
-    return out
+    rows = np.arange(S.shape[0])
+    if S.shape[1] > 1:
+        # overwrite the query column with a neighbour's value from the same
+        # row, so it can no longer affect that row's min / max
+        S[rows, qidxs] = S[rows, np.where(qidxs > 0, qidxs - 1, 1)]
+    mn = S.min(axis=1, keepdims=True)
+    mx = S.max(axis=1, keepdims=True)
+    rng = mx - mn
+    flat = rng < 1e-12
+    S -= mn
+    S /= np.where(flat, 1.0, rng)
+    S[flat[:, 0]] = 0.0
+    return S
 
 def late_fusion_algo(
     catalog: Catalog,
@@ -47,32 +47,62 @@ def late_fusion_algo(
     if catalog.X_lyrics is None or catalog.X_audio is None or catalog.X_video is None:
         raise ValueError("late_fusion requires X_lyrics, X_audio, X_video to be loaded.")
 
-    wL, wA, wV = weights
-
-    sL = _cosine_scores(qidx, catalog.X_lyrics)
-    sA = _cosine_scores(qidx, catalog.X_audio)
-    sV = _cosine_scores(qidx, catalog.X_video)
-
-    if normalize:
-        sL = _minmax_norm(sL)
-        sA = _minmax_norm(sA)
-        sV = _minmax_norm(sV)
+    # the three score vectors are the only N-length allocations: normalizing
+    # and fusing happen in place
+    fused = None
+    for w, X in zip(weights, (catalog.X_lyrics, catalog.X_audio, catalog.X_video)):
+        with stage("score"):
+            s = _cosine_scores(qidx, X)
+        alloc("score", s.nbytes)
+        if normalize:
+            with stage("normalize"):
+                _minmax_norm_rows(s[None, :], np.array([qidx]))
+        with stage("fuse"):
+            s *= w
+            if fused is None:
+                fused = s
+            else:
+                fused += s
+    with stage("topk"):
+        idx, scores = topk(fused, k, exclude=qidx)
+    with stage("ids"):
+        return RetrievalResult(
+            query_id=catalog.ids[qidx],
+            algo="late_fusion",
+            k=k,
+            ranked_ids=[catalog.ids[i] for i in idx],
+            scores=scores.tolist(),
+        )
 
-    fused = wL * sL + wA * sA + wV * sV
-    fused[qidx] = -np.inf
+def late_fusion_batch_algo(
+    catalog: Catalog,
+    qidxs: np.ndarray,
+    k: int,
+    seed: Optional[int] = None,
+    weights: Tuple[float, float, float] = (1/3, 1/3, 1/3),
+    normalize: bool = True,
+):
+    """
+    Batched late_fusion_algo: one GEMM per modality for the whole query block.
+    Returns (B, k) indices and fused scores.
+    """
+    if catalog.X_lyrics is None or catalog.X_audio is None or catalog.X_video is None:
+        raise ValueError("late_fusion requires X_lyrics, X_audio, X_video to be loaded.")
 
-    # top-k
-    if k >= len(fused) - 1:
-        idx = np.argsort(fused)[::-1]
-    else:
-        part = np.argpartition(fused, -k)[-k:]
-        idx = part[np.argsort(fused[part])[::-1]]
+    fused = None
+    for w, X in zip(weights, (catalog.X_lyrics, catalog.X_audio, catalog.X_video)):
+        with stage("score"):
+            S = cosine_scores_batch(qidxs, X)
+        alloc("score", S.nbytes)
+        if normalize:
+            with stage("normalize"):
+                S = _minmax_norm_rows(S, qidxs)
+        with stage("fuse"):
+            S *= w
+            if fused is None:
+                fused = S
+            else:
+                fused += S
 
-    idx = idx[:k]
-    return RetrievalResult(
-        query_id=catalog.ids[qidx],
-        algo="late_fusion",
-        k=k,
-        ranked_ids=[catalog.ids[i] for i in idx],
-        scores=fused[idx].tolist(),
-    )
+    with stage("topk"):
+        return topk(fused, k, exclude=qidxs)
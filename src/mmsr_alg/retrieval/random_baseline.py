@@ -2,7 +2,9 @@ import numpy as np
 from .system import RetrievalResult
 
 def random_algo(catalog, qidx, k, seed=None):
-    rng = np.random.default_rng(seed)
+    # a seeded draw depends on (seed, query) only: reproducible however the
+    # queries are batched or sharded, and different for every query
+    rng = np.random.default_rng(None if seed is None else (seed, qidx))
     candidates = np.arange(len(catalog.ids))
     candidates = candidates[candidates != qidx]
     rng.shuffle(candidates)
@@ -15,3 +17,9 @@ def random_algo(catalog, qidx, k, seed=None):
         ranked_ids=[catalog.ids[i] for i in idx],
         scores=None
     )
+
+def random_batch_algo(catalog, qidxs, k, seed=None):
+    # same per-query draw as random_algo, so batch and single calls agree
+    rows = [random_algo(catalog, int(q), k, seed).ranked_ids for q in qidxs]
+    idx = np.array([[catalog.id_to_idx[tid] for tid in r] for r in rows], dtype=np.int64)
+    return idx.reshape(len(rows), -1), None
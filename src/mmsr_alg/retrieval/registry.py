@@ -1,8 +1,11 @@
 
-from .random_baseline import random_algo
+from .random_baseline import random_algo, random_batch_algo
 from .unimodal import lyrics_algo, audio_algo, video_algo
-from .fusion_late import late_fusion_algo
-from .fusion_early import early_fusion_algo
+from .unimodal import lyrics_batch_algo, audio_batch_algo, video_batch_algo
+from .fusion_late import late_fusion_algo, late_fusion_batch_algo
+from .fusion_early import early_fusion_algo, early_fusion_batch_algo
+from .fusion_candidates import late_fusion_pruned_algo, late_fusion_mnz_algo, late_fusion_rrf_algo
+from .fusion_candidates import late_fusion_pruned_batch_algo, late_fusion_mnz_batch_algo, late_fusion_rrf_batch_algo
 
 ALGORITHMS = {
     "random": random_algo,
@@ -11,5 +14,21 @@ ALGORITHMS = {
     "video": video_algo,
     "late_fusion": late_fusion_algo,
     "early_fusion": early_fusion_algo,
+    "late_fusion_pruned": late_fusion_pruned_algo,
+    "late_fusion_mnz": late_fusion_mnz_algo,
+    "late_fusion_rrf": late_fusion_rrf_algo,
 }
 
+# Same algorithms, scoring a block of queries per matrix-matrix product.
+# Used by RetrievalSystem.retrieve_batch / rank_batch.
+BATCH_ALGORITHMS = {
+    "random": random_batch_algo,
+    "lyrics": lyrics_batch_algo,
+    "audio": audio_batch_algo,
+    "video": video_batch_algo,
+    "late_fusion": late_fusion_batch_algo,
+    "early_fusion": early_fusion_batch_algo,
+    "late_fusion_pruned": late_fusion_pruned_batch_algo,
+    "late_fusion_mnz": late_fusion_mnz_batch_algo,
+    "late_fusion_rrf": late_fusion_rrf_batch_algo,
+}
@@ -0,0 +1,106 @@
+
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+import threading
+import numpy as np
+
+Ranking = Tuple[np.ndarray, Optional[np.ndarray]]
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of ranked lists, shared by every caller of a
+    RetrievalSystem (e.g. all UI sessions).
+
+    Each entry holds the top `fetch_k` (or more, if asked for) indices and
+    scores of one (query, algo, params, data version) key, so any smaller k is
+    a slice. Entries are evicted least-recently-used first once their arrays
+    exceed `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = 64 << 20, fetch_k: int = 100):
+        self.max_bytes = max_bytes
+        self.fetch_k = fetch_k
+        self._entries: "OrderedDict[Hashable, Tuple[Ranking, bool]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _nbytes(ranking: Ranking) -> int:
+        idx, scores = ranking
+        return idx.nbytes + (0 if scores is None else scores.nbytes)
+
+    def peek(self, key: Hashable, k: int) -> Optional[Ranking]:
+        """
+        Top-k (indices, scores) for `key` if the cached list covers k, else
+        None; counted as a hit or a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                (idx, scores), complete = entry
+                if complete or len(idx) >= k:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return idx[:k], (None if scores is None else scores[:k])
+            self.misses += 1
+        return None
+
+    def put(self, key: Hashable, ranking: Ranking, complete: bool = False) -> Ranking:
+        """
+        Caches a ranked list for `key`; `complete` marks it as holding every
+        candidate. Returns it in the cached dtypes.
+        """
+        idx, scores = ranking
+        ranking = (np.asarray(idx, dtype=np.int32), None if scores is None else np.asarray(scores, dtype=np.float32))
+        self._put(key, ranking, complete)
+        return ranking
+
+    def get(self, key: Hashable, k: int, compute: Callable[[int], Ranking]) -> Ranking:
+        """
+        Top-k (indices, scores) for `key`; on a miss, or if the cached list is
+        shorter than k, `compute(K)` ranks K >= k results and is cached.
+        """
+        hit = self.peek(key, k)
+        if hit is not None:
+            return hit
+        K = max(k, self.fetch_k)
+        idx, scores = compute(K)
+        # fewer than K results means the list already holds every candidate
+        idx, scores = self.put(key, (idx, scores), complete=len(idx) < K)
+        return idx[:k], (None if scores is None else scores[:k])
+
+    def _put(self, key: Hashable, ranking: Ranking, complete: bool) -> None:
+        size = self._nbytes(ranking)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._nbytes(old[0])
+            self._entries[key] = (ranking, complete)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= self._nbytes(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
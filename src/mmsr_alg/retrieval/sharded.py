@@ -0,0 +1,434 @@
+
+from __future__ import annotations
+from dataclasses import replace
+from itertools import islice
+from multiprocessing import Pipe, Process, shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import heapq
+import threading
+import numpy as np
+
+from ..catalog import Catalog
+from ..feature_store import _read_manifest, ids_fingerprint
+from .system import RetrievalResult, RetrievalSystem
+from .topk import topk
+from .random_baseline import random_algo, random_batch_algo
+from .fusion_candidates import CANDIDATE_ALGOS, candidate_depth, fuse_lists
+from .registry import BATCH_ALGORITHMS
+
+MODALITIES = ("X_lyrics", "X_audio", "X_video")
+UNIMODAL = {"lyrics": "X_lyrics", "audio": "X_audio", "video": "X_video"}
+
+# attr -> ("npy", path) or ("shm", block name, shape, dtype)
+ShardSource = Tuple
+
+# ---- shard side ----
+
+def _open_rows(src: ShardSource, lo: int, hi: int, blocks: list) -> np.ndarray:
+    if src[0] == "npy":
+        # only this shard's rows are read into memory
+        return np.array(np.load(src[1], mmap_mode="r")[lo:hi])
+    _, name, shape, dtype = src
+    shm = shared_memory.SharedMemory(name=name)
+    blocks.append(shm)
+    X = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    X.flags.writeable = False
+    return X
+
+class _Shard:
+    """
+    Rows [lo, hi) of every modality matrix. Results carry global row indices;
+    a shard's own copy of a query row is masked with -inf instead of excluded,
+    so every shard returns rows of the same length.
+    """
+
+    def __init__(self, lo: int, hi: int, X: Dict[str, np.ndarray]):
+        self.lo, self.hi = lo, hi
+        self.X = X
+        self.sqnorms = {attr: np.einsum("ij,ij->i", M, M).astype(np.float32) for attr, M in X.items()}
+        # late fusion score blocks between the min/max and the fusion phase
+        self._late: Optional[List[np.ndarray]] = None
+
+    def _own(self, qidxs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # (rows of the block, local columns) of queries that live in this shard
+        rows = np.flatnonzero((qidxs >= self.lo) & (qidxs < self.hi))
+        return rows, qidxs[rows] - self.lo
+
+    def _topk(self, S: np.ndarray, qidxs: np.ndarray, k: int):
+        rows, cols = self._own(qidxs)
+        S[rows, cols] = -np.inf
+        idx, scores = topk(S, min(k, S.shape[1]))
+        return idx + self.lo, scores
+
+    def rows(self, attr: str, local: np.ndarray) -> np.ndarray:
+        return self.X[attr][local]
+
+    def cosine(self, attr: str, Q: np.ndarray, qidxs: np.ndarray, k: int):
+        return self._topk(Q @ self.X[attr].T, qidxs, k)
+
+    def early(self, Q: Dict[str, np.ndarray], qnorms: np.ndarray, weights, qidxs: np.ndarray, k: int, eps: float = 1e-12):
+        # fusion_early.early_fusion_scores over this shard's columns
+        norms = np.sqrt(sum(w * self.sqnorms[attr] for w, attr in zip(weights, MODALITIES))) + eps
+        S = None
+        for w, attr in zip(weights, MODALITIES):
+            part = Q[attr] @ self.X[attr].T
+            part *= w
+            if S is None:
+                S = part
+            else:
+                S += part
+        S /= norms
+        S /= qnorms[:, None]
+        return self._topk(S, qidxs, k)
+
+    def late_minmax(self, Q: Dict[str, np.ndarray], qidxs: np.ndarray):
+        """
+        Phase 1 of late fusion: per-modality row min / max of this shard's
+        scores, ignoring the query's own column (+inf / -inf if nothing is left).
+        """
+        rows, cols = self._own(qidxs)
+        blocks, mins, maxs = [], [], []
+        for attr in MODALITIES:
+            S = Q[attr] @ self.X[attr].T
+            S[rows, cols] = np.inf
+            mins.append(S.min(axis=1))
+            S[rows, cols] = -np.inf
+            maxs.append(S.max(axis=1))
+            blocks.append(S)
+        self._late = blocks
+        return np.stack(mins), np.stack(maxs)
+
+    def late_candidates(self, Q: Dict[str, np.ndarray], qidxs: np.ndarray, depth: int, keep: bool):
+        """
+        Phase 1 of candidate fusion: late_minmax plus each modality's local
+        top-`depth`. With `keep`, the score blocks stay for late_gather / late_fuse.
+        """
+        mins, maxs = self.late_minmax(Q, qidxs)
+        tops = [self._topk(S, qidxs, depth) for S in self._late]
+        if not keep:
+            self._late = None
+        return mins, maxs, tops
+
+    def late_gather(self, Cs: np.ndarray, release: bool):
+        """
+        Raw per-modality scores of the global candidates Cs (B, C) in this
+        shard's rows (0 for the others).
+        """
+        blocks = self._late
+        if release:
+            self._late = None
+        own = (Cs >= self.lo) & (Cs < self.hi)
+        local = np.where(own, Cs - self.lo, 0)
+        return [np.where(own, np.take_along_axis(S, local, axis=1), 0) for S in blocks]
+
+    def late_release(self) -> None:
+        self._late = None
+
+    def late_fuse(self, mn: np.ndarray, mx: np.ndarray, weights, qidxs: np.ndarray, k: int, rows: Optional[np.ndarray] = None):
+        """
+        Phase 2: min-max normalize with the global (3, B) statistics, fuse and
+        take this shard's top-k; same arithmetic as fusion_late._minmax_norm_rows.
+        `rows` selects block rows (statistics and qidxs are already subsets).
+        """
+        blocks, self._late = self._late, None
+        if rows is not None:
+            blocks = [S[rows] for S in blocks]
+        fused = None
+        for m, (w, S) in enumerate(zip(weights, blocks)):
+            lo, rng = mn[m][:, None], (mx[m] - mn[m])[:, None]
+            flat = ~(rng >= 1e-12)
+            S -= lo
+            S /= np.where(flat, 1.0, rng)
+            S[flat[:, 0]] = 0.0
+            S *= w
+            if fused is None:
+                fused = S
+            else:
+                fused += S
+        return self._topk(fused, qidxs, k)
+
+def _serve_shard(conn, lo: int, hi: int, sources: Dict[str, ShardSource]) -> None:
+    blocks: list = []
+    try:
+        shard = _Shard(lo, hi, {attr: _open_rows(src, lo, hi, blocks) for attr, src in sources.items()})
+    except Exception as e:
+        conn.send(("error", e))
+        return
+    conn.send(("ok", None))
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        op, args = msg
+        try:
+            conn.send(("ok", getattr(shard, op)(*args)))
+        except Exception as e:
+            conn.send(("error", e))
+    for shm in blocks:
+        shm.close()
+
+# ---- coordinator side ----
+
+def merge_topk(parts: List[Tuple[np.ndarray, np.ndarray]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    k-way merge of per-shard top-k blocks ((B, k_s) global indices and scores,
+    each row sorted by descending score then ascending index) with a heap per
+    row. Masked (-inf) entries are dropped.
+    """
+    B = parts[0][0].shape[0]
+    idx_rows, score_rows = [], []
+    for r in range(B):
+        runs = []
+        for idx, scores in parts:
+            s = scores[r]
+            live = s > -np.inf
+            runs.append(zip((-s[live]).tolist(), idx[r][live].tolist()))
+        best = list(islice(heapq.merge(*runs), k))
+        score_rows.append([-s for s, _ in best])
+        idx_rows.append([i for _, i in best])
+    return np.array(idx_rows, dtype=np.int64).reshape(B, -1), np.array(score_rows, dtype=np.float32).reshape(B, -1)
+
+class ShardedCatalog:
+    """
+    The catalog's feature matrices partitioned by rows across `n_shards`
+    local worker processes; no single process holds a whole matrix.
+
+    Each query is scattered to every shard, which scores its rows and returns
+    its local top-k; the coordinator merges them (merge_topk). Late fusion
+    runs in two phases so the min-max normalization uses the global per-query
+    min / max: shards report their statistics, the coordinator reduces them
+    and sends them back for fusing. Candidate fusion (late_fusion_pruned /
+    _mnz / _rrf) merges the shards' per-modality top lists instead and
+    fetches only the candidates' scores.
+
+    Rows come from the feature store (`store_dir`, each worker reads its own
+    row range) or, without one, from the catalog's in-memory matrices through
+    one shared-memory block per shard. Shards always score at full precision
+    (catalog.compressed is not used).
+
+        with ShardedCatalog(cat, n_shards=4, store_dir=DATA / "feature_store") as shards:
+            system = shards.system(result_cache=ResultCache())
+            res = system.retrieve(query_id, 10, "late_fusion")
+
+    The returned RetrievalSystem works as usual (tables, tombstones, result
+    cache); catalog updates are not propagated to the shards.
+    """
+
+    def __init__(
+        self,
+        catalog: Catalog,
+        n_shards: int,
+        store_dir: Optional[Path] = None,
+        weights: Tuple[float, float, float] = (1/3, 1/3, 1/3),
+    ):
+        self.catalog = catalog
+        self.weights = weights
+        N = len(catalog.ids)
+        n = max(1, min(n_shards, N))
+        # shard s holds rows [bounds[s], bounds[s + 1])
+        self.bounds = np.linspace(0, N, n + 1).astype(np.int64)
+        self.store_dir = store_dir
+        self._conns: list = []
+        self._procs: List[Process] = []
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self._lock = threading.Lock()
+
+    # ---- lifecycle ----
+
+    def _sources(self, s: int) -> Dict[str, ShardSource]:
+        lo, hi = int(self.bounds[s]), int(self.bounds[s + 1])
+        if self.store_dir is not None:
+            manifest = _read_manifest(self.store_dir)
+            if manifest.get("ids_sha1") != ids_fingerprint(self.catalog.ids):
+                raise ValueError(f"feature store {self.store_dir} was built for a different catalog")
+            return {attr: ("npy", self.store_dir / manifest["modalities"][attr]["file"]) for attr in MODALITIES}
+        sources = {}
+        for attr in MODALITIES:
+            X = getattr(self.catalog, attr)
+            if X is None:
+                raise ValueError(f"{attr} must be loaded (or pass store_dir) to shard the catalog")
+            part = np.ascontiguousarray(X[lo:hi], dtype=np.float32)
+            shm = shared_memory.SharedMemory(create=True, size=max(part.nbytes, 1))
+            self._blocks.append(shm)
+            np.ndarray(part.shape, dtype=part.dtype, buffer=shm.buf)[...] = part
+            sources[attr] = ("shm", shm.name, part.shape, part.dtype.str)
+        return sources
+
+    def __enter__(self) -> "ShardedCatalog":
+        try:
+            for s in range(len(self.bounds) - 1):
+                parent, child = Pipe()
+                p = Process(target=_serve_shard, args=(child, int(self.bounds[s]), int(self.bounds[s + 1]), self._sources(s)), daemon=True)
+                p.start()
+                self._conns.append(parent)
+                self._procs.append(p)
+            for conn in self._conns:
+                status, err = conn.recv()
+                if status == "error":
+                    raise err
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def close(self) -> None:
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (OSError, EOFError):
+                pass
+        for p in self._procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        for shm in self._blocks:
+            shm.close()
+            shm.unlink()
+        self._conns, self._procs, self._blocks = [], [], []
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---- scatter / gather ----
+
+    def _call(self, shards, op: str, *args) -> list:
+        # send to every shard first, then collect, so the shards work in parallel
+        for s in shards:
+            self._conns[s].send((op, args))
+        out = []
+        for s in shards:
+            status, value = self._conns[s].recv()
+            if status == "error":
+                raise value
+            out.append(value)
+        return out
+
+    def _scatter(self, op: str, *args) -> list:
+        return self._call(range(len(self._conns)), op, *args)
+
+    def _query_rows(self, attrs, qidxs: np.ndarray) -> Dict[str, np.ndarray]:
+        # the query vectors, fetched from the shards that own them
+        owner = np.searchsorted(self.bounds, qidxs, side="right") - 1
+        Q = {}
+        for attr in attrs:
+            rows = None
+            for s in np.unique(owner):
+                sel = np.flatnonzero(owner == s)
+                (part,) = self._call([int(s)], "rows", attr, qidxs[sel] - self.bounds[s])
+                if rows is None:
+                    rows = np.empty((len(qidxs), part.shape[1]), dtype=part.dtype)
+                rows[sel] = part
+            Q[attr] = rows
+        return Q
+
+    def rank_cosine(self, attr: str, qidxs, k: int):
+        qidxs = np.asarray(qidxs, dtype=np.int64)
+        with self._lock:
+            Q = self._query_rows([attr], qidxs)
+            return merge_topk(self._scatter("cosine", attr, Q[attr], qidxs, k), k)
+
+    def rank_early(self, qidxs, k: int, eps: float = 1e-12):
+        qidxs = np.asarray(qidxs, dtype=np.int64)
+        with self._lock:
+            Q = self._query_rows(MODALITIES, qidxs)
+            sq = sum(w * np.einsum("ij,ij->i", Q[a], Q[a]).astype(np.float32) for w, a in zip(self.weights, MODALITIES))
+            return merge_topk(self._scatter("early", Q, np.sqrt(sq) + eps, self.weights, qidxs, k), k)
+
+    def rank_late(self, qidxs, k: int):
+        qidxs = np.asarray(qidxs, dtype=np.int64)
+        with self._lock:
+            Q = self._query_rows(MODALITIES, qidxs)
+            stats = self._scatter("late_minmax", Q, qidxs)
+            mn = np.min([s[0] for s in stats], axis=0)
+            mx = np.max([s[1] for s in stats], axis=0)
+            return merge_topk(self._scatter("late_fuse", mn, mx, self.weights, qidxs, k), k)
+
+    def rank_candidates(self, qidxs, k: int, method: str = "combsum", exact: bool = False, depth: Optional[int] = None, rrf_k: float = 60.0):
+        """
+        fusion_candidates.fuse_candidates across the shards: shards report
+        their min / max and local top-`depth` per modality, the coordinator
+        merges the lists, fetches the union's scores from the owning shards
+        and fuses them (fuse_lists). With exact=True, rows failing the
+        stopping rule are fused over all rows as in rank_late.
+        """
+        qidxs = np.asarray(qidxs, dtype=np.int64)
+        N = len(self.catalog.ids)
+        k, depth = candidate_depth(k, depth, N)
+        if exact and depth >= N - 1:
+            return self.rank_late(qidxs, k)
+        with self._lock:
+            Q = self._query_rows(MODALITIES, qidxs)
+            parts = self._scatter("late_candidates", Q, qidxs, depth, method != "rrf")
+            mn = np.min([p[0] for p in parts], axis=0)
+            mx = np.max([p[1] for p in parts], axis=0)
+            # as fusion_candidates._minmax_stats, from the global statistics
+            stats = []
+            for m in range(len(MODALITIES)):
+                rng = (mx[m] - mn[m])[:, None]
+                stats.append((mn[m][:, None], np.where(rng < 1e-12, 1.0, rng), (rng < 1e-12)[:, 0]))
+            tops, tvals = [], []
+            for m in range(len(MODALITIES)):
+                idx, scores = merge_topk([p[2][m] for p in parts], depth)
+                tops.append(idx)
+                tvals.append(scores.min(axis=1, keepdims=True))
+
+            def values(Cs: np.ndarray) -> List[np.ndarray]:
+                owner = np.searchsorted(self.bounds, Cs, side="right") - 1
+                out = [np.zeros(Cs.shape, dtype=np.float32) for _ in MODALITIES]
+                for s, part in enumerate(self._scatter("late_gather", Cs, not exact)):
+                    own = owner == s
+                    for V, P in zip(out, part):
+                        V[own] = P[own]
+                return out
+
+            idx, scores, bound = fuse_lists(tops, tvals, values, stats, k, self.weights, method, rrf_k)
+            if exact:
+                redo = np.flatnonzero(~(scores[:, -1] > bound[:, 0])) if k > 0 else np.empty(0, dtype=np.int64)
+                if redo.size:
+                    parts = self._scatter("late_fuse", mn[:, redo], mx[:, redo], self.weights, qidxs[redo], k, redo)
+                    idx[redo], scores[redo] = merge_topk(parts, k)
+                else:
+                    self._scatter("late_release")
+            return idx, scores
+
+    # ---- RetrievalSystem plumbing ----
+
+    def batch_algorithms(self) -> Dict[str, object]:
+        algos = {name: (lambda cat, q, k, seed=None, a=attr: self.rank_cosine(a, q, k)) for name, attr in UNIMODAL.items()}
+        algos["late_fusion"] = lambda cat, q, k, seed=None: self.rank_late(q, k)
+        algos["early_fusion"] = lambda cat, q, k, seed=None: self.rank_early(q, k)
+        for name, (method, exact) in CANDIDATE_ALGOS.items():
+            algos[name] = lambda cat, q, k, seed=None, m=method, e=exact: self.rank_candidates(q, k, m, e)
+        # needs nothing but the catalog size
+        algos["random"] = random_batch_algo
+        # the registry's algorithms, so a sharded system offers the same ones
+        return {name: algos[name] for name in BATCH_ALGORITHMS}
+
+    def algorithms(self) -> Dict[str, object]:
+        def single(name, fn):
+            def run(catalog, qidx, k, seed=None):
+                idx, scores = fn(catalog, np.array([qidx]), k, seed)
+                return RetrievalResult(
+                    query_id=catalog.ids[qidx],
+                    algo=name,
+                    k=k,
+                    ranked_ids=[catalog.ids[i] for i in idx[0]],
+                    scores=scores[0].tolist(),
+                )
+            return run
+        algos = {name: single(name, fn) for name, fn in self.batch_algorithms().items() if name != "random"}
+        algos["random"] = random_algo
+        return algos
+
+    def system(self, **kwargs) -> RetrievalSystem:
+        """
+        A RetrievalSystem over the catalog without its feature matrices,
+        scoring through the shards (kwargs go to RetrievalSystem).
+        """
+        light = replace(
+            self.catalog,
+            X_lyrics=None, X_audio=None, X_video=None, X_early=None,
+            row_sqnorms=None, compressed=None, buffers=None,
+        )
+        return RetrievalSystem(light, self.algorithms(), self.batch_algorithms(), **kwargs)
@@ -1,6 +1,13 @@
 from dataclasses import dataclass
-from typing import Callable, Dict, List, Optional
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
 from ..catalog import Catalog
+from ..feature_store import ids_fingerprint
+from ..instrumentation import Instrumentation, count, stage
+from .ann import ANN_MATRICES, IVFIndex, build_ivf, load_ivf, save_ivf, recall_at_k
+from .tables import UNTABLED, load_tables
+from .result_cache import ResultCache
 
 @dataclass(frozen=True)
 class RetrievalResult:
@@ -12,11 +19,307 @@ class RetrievalResult:
 
 AlgoFn = Callable[[Catalog, int, int, Optional[int]], RetrievalResult]
 
+# (catalog, query indices, k, seed) -> ((B, k) indices, (B, k) scores or None)
+BatchAlgoFn = Callable[[Catalog, np.ndarray, int, Optional[int]], Tuple[np.ndarray, Optional[np.ndarray]]]
+
 class RetrievalSystem:
-    def __init__(self, catalog: Catalog, algorithms: Dict[str, AlgoFn]):
+    def __init__(
+        self,
+        catalog: Catalog,
+        algorithms: Dict[str, AlgoFn],
+        batch_algorithms: Optional[Dict[str, BatchAlgoFn]] = None,
+        block_size: int = 256,
+        result_cache: Optional[ResultCache] = None,
+        instrumentation: Optional[Instrumentation] = None,
+    ):
         self.catalog = catalog
         self.algorithms = algorithms
+        self.batch_algorithms = batch_algorithms or {}
+        # queries scored per matrix-matrix product; bounds the (block, N) score buffers
+        self.block_size = block_size
+        # algo -> ANN index, used by retrieve(..., mode="approx")
+        self.indexes: Dict[str, IVFIndex] = {}
+        # algo -> precomputed top-K neighbour table (eval.lists_store.Rankings)
+        self.tables: Dict[str, object] = {}
+        # optional LRU cache in front of retrieve()
+        self.result_cache = result_cache
+        # optional per-stage timers / counters (see instrumentation.py)
+        self.instrumentation = instrumentation
+
+    def retrieve(
+        self,
+        query_id: str,
+        k: int,
+        algo: str,
+        seed: Optional[int] = None,
+        mode: str = "exact",
+        nprobe: Optional[int] = None,
+    ) -> RetrievalResult:
+        """
+        If a neighbour table for `algo` covers k, the result is a lookup into it.
+        Otherwise mode="approx" searches the algorithm's ANN index (visiting
+        `nprobe` buckets); algorithms without an index fall back to exact search.
 
-    def retrieve(self, query_id: str, k: int, algo: str, seed: Optional[int] = None) -> RetrievalResult:
+        With a result_cache, repeated calls (any k up to the cached length) are
+        served from it; unseeded random lists are never cached.
+        """
+        if mode not in ("exact", "approx"):
+            raise ValueError(f"mode must be 'exact' or 'approx', got {mode!r}")
+        if self.instrumentation is None:
+            return self._retrieve_cached(query_id, k, algo, seed, mode, nprobe)
+        return self.instrumentation.run(algo, "retrieve", self._retrieve_cached, query_id, k, algo, seed, mode, nprobe)
+
+    def _retrieve_cached(self, query_id: str, k: int, algo: str, seed: Optional[int], mode: str, nprobe: Optional[int]) -> RetrievalResult:
         qidx = self.catalog.id_to_idx[query_id]
-        return self.algorithms[algo](self.catalog, qidx, k, seed)
+        cache = self.result_cache
+        if cache is None or (seed is None and algo in UNTABLED):
+            return self._retrieve(query_id, qidx, k, algo, seed, mode, nprobe)
+
+        def compute(K: int):
+            count("cache_miss")
+            res = self._retrieve(query_id, qidx, K, algo, seed, mode, nprobe)
+            idx = np.array([self.catalog.id_to_idx[t] for t in res.ranked_ids], dtype=np.int64)
+            return idx, (None if res.scores is None else np.asarray(res.scores))
+
+        key = self.cache_key(query_id, algo, seed, mode, nprobe)
+        count("cache_lookup")
+        idx, scores = cache.get(key, k, compute)
+        with stage("ids"):
+            return RetrievalResult(
+                query_id=query_id,
+                algo=algo,
+                k=k,
+                ranked_ids=[self.catalog.ids[i] for i in idx],
+                scores=None if scores is None else scores.tolist(),
+            )
+
+    def cache_key(self, query_id: str, algo: str, seed: Optional[int] = None, mode: str = "exact", nprobe: Optional[int] = None) -> tuple:
+        """
+        result_cache key of a retrieve() call.
+        """
+        return (query_id, algo, seed, mode, nprobe, self._data_version())
+
+    def _data_version(self) -> tuple:
+        # changes whenever results may: catalog updates, swapped feature
+        # matrices, or a different set of tables / indexes
+        cat = self.catalog
+        return (
+            cat.version,
+            id(cat.X_lyrics), id(cat.X_audio), id(cat.X_video), id(cat.X_early), id(cat.compressed),
+            tuple(sorted(self.tables)), tuple(sorted((a, id(i)) for a, i in self.indexes.items())),
+        )
+
+    def _retrieve(self, query_id: str, qidx: int, k: int, algo: str, seed: Optional[int], mode: str, nprobe: Optional[int]) -> RetrievalResult:
+        n_dead = self._n_dead()
+        kk = k + n_dead            # room for tombstoned tracks, filtered below
+        table = self.tables.get(algo)
+        if table is not None and kk <= table.idx.shape[1]:
+            count("table_lookup")
+            with stage("table_lookup"):
+                idx = np.asarray(table.idx[qidx, :kk])
+                scores = None if table.scores is None else np.asarray(table.scores[qidx, :kk])
+                if len(idx) and idx[-1] < 0:      # padding of a list shorter than the table
+                    n = int(np.count_nonzero(idx >= 0))
+                    idx, scores = idx[:n], (None if scores is None else scores[:n])
+        elif mode == "approx" and algo in self.indexes:
+            count("ann_search")
+            with stage("ann_search"):
+                idx, scores = self.indexes[algo].search(self._index_matrix(algo), qidx, kk, nprobe)
+        else:
+            count("exact_search")
+            with stage("algorithm"):
+                res = self.algorithms[algo](self.catalog, qidx, kk, seed)
+            if not n_dead:
+                return res
+            idx = np.array([self.catalog.id_to_idx[t] for t in res.ranked_ids], dtype=np.int64)
+            scores = None if res.scores is None else np.asarray(res.scores)
+        if n_dead:
+            live = ~self.catalog.tombstones[idx]
+            count("tombstones_skipped", int(len(idx) - np.count_nonzero(live)))
+            idx, scores = idx[live][:k], (None if scores is None else scores[live][:k])
+        with stage("ids"):
+            return RetrievalResult(
+                query_id=query_id,
+                algo=algo,
+                k=k,
+                ranked_ids=[self.catalog.ids[i] for i in idx],
+                scores=None if scores is None else scores.tolist(),
+            )
+
+    def _n_dead(self) -> int:
+        t = self.catalog.tombstones
+        return 0 if t is None else int(np.count_nonzero(t))
+
+    def append_tracks(self, tracks, features) -> np.ndarray:
+        """
+        updates.append_tracks, plus the system's derived state: new rows are
+        bucketed into the existing ANN indexes and neighbour tables are dropped.
+        """
+        from ..updates import append_tracks
+        rows = append_tracks(self.catalog, tracks, features)
+        self._rows_changed(rows)
+        return rows
+
+    def update_tracks(self, tracks, features=None) -> np.ndarray:
+        from ..updates import update_tracks
+        rows = update_tracks(self.catalog, tracks, features)
+        self._rows_changed(rows)
+        return rows
+
+    def tombstone_tracks(self, ids) -> np.ndarray:
+        """
+        Tombstoned tracks are filtered out of every result (tables and indexes stay valid).
+        """
+        from ..updates import tombstone_tracks
+        rows = tombstone_tracks(self.catalog, ids)
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        return rows
+
+    def _rows_changed(self, rows: np.ndarray) -> None:
+        for algo, index in self.indexes.items():
+            index.reassign(self._index_matrix(algo), rows)
+        # any track's neighbours may have changed
+        self.tables.clear()
+        if self.result_cache is not None:
+            self.result_cache.clear()
+
+    def _index_matrix(self, algo: str) -> np.ndarray:
+        if algo not in ANN_MATRICES:
+            raise ValueError(f"no ANN index support for '{algo}' (supported: {sorted(ANN_MATRICES)})")
+        if algo == "early_fusion":
+            # the fused space of the registered algorithm's weights, with rows
+            # built per candidate from the modality blocks; a loaded X_early
+            # (equal weights) serves it directly
+            from .fusion_early import FusedRows, fusion_weights
+            cat = self.catalog
+            weights = fusion_weights(self.algorithms.get(algo))
+            if cat.X_early is not None and np.allclose(weights, 1 / 3):
+                return cat.X_early
+            if cat.X_lyrics is None or cat.X_audio is None or cat.X_video is None:
+                raise ValueError("X_lyrics, X_audio, X_video must be loaded to index 'early_fusion'")
+            return FusedRows(cat, weights)
+        X = getattr(self.catalog, ANN_MATRICES[algo])
+        if X is None:
+            raise ValueError(f"{ANN_MATRICES[algo]} must be loaded to index '{algo}'")
+        return X
+
+    def build_index(self, algo: str, **kwargs) -> IVFIndex:
+        """
+        Build an IVF index for `algo` (kwargs go to build_ivf) and register it.
+        """
+        self.indexes[algo] = build_ivf(self._index_matrix(algo), **kwargs)
+        return self.indexes[algo]
+
+    def save_indexes(self, index_dir: Path) -> None:
+        sha1 = ids_fingerprint(self.catalog.ids)
+        for algo, index in self.indexes.items():
+            save_ivf(index, index_dir / f"{algo}.ivf.npz", ids_sha1=sha1)
+
+    def load_indexes(self, index_dir: Path) -> List[str]:
+        """
+        Register every saved index found in `index_dir`; returns their algos.
+        """
+        sha1 = ids_fingerprint(self.catalog.ids)
+        loaded = []
+        for algo in ANN_MATRICES:
+            path = index_dir / f"{algo}.ivf.npz"
+            if path.exists():
+                self.indexes[algo] = load_ivf(path, ids_sha1=sha1)
+                loaded.append(algo)
+        return loaded
+
+    def index_recall(self, algo: str, k: int = 10, nprobe: Optional[int] = None, n_queries: int = 200) -> float:
+        """
+        recall@k of the approximate search for `algo` against exact search.
+        """
+        return recall_at_k(self.indexes[algo], self._index_matrix(algo), k, nprobe, n_queries)
+
+    def load_tables(self, table_dir: Path, reference: Optional["RetrievalSystem"] = None) -> List[str]:
+        """
+        Serve retrieve() from the neighbour tables in `table_dir` (see
+        retrieval.tables.build_table); returns the algos loaded. Tables built
+        from another catalog state or algorithm code are skipped; `reference`
+        is the system they are checked against (default this one, e.g. the
+        unsharded system behind a ShardedCatalog).
+        """
+        tables = load_tables(table_dir, reference or self, algos=self.algorithms)
+        self.tables.update(tables)
+        return list(tables)
+
+    def _rank_block(self, qidxs: np.ndarray, k: int, algo: str, seed: Optional[int]):
+        n_dead = self._n_dead()
+        if not n_dead:
+            return self._rank_block_all(qidxs, k, algo, seed)
+        # rank past the tombstoned tracks, then keep the first k live ones per row
+        idx, scores = self._rank_block_all(qidxs, k + n_dead, algo, seed)
+        keep = np.argsort(self.catalog.tombstones[idx], axis=1, kind="stable")[:, :k]
+        idx = np.take_along_axis(idx, keep, axis=1)
+        return idx, (None if scores is None else np.take_along_axis(scores, keep, axis=1))
+
+    def _rank_block_all(self, qidxs: np.ndarray, k: int, algo: str, seed: Optional[int]):
+        fn = self.batch_algorithms.get(algo)
+        if fn is not None:
+            with stage("algorithm_block"):
+                return fn(self.catalog, qidxs, k, seed)
+        # no batch implementation: fall back to one retrieve() per query
+        results = [self.algorithms[algo](self.catalog, int(q), k, seed) for q in qidxs]
+        idx = np.array([[self.catalog.id_to_idx[t] for t in r.ranked_ids] for r in results], dtype=np.int64)
+        scores = None
+        if results and all(r.scores is not None for r in results):
+            scores = np.array([r.scores for r in results], dtype=np.float32)
+        return idx.reshape(len(results), -1), scores
+
+    def rank_batch(
+        self,
+        qidxs: Sequence[int],
+        k: int,
+        algo: str,
+        seed: Optional[int] = None,
+        block_size: Optional[int] = None,
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Top-k catalog indices (and scores, if the algorithm has them) for many
+        query indices, computed `block_size` queries at a time.
+        """
+        if self.instrumentation is None:
+            return self._rank_batch(qidxs, k, algo, seed, block_size)
+        return self.instrumentation.run(algo, "rank_batch", self._rank_batch, qidxs, k, algo, seed, block_size)
+
+    def _rank_batch(self, qidxs, k: int, algo: str, seed: Optional[int], block_size: Optional[int]):
+        qidxs = np.asarray(qidxs, dtype=np.int64)
+        count("batch_queries", len(qidxs))
+        bs = block_size or self.block_size
+        idx_blocks, score_blocks = [], []
+        for start in range(0, len(qidxs), bs):
+            idx, scores = self._rank_block(qidxs[start:start + bs], k, algo, seed)
+            idx_blocks.append(idx)
+            score_blocks.append(scores)
+
+        if not idx_blocks:
+            return np.empty((0, k), dtype=np.int64), None
+        idx = np.concatenate(idx_blocks)
+        scores = None if any(s is None for s in score_blocks) else np.concatenate(score_blocks)
+        return idx, scores
+
+    def retrieve_batch(
+        self,
+        query_ids: Sequence[str],
+        k: int,
+        algo: str,
+        seed: Optional[int] = None,
+        block_size: Optional[int] = None,
+    ) -> List[RetrievalResult]:
+        qidxs = [self.catalog.id_to_idx[qid] for qid in query_ids]
+        idx, scores = self.rank_batch(qidxs, k, algo, seed, block_size)
+        ids = self.catalog.ids
+        return [
+            RetrievalResult(
+                query_id=qid,
+                algo=algo,
+                k=k,
+                ranked_ids=[ids[i] for i in idx[r]],
+                scores=None if scores is None else scores[r].tolist(),
+            )
+            for r, qid in enumerate(query_ids)
+        ]
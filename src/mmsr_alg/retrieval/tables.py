@@ -0,0 +1,98 @@
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import json
+import re
+import numpy as np
+
+from ..eval.lists_store import RankingWriter, Rankings, load_rankings, write_id_manifest
+from ..feature_store import write_atomic
+
+# algorithms whose lists depend on the seed rather than on the catalog
+UNTABLED = ("random",)
+
+_TABLE_FILE = re.compile(r"^(?P<algo>.+)_top(?P<k>\d+)\.idx\.npy$")
+
+def _fingerprint_path(table_dir: Path, algo: str, K: int) -> Path:
+    return table_dir / f"{algo}_top{K}.fingerprint.json"
+
+def table_fingerprint(system, algo: str, K: int) -> Dict[str, str]:
+    """
+    What a table's lists depend on: the catalog and algorithm fingerprints
+    of eval.checkpoint, as used for evaluation checkpoints.
+    """
+    from ..eval.checkpoint import algo_fingerprint, catalog_fingerprint
+    return {
+        "catalog": catalog_fingerprint(system.catalog),
+        "algo": algo_fingerprint(system, algo, K, None),
+    }
+
+def build_table(system, algo: str, K: int, table_dir: Path, pool=None) -> None:
+    """
+    Precompute the top-K neighbours of every catalog track for `algo` and
+    write them to `table_dir` in the lists_store format (N x K int32 indices,
+    float32 scores), with a <algo>_top<K>.fingerprint.json (table_fingerprint)
+    that load_tables checks. With a SharedCatalogPool, blocks are ranked in
+    parallel.
+    """
+    cat = system.catalog
+    qidxs = np.arange(len(cat.ids), dtype=np.int64)
+    write_id_manifest(table_dir, cat.ids)
+    if pool is not None:
+        blocks = pool.rank_iter(algo, qidxs, K)
+    else:
+        bs = system.block_size
+        blocks = (system.rank_batch(qidxs[s:s + bs], K, algo) for s in range(0, len(qidxs), bs))
+
+    writer = None
+    for idx, scores in blocks:
+        if writer is None:
+            writer = RankingWriter(table_dir, algo, qidxs, K, with_scores=scores is not None)
+        writer.write(idx, scores)
+    if writer is not None:
+        writer.close()
+
+    fingerprint = table_fingerprint(system, algo, K)
+    def write(tmp: Path):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(fingerprint, f, indent=2)
+    write_atomic(_fingerprint_path(table_dir, algo, K), write)
+
+def table_files(table_dir: Path) -> Dict[str, int]:
+    """
+    algo -> largest K with a table in `table_dir`.
+    """
+    found: Dict[str, int] = {}
+    if not table_dir.is_dir():
+        return found
+    for path in table_dir.iterdir():
+        m = _TABLE_FILE.match(path.name)
+        if m:
+            found[m["algo"]] = max(found.get(m["algo"], 0), int(m["k"]))
+    return found
+
+def load_tables(table_dir: Path, system, algos: Optional[Iterable[str]] = None) -> Dict[str, Rankings]:
+    """
+    Memory-map the neighbour tables in `table_dir` (the largest K per algorithm).
+    Raises ValueError if they were built for a different catalog id order.
+    Tables whose fingerprint (or a missing one) does not match `system`'s
+    catalog and algorithm are skipped, like stale evaluation checkpoints.
+    """
+    ids = system.catalog.ids
+    wanted = None if algos is None else set(algos)
+    tables = {}
+    for algo, K in sorted(table_files(table_dir).items()):
+        if wanted is not None and algo not in wanted:
+            continue
+        table = load_rankings(table_dir, algo, K, ids=ids)
+        if len(table.query_idx) != len(ids):
+            raise ValueError(f"{algo} table in {table_dir} does not cover every track")
+        path = _fingerprint_path(table_dir, algo, K)
+        if not path.exists():
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            if json.load(f) != table_fingerprint(system, algo, K):
+                continue
+        tables[algo] = table
+    return tables
@@ -0,0 +1,93 @@
+
+from __future__ import annotations
+from typing import Optional, Tuple, Union
+import numpy as np
+
+Exclude = Optional[Union[int, np.ndarray]]
+
+def _select_1d(s: np.ndarray, n: int) -> np.ndarray:
+    """
+    Indices of the n best entries of `s` (unordered), O(N).
+    Among entries tied at the cut-off the lowest indices win.
+    """
+    N = s.shape[0]
+    if n >= N:
+        return np.arange(N)
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+    part = np.argpartition(s, N - n)[N - n:]
+    thr = s[part].min()
+    above = part[s[part] > thr]
+    if np.count_nonzero(s == thr) > n - above.size:
+        # argpartition picked an arbitrary subset of the boundary ties
+        ties = np.flatnonzero(s == thr)[: n - above.size]
+        part = np.concatenate([above, ties])
+    return part
+
+def _select_rows(S: np.ndarray, n: int) -> np.ndarray:
+    """
+    Row-wise _select_1d for a (B, N) block.
+    """
+    B, N = S.shape
+    if n >= N:
+        return np.broadcast_to(np.arange(N), (B, N)).copy()
+    if n <= 0:
+        return np.empty((B, 0), dtype=np.intp)
+    part = np.argpartition(S, N - n, axis=1)[:, N - n:]
+    vals = np.take_along_axis(S, part, axis=1)
+    thr = vals.min(axis=1, keepdims=True)
+    straddle = np.count_nonzero(S == thr, axis=1) > np.count_nonzero(vals == thr, axis=1)
+    for r in np.flatnonzero(straddle):
+        part[r] = _select_1d(S[r], n)
+    return part
+
+def _order(idx: np.ndarray, vals: np.ndarray) -> np.ndarray:
+    # descending score, ascending index on ties
+    return np.lexsort((idx, -vals), axis=-1)
+
+def topk(scores: np.ndarray, k: int, exclude: Exclude = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k of a score vector (N,) or a block of score rows (B, N).
+
+    Returns (indices, scores), sorted by descending score; ties are broken by
+    ascending catalog index, so results are reproducible. Runs an O(N)
+    argpartition selection and only sorts the k survivors.
+
+    `exclude` removes entries without touching `scores`:
+    - 1-D: an index or array of indices (e.g. the query itself)
+    - 2-D: one index per row (B,) or several per row (B, m)
+    """
+    if scores.ndim == 1:
+        return _topk_1d(scores, k, exclude)
+    return _topk_rows(scores, k, exclude)
+
+def _topk_1d(s: np.ndarray, k: int, exclude: Exclude) -> Tuple[np.ndarray, np.ndarray]:
+    excl = None if exclude is None else np.atleast_1d(np.asarray(exclude))
+    m = 0 if excl is None else excl.size
+    k = max(0, min(k, s.shape[0] - m))
+
+    idx = _select_1d(s, k + m)
+    idx = idx[_order(idx, s[idx])]
+    if m:
+        idx = idx[~np.isin(idx, excl)]
+    idx = idx[:k]
+    return idx, s[idx]
+
+def _topk_rows(S: np.ndarray, k: int, exclude: Exclude) -> Tuple[np.ndarray, np.ndarray]:
+    B, N = S.shape
+    excl = None
+    if exclude is not None:
+        excl = np.asarray(exclude).reshape(B, -1)
+    m = 0 if excl is None else excl.shape[1]
+    k = max(0, min(k, N - m))
+
+    idx = _select_rows(S, k + m)
+    idx = np.take_along_axis(idx, _order(idx, np.take_along_axis(S, idx, axis=1)), axis=1)
+    if m:
+        dropped = (idx[:, :, None] == excl[:, None, :]).any(axis=2)
+        # stable sort moves excluded entries to the back, keeping rank order
+        keep = np.argsort(dropped, axis=1, kind="stable")[:, :k]
+        idx = np.take_along_axis(idx, keep, axis=1)
+    else:
+        idx = idx[:, :k]
+    return idx, np.take_along_axis(S, idx, axis=1)
@@ -1,19 +1,39 @@
 from .system import RetrievalResult
-from .cosine import topk_cosine
+from .cosine import topk_cosine, topk_cosine_batch
+from .quantized import compressed, topk_rerank, topk_rerank_batch
+from ..instrumentation import stage
 
 def _cosine_algo(name: str, attr: str):
     def fn(catalog, qidx, k, seed=None):
         X = getattr(catalog, attr)
-        idx, scores = topk_cosine(qidx, X, k)
-        return RetrievalResult(
-            query_id=catalog.ids[qidx],
-            algo=name,
-            k=k,
-            ranked_ids=[catalog.ids[i] for i in idx],
-            scores=scores.tolist()
-        )
+        Xq = compressed(catalog, attr)
+        if Xq is not None:
+            idx, scores = topk_rerank(qidx, X, Xq, k)
+        else:
+            idx, scores = topk_cosine(qidx, X, k)
+        with stage("ids"):
+            return RetrievalResult(
+                query_id=catalog.ids[qidx],
+                algo=name,
+                k=k,
+                ranked_ids=[catalog.ids[i] for i in idx],
+                scores=scores.tolist()
+            )
+    return fn
+
+def _cosine_batch_algo(attr: str):
+    def fn(catalog, qidxs, k, seed=None):
+        X = getattr(catalog, attr)
+        Xq = compressed(catalog, attr)
+        if Xq is not None:
+            return topk_rerank_batch(qidxs, X, Xq, k)
+        return topk_cosine_batch(qidxs, X, k)
     return fn
 
 lyrics_algo = _cosine_algo("lyrics", "X_lyrics")
 audio_algo  = _cosine_algo("audio",  "X_audio")
 video_algo  = _cosine_algo("video",  "X_video")
+
+lyrics_batch_algo = _cosine_batch_algo("X_lyrics")
+audio_batch_algo  = _cosine_batch_algo("X_audio")
+video_batch_algo  = _cosine_batch_algo("X_video")
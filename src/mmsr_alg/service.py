@@ -0,0 +1,339 @@
+
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+import asyncio
+import json
+import math
+import time
+import numpy as np
+
+from .instrumentation import activate
+from .retrieval.system import RetrievalSystem
+from .retrieval.tables import UNTABLED
+from .utils import decorate_result
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error",
+}
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-query requests for the same (algo, seed)
+    arriving within `window_ms` (or until `max_batch` are waiting) into one
+    RetrievalSystem.rank_batch call, run on a small thread pool so the event
+    loop keeps accepting requests, and fans the rows back out.
+    """
+
+    def __init__(self, system: RetrievalSystem, window_ms: float = 2.0, max_batch: int = 64, threads: int = 2):
+        self.system = system
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self._pending: Dict[Tuple[str, Optional[int]], List[Tuple[int, int, asyncio.Future]]] = {}
+        self.queued = 0          # requests waiting for their batch to start
+        self.in_flight = 0       # batches being scored
+        self.batch_sizes: Deque[int] = deque(maxlen=10000)
+
+    async def rank(self, qidx: int, k: int, algo: str, seed: Optional[int]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        key = (algo, seed)
+        batch = self._pending.setdefault(key, [])
+        batch.append((qidx, k, fut))
+        self.queued += 1
+        if len(batch) >= self.max_batch:
+            self._flush(key, batch)
+        elif len(batch) == 1:
+            loop.call_later(self.window, self._flush, key, batch)
+        return await fut
+
+    def _flush(self, key, batch) -> None:
+        # a timer may fire after its batch was already flushed for being full
+        if self._pending.get(key) is not batch:
+            return
+        del self._pending[key]
+        self.queued -= len(batch)
+        self.batch_sizes.append(len(batch))
+        asyncio.ensure_future(self._run(key, batch))
+
+    async def _run(self, key, batch) -> None:
+        algo, seed = key
+        qidxs = np.array([q for q, _, _ in batch], dtype=np.int64)
+        K = max(k for _, k, _ in batch)
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            idx, scores = await loop.run_in_executor(self.executor, self.system.rank_batch, qidxs, K, algo, seed)
+        except Exception as e:
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            self.in_flight -= 1
+        for r, (_, k, fut) in enumerate(batch):
+            if not fut.done():
+                fut.set_result((idx[r, :k], None if scores is None else scores[r, :k]))
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+def _percentiles(values) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(np.fromiter(values, dtype=float), [50, 95, 99])
+    return {"count": len(values), "p50_ms": p50 * 1e3, "p95_ms": p95 * 1e3, "p99_ms": p99 * 1e3}
+
+def _clean(value):
+    # JSON has no NaN
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return [_clean(v) for v in value]
+    return value
+
+class RetrievalService:
+    """
+    JSON over HTTP/1.1 (keep-alive), standard library only:
+
+        GET  /retrieve?query_id=..&k=10&algo=late_fusion[&seed=..][&mode=approx&nprobe=..]
+        POST /retrieve_batch   {"query_ids": [...], "k": 10, "algo": "...", "seed": null}
+        GET  /tracks/<id>
+        GET  /stats            queue depth, batch sizes, latency percentiles
+        GET  /metrics          per-stage instrumentation, Prometheus text format
+    """
+
+    def __init__(
+        self,
+        system: RetrievalSystem,
+        window_ms: float = 2.0,
+        max_batch: int = 64,
+        threads: int = 2,
+        max_body: int = 1 << 20,
+    ):
+        self.system = system
+        self.batcher = MicroBatcher(system, window_ms, max_batch, threads)
+        # larger request bodies are refused with 413
+        self.max_body = max_body
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.started = time.time()
+
+    # ---- endpoints ----
+
+    def _result(self, query_id: str, algo: str, k: int, idx: np.ndarray, scores: Optional[np.ndarray]) -> Dict[str, Any]:
+        ids = self.system.catalog.ids
+        return {
+            "query_id": query_id,
+            "algo": algo,
+            "k": k,
+            "ranked_ids": [ids[i] for i in idx],
+            "scores": None if scores is None else scores.tolist(),
+        }
+
+    def _params(self, query_id, k, algo, seed) -> Tuple[int, int, str, Optional[int]]:
+        cat = self.system.catalog
+        if algo not in self.system.algorithms:
+            raise HTTPError(400, f"unknown algo {algo!r} (available: {sorted(self.system.algorithms)})")
+        try:
+            k = int(k)
+            seed = None if seed in (None, "") else int(seed)
+        except (TypeError, ValueError):
+            raise HTTPError(400, "k and seed must be integers")
+        if not 1 <= k < len(cat.ids):
+            raise HTTPError(400, f"k must be in [1, {len(cat.ids) - 1}]")
+        if query_id not in cat.id_to_idx:
+            raise HTTPError(404, f"unknown track id {query_id!r}")
+        return cat.id_to_idx[query_id], k, algo, seed
+
+    async def retrieve(self, query: Dict[str, str]) -> Dict[str, Any]:
+        query_id = query.get("query_id")
+        qidx, k, algo, seed = self._params(query_id, query.get("k", 10), query.get("algo", "late_fusion"), query.get("seed"))
+        mode = query.get("mode", "exact")
+        if mode not in ("exact", "approx"):
+            raise HTTPError(400, f"mode must be 'exact' or 'approx', got {mode!r}")
+        try:
+            nprobe = None if query.get("nprobe") in (None, "") else int(query["nprobe"])
+        except ValueError:
+            raise HTTPError(400, "nprobe must be an integer")
+
+        table = self.system.tables.get(algo)
+        if table is not None and k <= table.idx.shape[1]:
+            # precomputed neighbours: a lookup, nothing to batch
+            res = self.system.retrieve(query_id, k, algo, seed, mode, nprobe)
+            return {"query_id": res.query_id, "algo": algo, "k": k, "ranked_ids": res.ranked_ids, "scores": res.scores}
+        if mode == "approx" and algo in self.system.indexes:
+            # ANN search is per query; run it (and its cache lookup) off the loop
+            loop = asyncio.get_running_loop()
+            res = await loop.run_in_executor(self.batcher.executor, self.system.retrieve, query_id, k, algo, seed, mode, nprobe)
+            return {"query_id": res.query_id, "algo": algo, "k": k, "ranked_ids": res.ranked_ids, "scores": res.scores}
+
+        cache = self.system.result_cache
+        if cache is None or (seed is None and algo in UNTABLED):
+            idx, scores = await self.batcher.rank(qidx, k, algo, seed)
+            return self._result(query_id, algo, k, idx, scores)
+        # same entries as RetrievalSystem.retrieve: batched misses are cached
+        # at the cache's fetch length, so smaller k are served from it later
+        key = self.system.cache_key(query_id, algo, seed, mode, nprobe)
+        hit = cache.peek(key, k)
+        if hit is None:
+            K = min(max(k, cache.fetch_k), len(self.system.catalog.ids) - 1)
+            idx, scores = await self.batcher.rank(qidx, K, algo, seed)
+            idx, scores = cache.put(key, (idx, scores), complete=len(idx) < K)
+            hit = idx[:k], (None if scores is None else scores[:k])
+        return self._result(query_id, algo, k, *hit)
+
+    async def retrieve_batch(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        query_ids = body.get("query_ids")
+        if not isinstance(query_ids, list) or not query_ids:
+            raise HTTPError(400, "query_ids must be a non-empty list")
+        params = [self._params(q, body.get("k", 10), body.get("algo", "late_fusion"), body.get("seed")) for q in query_ids]
+        _, k, algo, seed = params[0]
+        qidxs = [p[0] for p in params]
+        loop = asyncio.get_running_loop()
+        idx, scores = await loop.run_in_executor(self.batcher.executor, self.system.rank_batch, qidxs, k, algo, seed)
+        return [self._result(q, algo, k, idx[r], None if scores is None else scores[r]) for r, q in enumerate(query_ids)]
+
+    def track(self, track_id: str) -> Dict[str, Any]:
+        if track_id not in self.system.catalog.id_to_idx:
+            raise HTTPError(404, f"unknown track id {track_id!r}")
+        with activate(self.system.instrumentation, "tracks"):
+            card = decorate_result(self.system.catalog, [track_id])[0]
+        return {key: _clean(sorted(v) if isinstance(v, set) else v) for key, v in card.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = self.batcher.batch_sizes
+        return {
+            "uptime_s": time.time() - self.started,
+            "queue_depth": self.batcher.queued,
+            "batches_in_flight": self.batcher.in_flight,
+            "batch_size": {
+                "count": len(sizes),
+                "mean": float(np.mean(sizes)) if sizes else 0.0,
+                "max": max(sizes) if sizes else 0,
+            },
+            "latency": {route: _percentiles(v) for route, v in self.latencies.items()},
+            "result_cache": None if self.system.result_cache is None else self.system.result_cache.stats(),
+            "instrumentation": None if self.system.instrumentation is None else self.system.instrumentation.snapshot(),
+        }
+
+    # ---- HTTP ----
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> Tuple[str, Any]:
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        path = url.path.rstrip("/") or "/"
+        if path == "/retrieve":
+            if method != "GET":
+                raise HTTPError(405, "use GET")
+            return path, await self.retrieve(query)
+        if path == "/retrieve_batch":
+            if method != "POST":
+                raise HTTPError(405, "use POST")
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                raise HTTPError(400, "body must be JSON")
+            return path, await self.retrieve_batch(payload)
+        if path.startswith("/tracks/"):
+            return "/tracks", self.track(unquote(path[len("/tracks/"):]))
+        if path == "/stats":
+            return path, self.stats()
+        if path == "/metrics":
+            if self.system.instrumentation is None:
+                raise HTTPError(404, "instrumentation is disabled")
+            return path, self.system.instrumentation.prometheus()
+        raise HTTPError(404, f"no route {path}")
+
+    async def _read_request(self, reader: asyncio.StreamReader, line: bytes):
+        # (method, target, version, headers, body); HTTPError if malformed
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise HTTPError(400, "malformed request line")
+        method, target, version = parts
+        headers = {}
+        while True:
+            try:
+                h = await reader.readline()
+            except ValueError:
+                raise HTTPError(400, "header line too long")
+            if h in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = h.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise HTTPError(400, "Content-Length must be an integer")
+        if length < 0:
+            raise HTTPError(400, "Content-Length must not be negative")
+        if length > self.max_body:
+            raise HTTPError(413, f"body exceeds {self.max_body} bytes")
+        body = await reader.readexactly(length)
+        return method, target, version, headers, body
+
+    @staticmethod
+    def _write(writer: asyncio.StreamWriter, status: int, payload: Any, keep: bool) -> None:
+        if isinstance(payload, str):
+            data, ctype = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            data, ctype = json.dumps(payload).encode("utf-8"), "application/json"
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            f"Content-Type: {ctype}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep else 'close'}\r\n\r\n".encode("latin-1") + data
+        )
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                t0 = time.perf_counter()
+                try:
+                    method, target, version, headers, body = await self._read_request(reader, line)
+                except HTTPError as e:
+                    # the rest of the stream cannot be trusted: answer and close
+                    self._write(writer, e.status, {"error": str(e)}, keep=False)
+                    await writer.drain()
+                    break
+
+                route = None
+                try:
+                    route, payload = await self._dispatch(method, target, body)
+                    status = 200
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+
+                keep = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                self._write(writer, status, payload, keep)
+                await writer.drain()
+                if route is not None:
+                    self.latencies.setdefault(route, deque(maxlen=10000)).append(time.perf_counter() - t0)
+                if not keep:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"serving on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.batcher.close()
@@ -0,0 +1,153 @@
+
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import json
+import numpy as np
+import pandas as pd
+
+from .feature_store import source_fingerprint, write_atomic
+from .genre_index import GenreIndex, build_genre_index, genre_index_from_csr
+
+SNAPSHOT_FILE = "catalog_snapshot.npz"
+SNAPSHOT_VERSION = 1
+
+@dataclass
+class CatalogSnapshot:
+    """
+    Columnar form of the merged track table, stored as one uncompressed .npz:
+
+    - columns:   string columns in table order, object arrays (NaN = missing)
+    - genre_vocab / genre_indptr / genre_codes: each track's genre list as
+                 listed in the TSV, CSR over the sorted vocabulary
+    - has_genres: False where the genres TSV had no row for the track
+    - popularity: float64 (NaN = missing), if the metadata TSV has it
+    - total_relevant: GenreIndex.total_relevant, so loading skips the pair count
+    """
+    column_order: List[str]
+    columns: Dict[str, np.ndarray]
+    genre_vocab: List[str]
+    genre_indptr: np.ndarray
+    genre_codes: np.ndarray
+    has_genres: np.ndarray
+    popularity: Optional[np.ndarray]
+    total_relevant: np.ndarray
+
+    def genre_lists(self) -> List[List[str]]:
+        names = np.array(self.genre_vocab, dtype=object)[self.genre_codes]
+        return [a.tolist() for a in np.split(names, self.genre_indptr[1:-1])] if len(self.has_genres) else []
+
+    def genre_index(self) -> GenreIndex:
+        # sorted, de-duplicated codes per track
+        V = max(len(self.genre_vocab), 1)
+        rows = np.repeat(np.arange(len(self.has_genres)), np.diff(self.genre_indptr))
+        pairs = np.unique(rows * V + self.genre_codes)
+        indptr = np.zeros(len(self.has_genres) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(pairs // V, minlength=len(self.has_genres)))
+        return genre_index_from_csr(self.genre_vocab, indptr, (pairs % V).astype(np.int32), self.total_relevant)
+
+    def frame(self, genre_lists: Optional[List[List[str]]] = None) -> pd.DataFrame:
+        data = {}
+        for col in self.column_order:
+            if col == "genre_list":
+                lists = genre_lists if genre_lists is not None else self.genre_lists()
+                data[col] = [g if has else np.nan for g, has in zip(lists, self.has_genres)]
+            elif col == "popularity":
+                data[col] = self.popularity
+            else:
+                data[col] = self.columns[col]
+        return pd.DataFrame(data, columns=self.column_order)
+
+def _pack_strings(values) -> tuple:
+    null = np.array([not isinstance(v, str) for v in values], dtype=bool)
+    blob = "\x00".join(v if isinstance(v, str) else "" for v in values).encode("utf-8")
+    return np.frombuffer(blob, dtype=np.uint8), null
+
+def _unpack_strings(blob: np.ndarray, null: np.ndarray) -> np.ndarray:
+    if len(null) == 0:
+        return np.empty(0, dtype=object)
+    values = np.array(blob.tobytes().decode("utf-8").split("\x00"), dtype=object)
+    values[null] = np.nan
+    return values
+
+def snapshot_from_frame(tracks: pd.DataFrame) -> CatalogSnapshot:
+    """
+    Snapshot of the merged track table built by io.load_catalog.
+    """
+    raw = [g if isinstance(g, list) else None for g in tracks["genre_list"]] if "genre_list" in tracks else [None] * len(tracks)
+    lists = [g or [] for g in raw]
+    vocab = sorted({g for gl in lists for g in gl})
+    code_of = {g: i for i, g in enumerate(vocab)}
+    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(gl) for gl in lists])
+    codes = np.fromiter((code_of[g] for gl in lists for g in gl), dtype=np.int32, count=int(indptr[-1]))
+
+    order = list(tracks.columns)
+    columns = {c: tracks[c].to_numpy(dtype=object) for c in order if c not in ("genre_list", "popularity")}
+    popularity = tracks["popularity"].to_numpy(dtype=float) if "popularity" in tracks else None
+    return CatalogSnapshot(
+        column_order=order,
+        columns=columns,
+        genre_vocab=vocab,
+        genre_indptr=indptr,
+        genre_codes=codes,
+        has_genres=np.array([g is not None for g in raw], dtype=bool),
+        popularity=popularity,
+        total_relevant=build_genre_index(lists).total_relevant,
+    )
+
+def write_snapshot(path: Path, snap: CatalogSnapshot, sources: Sequence[Path]) -> None:
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "column_order": snap.column_order,
+        "sources": [source_fingerprint(p) for p in sources],
+    }
+    arrays = {
+        "meta": np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+        "genre_indptr": snap.genre_indptr,
+        "genre_codes": snap.genre_codes,
+        "has_genres": snap.has_genres,
+        "total_relevant": snap.total_relevant,
+    }
+    arrays["genre_vocab"], arrays["genre_vocab_null"] = _pack_strings(snap.genre_vocab)
+    for i, col in enumerate(snap.columns):
+        arrays[f"str{i}"], arrays[f"null{i}"] = _pack_strings(snap.columns[col])
+    if snap.popularity is not None:
+        arrays["popularity"] = snap.popularity
+
+    def write(tmp: Path):
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+    write_atomic(path, write)
+
+def read_snapshot(path: Path, sources: Sequence[Path]) -> Optional[CatalogSnapshot]:
+    """
+    The snapshot at `path`, or None if it is missing, from another format
+    version, or older than any of the source TSVs that exist on this host.
+    """
+    if not path.exists():
+        return None
+    with np.load(path, allow_pickle=False) as z:
+        meta = json.loads(z["meta"].tobytes().decode("utf-8"))
+        if meta.get("version") != SNAPSHOT_VERSION or len(meta["sources"]) != len(sources):
+            return None
+        for old, src in zip(meta["sources"], sources):
+            new = source_fingerprint(src)
+            if new is not None and new != old:
+                return None
+
+        has_genres = z["has_genres"]
+        order = meta["column_order"]
+        string_cols = [c for c in order if c not in ("genre_list", "popularity")]
+        columns = {c: _unpack_strings(z[f"str{i}"], z[f"null{i}"]) for i, c in enumerate(string_cols)}
+        return CatalogSnapshot(
+            column_order=order,
+            columns=columns,
+            genre_vocab=_unpack_strings(z["genre_vocab"], z["genre_vocab_null"]).tolist(),
+            genre_indptr=z["genre_indptr"],
+            genre_codes=z["genre_codes"],
+            has_genres=has_genres,
+            popularity=z["popularity"] if "popularity" in z.files else None,
+            total_relevant=z["total_relevant"],
+        )
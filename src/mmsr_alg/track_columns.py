@@ -0,0 +1,87 @@
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import numpy as np
+
+from .buffers import grow_rows
+from .catalog import Catalog
+from .genre_index import GenreIndex
+
+# decorate_result fields, in output order; "id" and "genres" are added around them
+TEXT_COLUMNS = ("artist", "song", "album_name", "url")
+
+@dataclass
+class TrackColumns:
+    """
+    Columnar view of the track metadata for decorating results by index:
+    `ids` and `text` are object arrays aligned with catalog indices (missing
+    values as in catalog.tracks, None for absent columns). Genres come from
+    the catalog's GenreIndex CSR.
+    """
+    ids: np.ndarray
+    text: Dict[str, np.ndarray]
+    # GenreIndex.vocab as an object array, and the list it was built from
+    _vocab: Optional[np.ndarray] = None
+    _vocab_of: Optional[list] = None
+    # over-allocated buffers the arrays above are views of (buffers.grow_rows)
+    _buffers: Dict[str, np.ndarray] = field(default_factory=dict, repr=False)
+
+    def set_rows(self, catalog: Catalog, rows: np.ndarray) -> None:
+        """
+        Re-read tracks `rows` from catalog.tracks after an update; indices past
+        the end append (amortized, through growth buffers).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        n = len(catalog.ids)
+        self.ids = grow_rows(self._buffers, "ids", self.ids, n)
+        self.ids[rows] = [catalog.ids[r] for r in rows]
+        for name in TEXT_COLUMNS:
+            col = grow_rows(self._buffers, name, self.text[name], n)
+            col[rows] = catalog.tracks[name].iloc[rows].to_numpy(dtype=object) if name in catalog.tracks.columns else None
+            self.text[name] = col
+
+    def genre_lists(self, gi: GenreIndex, idx: np.ndarray) -> List[List[str]]:
+        """
+        Sorted genre names of each track in `idx`, with one gather.
+        """
+        if self._vocab_of is not gi.vocab:
+            self._vocab, self._vocab_of = np.array(gi.vocab, dtype=object), gi.vocab
+        lo, hi = gi.indptr[idx], gi.indptr[idx + 1]
+        lens = hi - lo
+        ends = np.cumsum(lens)
+        # positions of every selected track's codes, back to back
+        pos = np.arange(int(ends[-1]) if len(ends) else 0) - np.repeat(ends - lens - lo, lens)
+        names = self._vocab[gi.codes[pos]].tolist()
+        bounds = [0] + ends.tolist()
+        return [names[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def gather(self, idx: np.ndarray, gi: Optional[GenreIndex]) -> Dict[str, list]:
+        """
+        Column lists (id, artist, song, album_name, url, genres) for tracks
+        `idx`; genres is None without a genre index.
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        cols = {"id": self.ids[idx].tolist()}
+        for name, values in self.text.items():
+            cols[name] = values[idx].tolist()
+        cols["genres"] = None if gi is None else self.genre_lists(gi, idx)
+        return cols
+
+def build_track_columns(catalog: Catalog) -> TrackColumns:
+    tracks = catalog.tracks
+    N = len(catalog.ids)
+    text = {
+        name: tracks[name].to_numpy(dtype=object) if name in tracks.columns else np.full(N, None, dtype=object)
+        for name in TEXT_COLUMNS
+    }
+    return TrackColumns(ids=np.array(catalog.ids, dtype=object), text=text)
+
+def track_columns_for(catalog: Catalog) -> TrackColumns:
+    """
+    catalog.columns, built from catalog.tracks on first use and kept in
+    step by catalog updates.
+    """
+    if catalog.columns is None:
+        catalog.columns = build_track_columns(catalog)
+    return catalog.columns
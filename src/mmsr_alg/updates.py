@@ -0,0 +1,147 @@
+
+from __future__ import annotations
+from typing import Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+
+from .catalog import Catalog
+from .buffers import grow_rows
+from .features import l2_normalize
+
+FEATURE_MATRICES = ("X_lyrics", "X_audio", "X_video")
+
+def _rows_view(catalog: Catalog, key: str, X: np.ndarray, n: int) -> np.ndarray:
+    # X's first `n` rows in one of catalog.buffers (buffers.grow_rows)
+    if catalog.buffers is None:
+        catalog.buffers = {}
+    return grow_rows(catalog.buffers, key, X, n)
+
+def _set_features(catalog: Catalog, rows: np.ndarray, n: int, features: Dict[str, np.ndarray]) -> None:
+    unknown = set(features) - {a for a in FEATURE_MATRICES if getattr(catalog, a) is not None}
+    if unknown:
+        raise ValueError(f"catalog has no {sorted(unknown)} loaded")
+
+    for attr in FEATURE_MATRICES:
+        X = getattr(catalog, attr)
+        if X is None or (attr not in features and n == X.shape[0]):
+            continue
+        n_old = X.shape[0]
+        X = _rows_view(catalog, attr, X, n)
+        X[n_old:] = 0                      # appended tracks without this modality
+        if attr in features:
+            X[rows] = l2_normalize(np.asarray(features[attr], dtype=np.float32))
+        setattr(catalog, attr, X)
+
+    if catalog.X_early is not None:
+        # the fused matrix materialized for ANN indexing uses equal weights
+        from .retrieval.fusion_early import build_early_fusion_matrix
+        X = _rows_view(catalog, "X_early", catalog.X_early, n)
+        X[rows] = build_early_fusion_matrix(catalog.X_lyrics[rows], catalog.X_audio[rows], catalog.X_video[rows], (1/3, 1/3, 1/3))
+        catalog.X_early = X
+
+    for attr, sq in (catalog.row_sqnorms or {}).items():
+        if len(sq) < n:
+            n_old = len(sq)
+            sq = _rows_view(catalog, f"row_sqnorms:{attr}", sq, n)
+            sq[n_old:] = 0
+        X = getattr(catalog, attr)
+        sq[rows] = np.einsum("ij,ij->i", X[rows], X[rows])
+        catalog.row_sqnorms[attr] = sq
+
+    for attr, Xq in (catalog.compressed or {}).items():
+        Xq.data = _rows_view(catalog, f"compressed:{attr}", Xq.data, n)
+        Xq.data[rows] = Xq.encode(getattr(catalog, attr)[rows])
+
+def _genre_lists(tracks: pd.DataFrame):
+    if "genre_list" not in tracks.columns:
+        return None
+    return [list(g) if isinstance(g, (list, set, tuple)) else [] for g in tracks["genre_list"]]
+
+def _popularity(tracks: pd.DataFrame) -> np.ndarray:
+    if "popularity" not in tracks.columns:
+        return np.full(len(tracks), np.nan)
+    return pd.to_numeric(tracks["popularity"], errors="coerce").to_numpy(dtype=float)
+
+def _finish(catalog: Catalog, rows: np.ndarray) -> None:
+    if catalog.genre_index is not None:
+        dead = catalog.tombstones[rows] if catalog.tombstones is not None else np.zeros(len(rows), dtype=bool)
+        lists = [[] if d or catalog.genres is None else catalog.genres[r] for r, d in zip(rows, dead)]
+        catalog.genre_index.set_rows(rows, lists)
+    if catalog.columns is not None:
+        catalog.columns.set_rows(catalog, rows)
+    catalog.version += 1
+
+def append_tracks(catalog: Catalog, tracks: pd.DataFrame, features: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Append new tracks: `tracks` has an "id" column plus any metadata columns
+    of catalog.tracks ("genre_list", "popularity", ...); `features` maps a
+    loaded matrix attribute to the tracks' raw feature rows (L2-normalized
+    here). Loaded matrices without rows get zero rows. Returns the new indices.
+    """
+    ids = tracks["id"].astype(str).tolist()
+    clash = [tid for tid in ids if tid in catalog.id_to_idx]
+    if clash or len(set(ids)) != len(ids):
+        raise ValueError(f"track ids already in the catalog or repeated: {clash[:5]}")
+
+    n_old = len(catalog.ids)
+    n = n_old + len(ids)
+    rows = np.arange(n_old, n, dtype=np.int64)
+    _set_features(catalog, rows, n, features)
+
+    catalog.ids.extend(ids)
+    catalog.id_to_idx.update(zip(ids, rows.tolist()))
+    new = tracks.assign(id=ids).reset_index(drop=True)
+    catalog.tracks = pd.concat([catalog.tracks, new], ignore_index=True)
+    if catalog.genres is not None:
+        catalog.genres.extend(set(g) for g in (_genre_lists(tracks) or [[]] * len(ids)))
+    if catalog.popularity is not None:
+        catalog.popularity = _rows_view(catalog, "popularity", catalog.popularity, n)
+        catalog.popularity[rows] = _popularity(tracks)
+    if catalog.tombstones is not None:
+        catalog.tombstones = _rows_view(catalog, "tombstones", catalog.tombstones, n)
+        catalog.tombstones[rows] = False
+
+    _finish(catalog, rows)
+    return rows
+
+def update_tracks(catalog: Catalog, tracks: pd.DataFrame, features: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+    """
+    Overwrite existing tracks: only the columns present in `tracks` and the
+    matrices in `features` change. Updating a tombstoned track restores it.
+    Returns the tracks' indices.
+    """
+    ids = tracks["id"].astype(str).tolist()
+    rows = np.array([catalog.id_to_idx[tid] for tid in ids], dtype=np.int64)
+    _set_features(catalog, rows, len(catalog.ids), features or {})
+
+    for col in tracks.columns.drop("id"):
+        if col not in catalog.tracks.columns:
+            catalog.tracks[col] = None
+        for r, value in zip(rows, tracks[col]):
+            catalog.tracks.at[r, col] = value
+    genre_lists = _genre_lists(tracks)
+    if catalog.genres is not None and genre_lists is not None:
+        for r, g in zip(rows, genre_lists):
+            catalog.genres[r] = set(g)
+    if catalog.popularity is not None and "popularity" in tracks.columns:
+        if not catalog.popularity.flags.writeable:      # a read-only view of `tracks`
+            catalog.popularity = _rows_view(catalog, "popularity", catalog.popularity, len(catalog.ids))
+        catalog.popularity[rows] = _popularity(tracks)
+    if catalog.tombstones is not None:
+        catalog.tombstones[rows] = False
+
+    _finish(catalog, rows)
+    return rows
+
+def tombstone_tracks(catalog: Catalog, ids: Iterable[str]) -> np.ndarray:
+    """
+    Mark tracks as removed without moving any index: they are filtered from
+    retrieval results and no longer count as relevant. Their rows stay in
+    place until the next full load_catalog.
+    """
+    rows = np.array([catalog.id_to_idx[tid] for tid in ids], dtype=np.int64)
+    if catalog.tombstones is None:
+        catalog.tombstones = np.zeros(len(catalog.ids), dtype=bool)
+    catalog.tombstones[rows] = True
+    _finish(catalog, rows)
+    return rows
@@ -1,21 +1,51 @@
 
 from __future__ import annotations
-from typing import Any, Dict, List
-import pandas as pd
+from typing import Any, Dict, List, Sequence, Union
+import numpy as np
 from .catalog import Catalog
+from .genre_index import genre_index_for
+from .instrumentation import stage
+from .track_columns import track_columns_for
 
 def get_track_row(catalog: Catalog, tid: str) -> Dict[str, Any]:
-    # fast lookup by idx -> row
-    idx = catalog.id_to_idx[tid]
-    row = catalog.tracks.iloc[idx]
-    return {
-        "id": tid,
-        "artist": row.get("artist", None),
-        "song": row.get("song", None),
-        "album_name": row.get("album_name", None),
-        "url": row.get("url", None),
-        "genres": list(catalog.genres[idx]) if catalog.genres is not None else None,
-    }
+    return decorate_result(catalog, [tid])[0]
 
-def decorate_result(catalog: Catalog, ranked_ids: List[str]) -> List[Dict[str, Any]]:
-    return [get_track_row(catalog, tid) for tid in ranked_ids]
+def _rows(cols: Dict[str, list]) -> List[Dict[str, Any]]:
+    keys = list(cols)
+    n = len(cols["id"])
+    values = [cols[key] if cols[key] is not None else [None] * n for key in keys]
+    return [dict(zip(keys, vals)) for vals in zip(*values)]
+
+def decorate_result(
+    catalog: Catalog,
+    ranked_ids: Union[Sequence[str], np.ndarray],
+    columns: bool = False,
+) -> Union[List[Dict[str, Any]], Dict[str, list], list]:
+    """
+    Track metadata (id, artist, song, album_name, url, genres) for a result.
+
+    ranked_ids: track ids, or catalog indices as an integer array, (k,) for
+    one list or (B, k) for a batch (e.g. from rank_batch). One list of
+    per-track dicts, or with columns=True one dict of column lists; a batch
+    gives one per row. Genres are sorted.
+    """
+    with stage("decorate"):
+        cols = track_columns_for(catalog)
+        gi = genre_index_for(catalog) if catalog.genres is not None else None
+        if isinstance(ranked_ids, np.ndarray) and ranked_ids.dtype.kind in "iu":
+            idx = ranked_ids.astype(np.int64, copy=False)
+        else:
+            idx = np.fromiter((catalog.id_to_idx[t] for t in ranked_ids), dtype=np.int64, count=len(ranked_ids))
+
+        if idx.ndim == 1:
+            out = cols.gather(idx, gi)
+            return out if columns else _rows(out)
+
+        # one gather for the whole batch, then split into rows
+        B, k = idx.shape
+        flat = cols.gather(idx.ravel(), gi)
+        per_row = [
+            {name: (None if vals is None else vals[i * k:(i + 1) * k]) for name, vals in flat.items()}
+            for i in range(B)
+        ]
+        return per_row if columns else [_rows(c) for c in per_row]
@@ -1,17 +1,17 @@
 import streamlit as st
 import streamlit.components.v1 as components
-from loader import load_data, load_genres
-from feature_utils import load_and_normalize_split 
+from loader import load_genres
 
 # --- app startup ---
 from pathlib import Path
 from mmsr_alg.io import load_catalog
-from mmsr_alg.features import load_feature_matrix, l2_normalize
+from mmsr_alg.feature_store import attach_features
 from mmsr_alg.retrieval.system import RetrievalSystem
-from mmsr_alg.retrieval.registry import ALGORITHMS
-from mmsr_alg.retrieval.fusion_early import build_early_fusion_matrix
+from mmsr_alg.retrieval.result_cache import ResultCache
+from mmsr_alg.retrieval.registry import ALGORITHMS, BATCH_ALGORITHMS
 from mmsr_alg.utils import decorate_result
 from mmsr_alg.eval.runner import evaluate_one_query
+from mmsr_alg.metadata_index import build_metadata_index
 
 HERE = Path(__file__).parent
 DATA = HERE/"data/retrieval"
@@ -20,43 +20,30 @@ DATA = HERE/"data/retrieval"
 def init_catalog_and_system():
     cat = load_catalog(DATA)
 
-    #cat.X_lyrics = l2_normalize(load_feature_matrix(DATA / "id_lyrics_bert_mmsr.tsv", cat.id_to_idx))
-    cat.X_lyrics = load_and_normalize_split([
-        DATA / "id_lyrics_bert_mmsr_part1.tsv",
-        DATA / "id_lyrics_bert_mmsr_part2.tsv"
-    ], cat.id_to_idx)
+    attach_features(cat, DATA)
 
-    cat.X_audio  = l2_normalize(load_feature_matrix(DATA / "id_mfcc_bow_mmsr.tsv", cat.id_to_idx))
-
-    #cat.X_video  = l2_normalize(load_feature_matrix(DATA / "id_vgg19_mmsr.tsv", cat.id_to_idx))
-    cat.X_video = load_and_normalize_split([
-        DATA / "id_vgg19_mmsr_part1.tsv",
-        DATA / "id_vgg19_mmsr_part2.tsv",
-        DATA / "id_vgg19_mmsr_part3.tsv",
-        DATA / "id_vgg19_mmsr_part4.tsv",
-        DATA / "id_vgg19_mmsr_part5.tsv"
-    ], cat.id_to_idx)
-
-    cat.X_early  = build_early_fusion_matrix(cat.X_lyrics, cat.X_audio, cat.X_video, (1/3, 1/3, 1/3))
-
-    retrieval_system = RetrievalSystem(cat, ALGORITHMS)
+    # shared by all sessions; moving the "Number of results" slider is a cache hit
+    retrieval_system = RetrievalSystem(cat, ALGORITHMS, result_cache=ResultCache(max_bytes=64 << 20))
+    # precomputed neighbours (scripts/build_tables.py), if present
+    retrieval_system.load_tables(DATA / "neighbours", reference=RetrievalSystem(cat, ALGORITHMS, BATCH_ALGORITHMS))
     return cat, retrieval_system
 
 cat, retrieval_system = init_catalog_and_system()
 
+@st.cache_resource
+def init_metadata_index():
+    # artist -> album -> track lookups for the selectors, built once
+    return build_metadata_index(cat.tracks)
+
+meta_index = init_metadata_index()
+
 
 # --- CSS Font Awesome ---
 st.markdown("""<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.0/css/all.min.css">""", unsafe_allow_html=True)
 
 # --- Load data ---
-df = load_data()
 genres_dict = load_genres()
 
-# --- Unique lists for dropdowns ---
-all_artists = sorted(df["artist"].dropna().unique().tolist())
-all_tracks = sorted(df["song"].dropna().unique().tolist())
-all_albums = sorted(df["album_name"].dropna().unique().tolist())
-
 # --- Page config ---
 st.set_page_config(page_title="MMSR – Music Retrieval System", layout="wide")
 st.markdown("<h1 style='text-align: center;'>MMSR – Music Retrieval System</h1>", unsafe_allow_html=True)
@@ -70,21 +57,21 @@ with st.container():
 
         # --- Dropdown artist/album/track ---
         query_artist = input_cols[0].selectbox(
-            "Artist (optional)", ["(none)"] + all_artists, key="artist_select"
+            "Artist (optional)", [None] + meta_index.artists, key="artist_select",
+            format_func=lambda a: "(none)" if a is None else a,
         )
 
         # Filtra albums in base all'artista
-        filtered_df_artist = df if query_artist == "(none)" else df[df["artist"] == query_artist]
-        available_albums = sorted(filtered_df_artist["album_name"].dropna().unique().tolist())
         query_album = input_cols[2].selectbox(
-            "Album (optional)", ["(none)"] + available_albums, key="album_select"
+            "Album (optional)", [None] + meta_index.albums_for(query_artist), key="album_select",
+            format_func=lambda a: "(none)" if a is None else a,
         )
 
-        # Filtra tracks in base ad artista+album
-        filtered_df_album = filtered_df_artist if query_album == "(none)" else filtered_df_artist[filtered_df_artist["album_name"] == query_album]
-        available_tracks = sorted(filtered_df_album["song"].dropna().unique().tolist())
-        query_track = input_cols[1].selectbox(
-            "Track", ["(none)"] + available_tracks, key="track_select"
+        # Filtra tracks in base ad artista+album; le opzioni sono id, quindi
+        # titoli uguali di artisti diversi restano distinti
+        query_id = input_cols[1].selectbox(
+            "Track", [None] + meta_index.tracks_for(query_artist, query_album), key="track_select",
+            format_func=lambda t: "(none)" if t is None else meta_index.label(t),
         )
 
         # --- Slider e algoritmi ---
@@ -94,7 +81,7 @@ with st.container():
         algorithms = row2[1].multiselect("Select retrieval algorithms", available_algorithms, default=["random"])
 
 # --- Run algorithms ---
-if query_track == "(none)":
+if query_id is None:
     st.warning("⚠️ Please select a track to run the retrieval.")
     st.stop()
     
@@ -103,10 +90,6 @@ if not algorithms:
     st.stop() 
 
 if algorithms:
-    matches = cat.tracks[cat.tracks["song"] == query_track]
-    
-    query_id = matches.iloc[0]["id"]
-    
     if query_id not in cat.id_to_idx:
         st.error("❌ Selected track not found in MMSR catalog.")
         st.stop()
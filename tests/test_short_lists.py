@@ -0,0 +1,47 @@
+
+from __future__ import annotations
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from mmsr_alg.catalog import Catalog
+from mmsr_alg.eval.batch_runner import evaluate_algorithms
+from mmsr_alg.eval.lists_store import load_rankings
+from mmsr_alg.features import l2_normalize
+from mmsr_alg.retrieval.registry import ALGORITHMS, BATCH_ALGORITHMS
+from mmsr_alg.retrieval.system import RetrievalSystem
+
+def _tiny_catalog(n: int = 12, seed: int = 0) -> Catalog:
+    rng = np.random.default_rng(seed)
+    ids = [f"t{i:02d}" for i in range(n)]
+    genres = [{"rock"} if i % 3 == 0 else {"pop"} for i in range(n)]
+    tracks = pd.DataFrame({"id": ids, "genre_list": [sorted(g) for g in genres]})
+    return Catalog(
+        tracks=tracks,
+        ids=ids,
+        id_to_idx={tid: i for i, tid in enumerate(ids)},
+        X_lyrics=l2_normalize(rng.standard_normal((n, 8)).astype(np.float32)),
+        X_audio=l2_normalize(rng.standard_normal((n, 6)).astype(np.float32)),
+        X_video=l2_normalize(rng.standard_normal((n, 4)).astype(np.float32)),
+        genres=genres,
+        popularity=rng.uniform(0, 100, n),
+    )
+
+def test_stored_lists_longer_than_catalog(tmp_path):
+    # k >= N: every list is shorter than maxK, and the stored files are padded with -1
+    cat = _tiny_catalog()
+    system = RetrievalSystem(cat, ALGORITHMS, BATCH_ALGORITHMS)
+    k_values = [5, 20]
+    stored = evaluate_algorithms(system, ["lyrics", "late_fusion"], k_values, cat.ids, tmp_path / "a", store_lists=True)
+    in_memory = evaluate_algorithms(system, ["lyrics", "late_fusion"], k_values, cat.ids, tmp_path / "b", store_lists=False)
+    pd.testing.assert_frame_equal(stored, in_memory)
+
+    lists = load_rankings(tmp_path / "a" / "retrieval_lists", "lyrics", max(k_values))
+    assert (np.asarray(lists.idx)[:, len(cat.ids) - 1:] == -1).all()
+    assert len(lists.ranked_ids(0)) == len(cat.ids) - 1
+    # no phantom hits: every relevant track is retrieved at most once per list
+    rows = stored[stored["k"] == 20]
+    assert (rows["recall"] <= 1.0).all() and (rows["coverage"] <= 1.0).all()